@@ -18,7 +18,7 @@ from renormalizer.mps.backend import np, xp
 from renormalizer.mps.matrix import asxp, asnumpy
 from renormalizer.mps import (
     Mpo, svd_qn, MpDm, ThermalProp, load_thermal_state)
-from renormalizer.mps.lib import update_cv
+from renormalizer.mps.lib import update_cv, PackedLayout
 from renormalizer.utils import (
     CompressConfig, EvolveConfig,
     CompressCriteria
@@ -196,19 +196,15 @@ class SpectraFtCV(SpectraCv):
         xqnmat, xqnbigl, xqnbigr, xshape = \
             self.construct_X_qnmat(add_list)
         dag_qnmat, dag_qnbigl, dag_qnbigr = self.swap(xqnmat, xqnbigl, xqnbigr)
-        nonzeros = int(np.sum(
-            self.condition(
-                dag_qnmat, [down_exciton, up_exciton])
-        ))
+        layout = PackedLayout(self.condition(dag_qnmat, [down_exciton, up_exciton]))
+        nonzeros = layout.size
 
         if self.method == "1site":
             guess = moveaxis(self.cv_mpo[isite - 1], (1, 2), (2, 1))
         else:
             guess = tensordot(moveaxis(self.cv_mpo[isite - 2], (1, 2), (2, 1)),
                               moveaxis(self.cv_mpo[isite - 1]), axes=(-1, 0))
-        guess = guess[
-            self.condition(
-                dag_qnmat, [down_exciton, up_exciton])]
+        guess = layout.pack(guess)
 
         if self.method == "1site":
             # define dot path
@@ -223,10 +219,10 @@ class SpectraFtCV(SpectraCv):
             path_3 = [([0, 1], "ab, acde -> bcde"),
                       ([1, 0], "bcde, ef -> bcdf")]
 
-            vecb = multi_tensor_contract(
+            vecb = layout.pack(multi_tensor_contract(
                 path_3, forth_L,
                 moveaxis(self.b_mpo[isite - 1], (1, 2), (2, 1)),
-                forth_R)[self.condition(dag_qnmat, [down_exciton, up_exciton])]
+                forth_R))
 
         a_oper_isite = asxp(self.a_oper[isite - 1])
         h_mpo_isite = asxp(self.h_mpo[isite - 1])
@@ -243,8 +239,7 @@ class SpectraFtCV(SpectraCv):
                    ([1, 0], "abe,f->abef")]
         pre_M1 = multi_tensor_contract(
             path_m1, M1_2, M1_3, M1_4)
-        pre_M1 = xp.moveaxis(pre_M1, [-2, -1], [-1, -2])[
-            self.condition(dag_qnmat, [down_exciton, up_exciton])]
+        pre_M1 = layout.pack(xp.moveaxis(pre_M1, [-2, -1], [-1, -2]))
 
         M2_1 = xp.einsum('aeag->aeg', second_L)
         M2_2 = xp.einsum('eccf->ecf', a_oper_isite)
@@ -255,8 +250,7 @@ class SpectraFtCV(SpectraCv):
                    ([1, 0], "abhcf,dfh->abcd")]
         pre_M2 = multi_tensor_contract(
             path_m2, M2_1, M2_3, M2_2, M2_4)
-        pre_M2 = pre_M2[
-            self.condition(dag_qnmat, [down_exciton, up_exciton])]
+        pre_M2 = layout.pack(pre_M2)
 
         M4_1 = xp.einsum('faah->fah', third_L)
         M4_4 = xp.einsum('gddi->gdi', third_R)
@@ -269,8 +263,7 @@ class SpectraFtCV(SpectraCv):
             h_mpo_isite, M4_4)
         pre_M4 = xp.einsum('abbd->abd', pre_M4)
         pre_M4 = xp.tensordot(pre_M4, M4_5, axes=0)
-        pre_M4 = xp.moveaxis(pre_M4, [2, 3], [3, 2])[
-            self.condition(dag_qnmat, [down_exciton, up_exciton])]
+        pre_M4 = layout.pack(xp.moveaxis(pre_M4, [2, 3], [3, 2]))
 
         M_x = lambda x: asnumpy(asxp(x) / (pre_M1 + 2 * pre_M2 + pre_M4 + xp.ones(nonzeros)*self.eta**2))
         pre_M = scipy.sparse.linalg.LinearOperator((nonzeros, nonzeros), M_x)
@@ -280,8 +273,7 @@ class SpectraFtCV(SpectraCv):
         def hop(x):
             nonlocal count
             count += 1
-            dag_struct = asxp(self.dag2mat(
-                xshape, x, dag_qnmat))
+            dag_struct = self.dag2mat(xshape, asxp(x), layout)
             if self.method == "1site":
 
                 M1 = multi_tensor_contract(
@@ -297,10 +289,7 @@ class SpectraFtCV(SpectraCv):
                     h_mpo_isite, third_R)
                 M3 = xp.moveaxis(M3, (1, 2), (2, 1))
                 cout = M1 + 2 * M2 + M3 + dag_struct * self.eta**2
-            cout = cout[
-                self.condition(dag_qnmat, [down_exciton, up_exciton])
-            ]
-            return asnumpy(cout)
+            return asnumpy(layout.pack(cout))
 
         # Matrix A
         mat_a = scipy.sparse.linalg.LinearOperator((nonzeros, nonzeros), matvec=hop)
@@ -316,7 +305,7 @@ class SpectraFtCV(SpectraCv):
                 f"cg not converged, vecb.norm:{xp.linalg.norm(vecb)}")
         l_value = xp.dot(asxp(hop(x)), asxp(x)) - 2 * xp.dot(vecb, asxp(x))
 
-        x = self.dag2mat(xshape, x, dag_qnmat)
+        x = self.dag2mat(xshape, x, layout)
         if self.method == "1site":
             x = np.moveaxis(x, [1, 2], [2, 1])
         x, xdim, xqn, compx = self.x_svd(
@@ -468,14 +457,8 @@ class SpectraFtCV(SpectraCv):
         lr = lr.reshape(shapel + shaper + [2])
         return lr
 
-    def dag2mat(self, xshape, x, dag_qnmat):
-        if self.spectratype == "abs":
-            up_exciton, down_exciton = 1, 0
-        else:
-            up_exciton, down_exciton = 0, 1
-        xdag = np.zeros(xshape, dtype=x.dtype)
-        mask = self.condition(dag_qnmat, [down_exciton, up_exciton])
-        np.place(xdag, mask, x)
+    def dag2mat(self, xshape, x, layout):
+        xdag = layout.unpack(x).reshape(xshape)
         shape = list(xdag.shape)
         if xdag.ndim == 3:
             if not self.cv_mpo.to_right:
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 # Author: Tong Jiang <tongjiang1000@gmail.com>
 # correction vector base
+import os
 import numpy as np
 from multiprocessing import Pool
 import multiprocessing
+from queue import Empty
 from renormalizer.mps import Mpo
 from renormalizer.utils import Quantity, CompressCriteria, CompressConfig
 from renormalizer.utils.elementop import construct_e_op_dict, ph_op_matrix
@@ -20,35 +22,98 @@ def batch_run(freq_reg, cores, obj, filename=None):
     freq_reg: list object, frequecny windown
     cores: number of cores to be used in multiprocessing calculation
     obj: SpectraZtCV or SpectraFtCV
+    filename: if not None, each converged point is appended to the text file
+        ``{filename}.txt`` as ``omega result`` as soon as it is available,
+        and the full spectra is saved to ``{filename}.npy`` at the end.
+
+    The frequencies are solved in ascending order so that the converged
+    correction vector of the previous frequency is the initial guess of the next one.
+    In multiprocessing calculation the sorted frequencies are split into ``cores``
+    contiguous windows, one for each worker. ``obj`` (including ``h_mpo`` and ``b_mps``)
+    is transferred to each worker only once when the pool is created,
+    and is shared with the workers through copy-on-write memory if the ``fork``
+    start method is used.
+    The returned spectra has the same order as ``freq_reg``.
     """
     logger.info(f"{len(freq_reg)} total frequency points to do")
-    spectra = []
+    spectra = [None] * len(freq_reg)
     obj.batch_run = True
 
-    if cores > 1:
-        # multiprocessing
-        if importlib.util.find_spec("cupy"):
-            multiprocessing.set_start_method('forkserver', force=True)
-        pool = Pool(processes=cores)
-        logger.info(f"{cores} multiprocess parallelization activated")
-        for i_spec in pool.imap(obj.cv_solve, freq_reg):
-            spectra.append(i_spec)
-            if filename is not None:
-                np.save(f"{filename}", spectra)
-        pool.close()
-        pool.join()
-    elif cores == 1:
-        # single process
-        for omega in freq_reg:
-            spectra.append(obj.cv_solve(omega))
-            if filename is not None:
-                np.save(f"{filename}", spectra)
+    # ascending order to warm start neighbouring frequencies
+    order = np.argsort(freq_reg, kind="stable").tolist()
+
+    if filename is not None:
+        stream_path = os.path.splitext(filename)[0] + ".txt"
+        stream = open(stream_path, "a")
     else:
-        assert False
+        stream = None
+
+    def collect(i, res):
+        spectra[i] = res
+        if stream is not None:
+            stream.write(f"{freq_reg[i]} {res}\n")
+            stream.flush()
+
+    try:
+        if cores > 1:
+            # multiprocessing
+            if importlib.util.find_spec("cupy"):
+                multiprocessing.set_start_method('forkserver', force=True)
+            windows = [w.tolist() for w in np.array_split(order, cores) if len(w) != 0]
+            queue = multiprocessing.Queue()
+            pool = Pool(processes=len(windows), initializer=_init_worker, initargs=(obj, queue))
+            logger.info(f"{cores} multiprocess parallelization activated")
+            async_res = pool.map_async(
+                _cv_solve_window, [[(i, freq_reg[i]) for i in w] for w in windows], chunksize=1
+            )
+            n_collected = 0
+            while n_collected != len(freq_reg):
+                try:
+                    item = queue.get(timeout=1)
+                except Empty:
+                    if async_res.ready():
+                        # raise if any of the worker fails
+                        async_res.get()
+                    continue
+                collect(*item)
+                n_collected += 1
+            async_res.get()
+            pool.close()
+            pool.join()
+        elif cores == 1:
+            # single process
+            for i in order:
+                collect(i, obj.cv_solve(freq_reg[i]))
+        else:
+            assert False
+    finally:
+        if stream is not None:
+            stream.close()
+
+    if filename is not None:
+        np.save(f"{filename}", spectra)
 
     return spectra
 
 
+# the cv object and the result queue of the worker process
+_worker_obj = None
+_worker_queue = None
+
+
+def _init_worker(obj, queue):
+    global _worker_obj, _worker_queue
+    _worker_obj = obj
+    _worker_queue = queue
+
+
+def _cv_solve_window(window):
+    # the correction vector of the previous frequency is kept in ``_worker_obj``
+    # as the initial guess of the next one
+    for i, omega in window:
+        _worker_queue.put((i, _worker_obj.cv_solve(omega)))
+
+
 class SpectraCv(object):
     def __init__(
         self,
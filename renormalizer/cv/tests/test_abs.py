@@ -46,3 +46,17 @@ def test_ft_abs(model):
                           10, 5.e-3, T, h_mpo, rtol=1e-3)
     result = batch_run(test_freq, 1, spectra)
     assert np.allclose(result, standard_value, rtol=1.e-2)
+
+
+def test_batch_run_order(tmp_path):
+    # unsorted frequencies are solved in ascending order and streamed to the file
+    test_freq = [0.08, 0.066, 0.09]
+    spectra = SpectraZtCV(holstein_model, "abs", 10, 5.e-4, rtol=1e-3)
+    filename = str(tmp_path / "spectra")
+    result = batch_run(test_freq, 2, spectra, filename=filename)
+    streamed = np.loadtxt(filename + ".txt")
+    assert np.allclose(sorted(streamed[:, 0]), sorted(test_freq))
+    for omega, value in streamed:
+        assert value == pytest.approx(result[test_freq.index(omega)])
+    assert np.allclose(np.load(filename + ".npy"), result)
+    assert result[1] < result[0] < result[2]
@@ -3,7 +3,7 @@
 # zero temperature absorption/emission spectrum based on DDMRG
 from renormalizer.cv.spectra_cv import SpectraCv
 from renormalizer.mps.backend import np, xp, USE_GPU
-from renormalizer.mps.lib import cvec2cmat
+from renormalizer.mps.lib import PackedLayout
 from renormalizer.mps import Mpo, Mps, gs
 from renormalizer.mps.svd_qn import get_qn_mask
 from renormalizer.mps.matrix import (
@@ -158,26 +158,27 @@ class SpectraZtCV(SpectraCv):
         qnbigl, qnbigr, qnmat = self.cv_mps._get_big_qn(cidx)
         qn_mask = get_qn_mask(qnmat, constrain_qn)
         del qnmat
-        xshape = qn_mask.shape
-        nonzeros = int(np.sum(qn_mask))
+        layout = PackedLayout(qn_mask)
+        xshape = layout.shape
+        nonzeros = layout.size
         if self.method == '1site':
-            guess = self.cv_mps[isite - 1][qn_mask]
+            guess = layout.pack(asxp(self.cv_mps[isite - 1]))
             path_b = [([0, 1], "ab, acd->bcd"),
                       ([1, 0], "bcd, de->bce")]
-            vec_b = multi_tensor_contract(
+            vec_b = layout.pack(multi_tensor_contract(
                 path_b, second_L, self.b_mps[isite - 1], second_R
-            )[qn_mask]
+            ))
         else:
-            guess = tensordot(
+            guess = layout.pack(asxp(tensordot(
                 self.cv_mps[isite - 2], self.cv_mps[isite - 1], axes=(-1, 0)
-            )[qn_mask]
+            )))
             path_b = [([0, 1], "ab, acd->bcd"),
                       ([2, 0], "bcd, def->bcef"),
                       ([1, 0], "bcef, fg->bceg")]
-            vec_b = multi_tensor_contract(
+            vec_b = layout.pack(multi_tensor_contract(
                 path_b, second_L, self.b_mps[isite - 2],
                 self.b_mps[isite - 1], second_R
-            )[qn_mask]
+            ))
 
         if self.method == "2site":
             a_oper_isite2 = asxp(self.a_oper[isite - 2])
@@ -200,8 +201,8 @@ class SpectraZtCV(SpectraCv):
             a_diag = multi_tensor_contract(path_pre, part_l, a_oper_isite1,
                                            a_oper_isite1)
             a_diag = xp.einsum("adfdg -> adfg", a_diag)
-            a_diag = xp.tensordot(a_diag, part_r,
-                                  axes=([2, 3], [1, 2]))[qn_mask]
+            a_diag = layout.pack(xp.tensordot(a_diag, part_r,
+                                              axes=([2, 3], [1, 2])))
         else:
             #  S-a   d     k   h-S
             #  O-b  -O- j -O-  f-O
@@ -222,8 +223,8 @@ class SpectraZtCV(SpectraCv):
                                             a_oper_isite1)
             a_diagr = xp.einsum("hjkmk -> khjm", a_diagr)
 
-            a_diag = xp.tensordot(
-                a_diagl, a_diagr, axes=([2, 3], [2, 3]))[qn_mask]
+            a_diag = layout.pack(xp.tensordot(
+                a_diagl, a_diagr, axes=([2, 3], [2, 3])))
 
         a_diag = asnumpy(a_diag + xp.ones(nonzeros) * self.eta**2)
         M_x = lambda x: x / a_diag
@@ -242,7 +243,7 @@ class SpectraZtCV(SpectraCv):
         def hop(c):
             nonlocal count
             count += 1
-            xstruct = asxp(cvec2cmat(c, qn_mask))
+            xstruct = layout.unpack(asxp(c))
             if self.method == "1site":
                 path_a = [([0, 1], "abcd, aef->bcdef"),
                           ([3, 0], "bcdef, begh->cdfgh"),
@@ -277,8 +278,7 @@ class SpectraZtCV(SpectraCv):
                 #                           a_oper_isite2, a_oper_isite1,
                 #                           a_oper_isite2, a_oper_isite1,
                 #                           first_R)
-            ax = ax1 + xstruct * self.eta**2
-            cout = ax[qn_mask]
+            cout = layout.pack(ax1) + layout.pack(xstruct) * self.eta**2
             return asnumpy(cout)
 
         mat_a = scipy.sparse.linalg.LinearOperator((nonzeros, nonzeros),
@@ -293,7 +293,7 @@ class SpectraZtCV(SpectraCv):
             logger.info(f"iteration solver not converged")
         # the value of the functional L
         l_value = xp.dot(asxp(hop(x)), asxp(x)) - 2 * xp.dot(vec_b, asxp(x))
-        xstruct = cvec2cmat(x, qn_mask)
+        xstruct = layout.unpack(x)
         self.cv_mps._update_mps(xstruct, cidx, qnbigl, qnbigr, percent)
         if self.cv_mps.compress_config.ofs is not None:
             raise NotImplementedError("OFS for correction vector not implemented")
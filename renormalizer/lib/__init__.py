@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # Author: Jiajun Ren <jiajunren0522@gmail.com>
 
-from renormalizer.lib.davidson.davidson import davidson
+from renormalizer.lib.davidson.davidson import davidson, davidson1
 from renormalizer.lib.integrate.integrate import solve_ivp
-from renormalizer.lib.krylov.krylov import expm_krylov
+from renormalizer.lib.krylov.krylov import expm_krylov, krylov_arena
 from renormalizer.lib.bipartite_matching.bipartite_matching import max_bipartite_matching, max_bipartite_matching2, bipartite_vertex_cover
@@ -2,6 +2,8 @@
 # adopted from https://github.com/cmendl/pytenet/blob/master/pytenet/krylov.py
 
 import logging
+import threading
+import weakref
 
 from scipy.linalg import eigh_tridiagonal
 import numpy as np
@@ -11,9 +13,78 @@ from renormalizer.mps.backend import xp
 
 logger = logging.getLogger(__name__)
 
+# tolerance of the error estimate for the sub-steps if ``tol`` is not set
+SUBSTEP_TOL = 1e-8
 
-def _expm_krylov(alpha, beta, V, v_norm, dt):
-    # diagonalize Hessenberg matrix (tridiagonal matrix for hermitian matrix A)
+
+class _ArenaBuffer:
+    __slots__ = ("buffer", "__weakref__")
+
+    def __init__(self):
+        self.buffer = None
+
+
+class KrylovArena:
+    """
+    Per-thread storage of the Krylov basis reused across calls of :func:`expm_krylov`.
+    Local problems of similar sizes are solved repeatedly in time evolution algorithms.
+
+    The buffer of a thread is freed when the thread exits or by :meth:`release`.
+
+    Parameters
+    ----------
+    limit : int
+        Buffers larger than this (in bytes) are not kept for the next call.
+        ``0`` disables the storage.
+    """
+
+    def __init__(self, limit: int = 2 ** 28):
+        self.limit = limit
+        self._local = threading.local()
+        # the buffers of the live threads
+        self._buffers = weakref.WeakSet()
+
+    def get(self, nrows, n, dtype, old_V=None, nkeep=0):
+        """
+        A ``(nrows, n)`` view of the buffer. The first ``nkeep`` rows of ``old_V`` are copied
+        if a new buffer is allocated.
+        """
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = self._local.holder = _ArenaBuffer()
+            self._buffers.add(holder)
+        buffer = holder.buffer
+        if buffer is None or buffer.dtype != dtype or len(buffer) < nrows * n:
+            size = nrows * n
+            if buffer is not None and buffer.dtype == dtype:
+                # grow geometrically
+                size = max(size, 2 * len(buffer))
+            buffer = xp.empty(size, dtype=dtype)
+            if old_V is not None and 0 < nkeep:
+                buffer[:nkeep * n].reshape(nkeep, n)[:] = old_V[:nkeep]
+            holder.buffer = buffer if buffer.nbytes <= self.limit else None
+        return buffer[:nrows * n].reshape(nrows, n)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The total size of the buffers of all threads.
+        """
+        return sum(h.buffer.nbytes for h in list(self._buffers) if h.buffer is not None)
+
+    def release(self):
+        """
+        Free the buffers of all threads. The buffers in use are freed after the calls return.
+        """
+        for holder in list(self._buffers):
+            holder.buffer = None
+
+
+krylov_arena = KrylovArena()
+
+
+def _expm_tridiag(alpha, beta, dt):
+    # exp(dt*T) e_0 for the tridiagonal matrix T (Hessenberg matrix for hermitian matrix A)
     try:
         w_hess, u_hess = eigh_tridiagonal(alpha, beta)
     except np.linalg.LinAlgError:
@@ -21,18 +92,53 @@ def _expm_krylov(alpha, beta, V, v_norm, dt):
         h = np.diag(alpha) + np.diag(beta, k=-1) + np.diag(beta, k=1)
         w_hess, u_hess = np.linalg.eigh(h)
 
-    return V @ xp.asarray(u_hess @ (v_norm * np.exp(dt*w_hess) * u_hess[0]))
+    return u_hess @ (np.exp(dt*w_hess) * u_hess[0])
 
 
-def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50):
+def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50, tol=None, max_dim=None):
     """
     Compute Krylov subspace approximation of the matrix exponential
     applied to input vector: `expm(dt*A)*v`.
     A is a hermitian matrix.
+
+    If ``tol`` is set, the Lanczos iteration stops when the a-posteriori error estimate
+    :math:`\\beta_m |(e^{dt T_m})_{m,0}|` relative to the norm of ``vstart`` is smaller than ``tol``,
+    where :math:`T_m` is the tridiagonal matrix and :math:`\\beta_m` is the last off-diagonal element.
+    Otherwise, the iteration stops when the results of two successive checks (every two iterations)
+    are close by ``xp.allclose``.
+    If ``max_dim`` is set and the subspace of dimension ``max_dim`` is not enough,
+    the time step is split into sub-steps and the Krylov subspace is restarted
+    from the result of each sub-step.
+
     Reference:
         M. Hochbruck and C. Lubich
         On Krylov subspace approximations to the matrix exponential operator
         SIAM J. Numer. Anal. 34, 1911 (1997)
+        Y. Saad
+        Analysis of some Krylov subspace approximations to the matrix exponential operator
+        SIAM J. Numer. Anal. 29, 209 (1992)
+
+    Parameters
+    ----------
+    Afunc : callable
+        The matrix-vector product.
+    dt : float or complex
+        The time step.
+    vstart : xp.ndarray
+        The vector.
+    block_size : int
+        The initial size of the Krylov basis buffer.
+    tol : float, optional
+        The tolerance of the relative error. Default is ``None``, which compares the successive results.
+    max_dim : int, optional
+        The maximum dimension of the Krylov subspace. Default is ``None``, which means no limit.
+
+    Returns
+    -------
+    res : xp.ndarray
+        The result vector.
+    n_matvec : int
+        Total number of calls to ``Afunc``.
     """
     if not np.iscomplex(dt):
         dt = dt.real
@@ -41,44 +147,71 @@ def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50):
     vstart = xp.asarray(vstart)
     nrmv = float(xp.linalg.norm(vstart))
     assert nrmv > 0
-    vstart = vstart / nrmv
-
-    alpha = np.zeros(block_size)
-    beta  = np.zeros(block_size - 1)
-
-    V = xp.empty((block_size, len(vstart)), dtype=vstart.dtype)
-    V[0] = vstart
-    res = None
-
-
-    for j in range(len(vstart)):
-        
-        w = Afunc(V[j])
-        alpha[j] = xp.vdot(w, V[j]).real
-
-        if j == len(vstart)-1:
-            #logger.debug("the krylov subspace is equal to the full space")
-            return _expm_krylov(alpha[:j+1], beta[:j], V[:j+1, :].T, nrmv, dt), j+1
-        
-        if len(V) == j+1:
-            V, old_V = xp.empty((len(V) + block_size, len(vstart)), dtype=vstart.dtype), V
-            V[:len(old_V)] = old_V
-            del old_V
-            alpha = np.concatenate([alpha, np.zeros(block_size)])
-            beta = np.concatenate([beta, np.zeros(block_size)])
-
-        w -= alpha[j]*V[j] + (beta[j-1]*V[j-1] if j > 0 else 0)
-        beta[j] = xp.linalg.norm(w)
-        if beta[j] < 100*len(vstart)*np.finfo(float).eps:
-            # logger.warning(f'beta[{j}] ~= 0 encountered during Lanczos iteration.')
-            return _expm_krylov(alpha[:j+1], beta[:j], V[:j+1, :].T, nrmv, dt), j+1
-
-        if 3 < j and j % 2 == 0:
-            new_res = _expm_krylov(alpha[:j+1], beta[:j], V[:j+1].T, nrmv, dt)
-            if res is not None and xp.allclose(res, new_res):
-                return new_res, j+1
-            else:
+    v = vstart / nrmv
+
+    n = len(vstart)
+    if max_dim is None or n < max_dim:
+        max_dim = n
+    elif max_dim < 3:
+        # the error of the sub-step should decrease faster than the length of the sub-step
+        raise ValueError(f"The maximum dimension of the Krylov subspace should be at least 3, got {max_dim}")
+
+    n_matvec = 0
+    # the remaining time
+    dt_left = dt
+    V = krylov_arena.get(min(block_size, max_dim), n, vstart.dtype)
+    while True:
+        V[0] = v
+        res = None
+        alpha = np.zeros(max_dim)
+        beta = np.zeros(max_dim)
+        for j in range(max_dim):
+            w = Afunc(V[j])
+            n_matvec += 1
+            alpha[j] = xp.vdot(w, V[j]).real
+
+            if j == n-1:
+                #logger.debug("the krylov subspace is equal to the full space")
+                coef = _expm_tridiag(alpha[:j+1], beta[:j], dt_left)
+                return nrmv * (xp.asarray(coef) @ V[:j+1]), n_matvec
+
+            w -= alpha[j]*V[j] + (beta[j-1]*V[j-1] if j > 0 else 0)
+            beta[j] = xp.linalg.norm(w)
+            if beta[j] < 100*n*np.finfo(float).eps:
+                # logger.warning(f'beta[{j}] ~= 0 encountered during Lanczos iteration.')
+                coef = _expm_tridiag(alpha[:j+1], beta[:j], dt_left)
+                return nrmv * (xp.asarray(coef) @ V[:j+1]), n_matvec
+            if tol is not None:
+                coef = _expm_tridiag(alpha[:j+1], beta[:j], dt_left)
+                if beta[j] * abs(coef[-1]) < tol * abs(dt_left / dt):
+                    return nrmv * (xp.asarray(coef) @ V[:j+1]), n_matvec
+            elif 3 < j and j % 2 == 0:
+                new_res = nrmv * (xp.asarray(_expm_tridiag(alpha[:j+1], beta[:j], dt_left)) @ V[:j+1])
+                if res is not None and xp.allclose(res, new_res):
+                    return new_res, n_matvec
                 res = new_res
-        V[j + 1] = w / beta[j]
-
 
+            if j == max_dim - 1:
+                break
+            if len(V) == j+1:
+                V = krylov_arena.get(min(2 * len(V), max_dim), n, vstart.dtype, V, j+1)
+            V[j + 1] = w / beta[j]
+
+        # restart from a sub-step that is accurate enough.
+        # The error is distributed evenly in time
+        m = max_dim
+        tau = dt_left
+        substep_tol = SUBSTEP_TOL if tol is None else tol
+        for _ in range(64):
+            tau = tau / 2
+            coef = _expm_tridiag(alpha[:m], beta[:m-1], tau)
+            if beta[m-1] * abs(coef[-1]) < substep_tol * abs(tau / dt):
+                break
+        else:
+            logger.warning(f"Krylov sub-step not converged. Error estimate: {beta[m-1] * abs(coef[-1])}")
+        logger.debug(f"Krylov subspace restarted. Sub-step: {tau}, remaining: {dt_left - tau}")
+        v = xp.asarray(coef) @ V[:m]
+        nrm = float(xp.linalg.norm(v))
+        nrmv *= nrm
+        v = v / nrm
+        dt_left = dt_left - tau
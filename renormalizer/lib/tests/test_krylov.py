@@ -2,7 +2,8 @@
 
 
 from renormalizer.mps.backend import xp
-from renormalizer.lib import expm_krylov
+from renormalizer.lib import expm_krylov, krylov_arena
+from renormalizer.lib.krylov.krylov import KrylovArena
 from renormalizer.mps.matrix import asxp
 import pytest
 import numpy as np
@@ -37,3 +38,60 @@ def test_expm(N, imag, block_size):
     res1 = x @ np.diag(np.exp(w)) @ x.conj().T @ v
     res2, _ = expm_krylov(lambda x: a2.dot(x), 1, xp.array(v), block_size)
     assert xp.allclose(res1, res2)
+    res3, _ = expm_krylov(lambda x: a2.dot(x), 1, xp.array(v), block_size, tol=1e-10)
+    assert xp.allclose(res1, res3)
+
+
+@pytest.mark.parametrize("dt", (5j, -1))
+def test_expm_restart(dt):
+    N = 200
+    a = np.random.rand(N, N) / N + np.random.rand(N, N) / N / 1j
+    a = (a + a.T.conj()) * 5
+    v = np.random.rand(N) + 0j
+    w, x = eigh(a)
+    res1 = x @ np.diag(np.exp(dt * w)) @ x.conj().T @ v
+    res2, n1 = expm_krylov(lambda x: a @ x, dt, xp.array(v))
+    # the krylov subspace is restarted
+    res3, n2 = expm_krylov(lambda x: a @ x, dt, xp.array(v), max_dim=6)
+    assert n1 < n2
+    assert xp.allclose(res1, res2)
+    assert xp.allclose(res1, res3)
+    with pytest.raises(ValueError):
+        expm_krylov(lambda x: a @ x, dt, xp.array(v), max_dim=2)
+
+
+def test_expm_tol():
+    N = 200
+    a = np.random.rand(N, N) / N
+    a = (a + a.T) * 5
+    v = np.random.rand(N)
+    w, x = eigh(a)
+    res1 = x @ np.diag(np.exp(-1j * w)) @ x.T @ v
+    res2, n2 = expm_krylov(lambda x: a @ x, -1j, xp.array(v + 0j), tol=1e-6)
+    res3, n3 = expm_krylov(lambda x: a @ x, -1j, xp.array(v + 0j), tol=1e-12)
+    assert n2 < n3
+    nrm = np.linalg.norm(v)
+    assert np.linalg.norm(res1 - res2) < 1e-5 * nrm
+    assert np.linalg.norm(res1 - res3) < 1e-10 * nrm
+
+
+def test_arena():
+    N = 100
+    a = np.random.rand(N, N)
+    a = a + a.T
+    v = np.random.rand(N)
+    expm_krylov(lambda x: a @ x, 0.1, xp.array(v))
+    assert 0 < krylov_arena.nbytes
+    krylov_arena.release()
+    assert krylov_arena.nbytes == 0
+
+    # buffers larger than the limit are not kept
+    arena = KrylovArena(limit=N * 8)
+    v1 = arena.get(2, N, np.float64)
+    assert v1.shape == (2, N)
+    assert arena.nbytes == 0
+    arena.limit = 2 ** 20
+    arena.get(2, N, np.float64)
+    assert arena.nbytes == 2 * N * 8
+    arena.release()
+    assert arena.nbytes == 0
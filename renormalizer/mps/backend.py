@@ -16,6 +16,11 @@ except Exception as e:
     primme = None
     IMPORT_PRIMME_EXCEPTION = e
 
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
 
 logger = logging.getLogger(__name__)
 
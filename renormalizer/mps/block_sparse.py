@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+r"""
+Block-sparse tensor keyed by abelian (U(1) or products of U(1)) quantum number sectors.
+
+Each leg of the tensor carries a quantum number array with shape ``(dim, qn_size)``
+(the same layout as ``MatrixProduct.qn``) and a sign (``+1`` or ``-1``) describing
+the flow of the quantum number.
+A block is allowed only if :math:`\sum_i s_i q_i = q_{\textrm{tot}}`,
+which is the same criteria as ``get_qn_mask(add_outer(...), qntot)`` used
+throughout the dense code path. Only the allowed blocks are stored.
+"""
+
+import itertools
+import logging
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from renormalizer.mps.backend import xp, USE_GPU
+
+logger = logging.getLogger(__name__)
+
+
+def _asxp(array):
+    if not USE_GPU:
+        return np.asarray(array)
+    return xp.asarray(array)
+
+
+def _asnumpy(array):
+    if not USE_GPU or isinstance(array, np.ndarray):
+        return np.asarray(array)
+    return xp.asnumpy(array)
+
+
+class BlockSparseTensor:
+    r"""Tensor which only stores blocks allowed by the quantum number symmetry.
+
+    Parameters
+    ----------
+    qn : list of np.ndarray
+        Quantum numbers of each leg. Each element has shape ``(dim, qn_size)``.
+    signs : sequence of int
+        The flow of quantum number of each leg. ``+1`` or ``-1``.
+    qntot : np.ndarray
+        The conserved total quantum number.
+    blocks : dict, optional
+        Mapping from the sector key (a tuple of quantum number tuples, one for each leg)
+        to the dense block.
+    dtype : optional
+        Data type of the tensor. Inferred from the blocks if not provided.
+    """
+
+    def __init__(self, qn: List[np.ndarray], signs: Sequence[int], qntot, blocks: Dict = None, dtype=None):
+        assert len(qn) == len(signs)
+        self.qn: List[np.ndarray] = [np.asarray(q, dtype=int).reshape(len(q), -1) for q in qn]
+        self.signs: Tuple[int] = tuple(int(s) for s in signs)
+        for s in self.signs:
+            if s not in (1, -1):
+                raise ValueError(f"Sign of the leg should be 1 or -1, got {s}")
+        self.qntot: np.ndarray = np.asarray(qntot, dtype=int).reshape(-1)
+        if blocks is None:
+            blocks = {}
+        self.blocks: Dict[Tuple, xp.ndarray] = blocks
+        if dtype is None:
+            dtype = np.result_type(*[b.dtype for b in blocks.values()]) if blocks else np.float64
+        self.dtype = dtype
+        # sector -> index of the sector in the dense leg
+        self._sectors: List[Dict[Tuple, np.ndarray]] = [_leg_sectors(q) for q in self.qn]
+
+    @classmethod
+    def from_dense(cls, array, qn: List[np.ndarray], signs: Sequence[int], qntot) -> "BlockSparseTensor":
+        """
+        Construct the block-sparse tensor from a dense array.
+        Elements in the symmetry-forbidden blocks are discarded.
+        """
+        array = _asxp(array)
+        new = cls(qn, signs, qntot, dtype=array.dtype)
+        if array.shape != new.shape:
+            raise ValueError(f"Array shape {array.shape} does not match quantum number shape {new.shape}")
+        for key in new._allowed_keys():
+            index = np.ix_(*[new._sectors[i][k] for i, k in enumerate(key)])
+            new.blocks[key] = array[index]
+        return new
+
+    def _allowed_keys(self):
+        qntot = tuple(self.qntot)
+        for key in itertools.product(*[s.keys() for s in self._sectors]):
+            if _flow_sum(key, self.signs) == qntot:
+                yield key
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return tuple(len(q) for q in self.qn)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.qn)
+
+    @property
+    def qn_size(self) -> int:
+        return len(self.qntot)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self.blocks.values())
+
+    @property
+    def size(self) -> int:
+        return sum(b.size for b in self.blocks.values())
+
+    @property
+    def density(self) -> float:
+        """
+        The fraction of the dense tensor that is actually stored.
+        """
+        return self.size / max(int(np.prod(self.shape)), 1)
+
+    def to_dense(self) -> xp.ndarray:
+        res = xp.zeros(self.shape, dtype=self.dtype)
+        for key, block in self.blocks.items():
+            index = np.ix_(*[self._sectors[i][k] for i, k in enumerate(key)])
+            res[index] = block
+        return res
+
+    todense = to_dense
+
+    def copy(self) -> "BlockSparseTensor":
+        blocks = {k: b.copy() for k, b in self.blocks.items()}
+        return self.__class__(self.qn, self.signs, self.qntot, blocks, self.dtype)
+
+    def conj(self) -> "BlockSparseTensor":
+        # the flow of the quantum number is reversed for the bra
+        blocks = {k: b.conj() for k, b in self.blocks.items()}
+        return self.__class__(self.qn, [-s for s in self.signs], -self.qntot, blocks, self.dtype)
+
+    def transpose(self, *axes) -> "BlockSparseTensor":
+        if len(axes) == 1 and isinstance(axes[0], (list, tuple)):
+            axes = axes[0]
+        if len(axes) == 0:
+            axes = tuple(range(self.ndim))[::-1]
+        blocks = {tuple(k[i] for i in axes): b.transpose(axes) for k, b in self.blocks.items()}
+        return self.__class__(
+            [self.qn[i] for i in axes], [self.signs[i] for i in axes], self.qntot, blocks, self.dtype
+        )
+
+    def norm(self) -> float:
+        return float(np.sqrt(sum(float(xp.linalg.norm(b)) ** 2 for b in self.blocks.values())))
+
+    def astype(self, dtype) -> "BlockSparseTensor":
+        blocks = {k: b.astype(dtype) for k, b in self.blocks.items()}
+        return self.__class__(self.qn, self.signs, self.qntot, blocks, dtype)
+
+    def matrix_block(self, nleft: int, lset: np.ndarray, rset: np.ndarray) -> np.ndarray:
+        """
+        Gather the dense sub-matrix ``M[lset][:, rset]`` where ``M`` is the tensor reshaped
+        into a matrix with the first ``nleft`` legs as rows. Only blocks overlapping with
+        the requested rows and columns are touched.
+        """
+        lshape, rshape = self.shape[:nleft], self.shape[nleft:]
+        lpos = np.full(int(np.prod(lshape)), -1)
+        lpos[lset] = np.arange(len(lset))
+        rpos = np.full(int(np.prod(rshape)), -1)
+        rpos[rset] = np.arange(len(rset))
+        res = np.zeros((len(lset), len(rset)), dtype=self.dtype)
+        for key, block in self.blocks.items():
+            rows = lpos[self._flat_index(key[:nleft], range(nleft), lshape)]
+            if (rows < 0).all():
+                continue
+            cols = rpos[self._flat_index(key[nleft:], range(nleft, self.ndim), rshape)]
+            if (cols < 0).all():
+                continue
+            # blocks are either fully inside or fully outside of the quantum number sector
+            assert (rows >= 0).all() and (cols >= 0).all()
+            res[np.ix_(rows, cols)] = _asnumpy(block).reshape(len(rows), len(cols))
+        return res
+
+    def _flat_index(self, key, legs, shape) -> np.ndarray:
+        if len(shape) == 0:
+            return np.zeros(1, dtype=int)
+        idx = np.ix_(*[self._sectors[leg][k] for leg, k in zip(legs, key)])
+        return np.ravel_multi_index(idx, shape).ravel()
+
+    def __mul__(self, other):
+        if not np.isscalar(other):
+            return NotImplemented
+        blocks = {k: b * other for k, b in self.blocks.items()}
+        return self.__class__(self.qn, self.signs, self.qntot, blocks)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self * (1 / other)
+
+    def __add__(self, other: "BlockSparseTensor"):
+        if not isinstance(other, BlockSparseTensor):
+            return NotImplemented
+        _check_compatible(self, other)
+        blocks = {k: b.copy() for k, b in self.blocks.items()}
+        for k, b in other.blocks.items():
+            if k in blocks:
+                blocks[k] = blocks[k] + b
+            else:
+                blocks[k] = b.copy()
+        return self.__class__(self.qn, self.signs, self.qntot, blocks)
+
+    def __sub__(self, other: "BlockSparseTensor"):
+        return self + other * (-1)
+
+    def __repr__(self):
+        return f"<BlockSparseTensor at 0x{id(self):x} {self.shape} {self.dtype} {len(self.blocks)} blocks>"
+
+
+def _leg_sectors(qn: np.ndarray) -> Dict[Tuple, np.ndarray]:
+    sectors = defaultdict(list)
+    for i, q in enumerate(map(tuple, qn)):
+        sectors[q].append(i)
+    return {k: np.array(v) for k, v in sectors.items()}
+
+
+def _flow_sum(key, signs) -> Tuple:
+    total = np.zeros(len(key[0]), dtype=int)
+    for q, s in zip(key, signs):
+        total += s * np.array(q)
+    return tuple(total)
+
+
+def _check_compatible(a: BlockSparseTensor, b: BlockSparseTensor):
+    if a.signs != b.signs or not np.array_equal(a.qntot, b.qntot):
+        raise ValueError("Block-sparse tensors have different quantum number structure")
+    for qa, qb in zip(a.qn, b.qn):
+        if not np.array_equal(qa, qb):
+            raise ValueError("Block-sparse tensors have different quantum number structure")
+
+
+def _normalize_axes(axes, ndim_a):
+    if isinstance(axes, int):
+        return list(range(ndim_a - axes, ndim_a)), list(range(axes))
+    axes_a, axes_b = axes
+    if isinstance(axes_a, int):
+        axes_a = [axes_a]
+    if isinstance(axes_b, int):
+        axes_b = [axes_b]
+    return list(axes_a), list(axes_b)
+
+
+def tensordot(a: BlockSparseTensor, b: BlockSparseTensor, axes) -> BlockSparseTensor:
+    """
+    Block-sparse counterpart of ``np.tensordot``. Only pairs of blocks with matching
+    sectors on the contracted legs are contracted. The contracted legs should have
+    the same quantum numbers and opposite flow.
+    """
+    if not (isinstance(a, BlockSparseTensor) and isinstance(b, BlockSparseTensor)):
+        raise TypeError(f"Can't contract {type(a)} with {type(b)}. Convert the dense array by `from_dense` first.")
+    axes_a, axes_b = _normalize_axes(axes, a.ndim)
+    axes_a = [i % a.ndim for i in axes_a]
+    axes_b = [i % b.ndim for i in axes_b]
+    assert len(axes_a) == len(axes_b)
+    for ia, ib in zip(axes_a, axes_b):
+        if not np.array_equal(a.qn[ia], b.qn[ib]):
+            raise ValueError(f"Quantum numbers of the contracted legs {ia} and {ib} do not match")
+        if a.signs[ia] != -b.signs[ib]:
+            raise ValueError(f"Contracted legs {ia} and {ib} should have opposite flow")
+    free_a = [i for i in range(a.ndim) if i not in axes_a]
+    free_b = [i for i in range(b.ndim) if i not in axes_b]
+
+    # group the blocks of b by the sectors on the contracted legs
+    b_groups = defaultdict(list)
+    for kb, block_b in b.blocks.items():
+        b_groups[tuple(kb[i] for i in axes_b)].append((kb, block_b))
+
+    blocks = {}
+    for ka, block_a in a.blocks.items():
+        for kb, block_b in b_groups.get(tuple(ka[i] for i in axes_a), []):
+            key = tuple(ka[i] for i in free_a) + tuple(kb[i] for i in free_b)
+            res = xp.tensordot(block_a, block_b, axes=(axes_a, axes_b))
+            if key in blocks:
+                blocks[key] += res
+            else:
+                blocks[key] = res
+
+    qn = [a.qn[i] for i in free_a] + [b.qn[i] for i in free_b]
+    signs = [a.signs[i] for i in free_a] + [b.signs[i] for i in free_b]
+    dtype = np.result_type(a.dtype, b.dtype)
+    if len(qn) == 0:
+        # full contraction. Return a scalar in accordance with np.tensordot
+        return xp.asarray(sum(blocks.values()) if blocks else 0, dtype=dtype)
+    return BlockSparseTensor(qn, signs, a.qntot + b.qntot, blocks, dtype)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+r"""
+Batched evaluation of the expectation values of a group of MPOs.
+
+Most of the observables (occupations, local operators, etc.) are identity
+with bond dimension 1 except for a few sites. The leading and trailing identity sites
+of each MPO are detected structurally and replaced by the environments of the norm
+:math:`\langle \Psi | \Psi \rangle`, which are shared by all the MPOs.
+The remaining non-trivial parts are grouped by their site span and shapes,
+and each group is stacked and contracted as a whole.
+
+The grouping only depends on the MPOs and is cached in :data:`expectation_plan_cache`
+so that it is reused when the same MPOs are evaluated at every time step.
+"""
+
+from collections import OrderedDict, defaultdict
+from typing import List
+
+import opt_einsum as oe
+
+from renormalizer.mps.backend import np, xp, backend
+from renormalizer.mps.matrix import Matrix, asxp, asnumpy
+
+
+def _is_identity(mo) -> bool:
+    if not isinstance(mo, Matrix):
+        # dumped to the disk
+        return False
+    shape = mo.shape
+    if shape[0] != 1 or shape[-1] != 1 or shape[1] != shape[2]:
+        return False
+    return np.array_equal(mo.array.reshape(shape[1], shape[2]), np.eye(shape[1]))
+
+
+def _nontrivial_span(mpo):
+    # the half-open interval [start, end) of the sites that are not identity
+    mp = mpo._mp
+    start = 0
+    while start < len(mp) and _is_identity(mp[start]):
+        start += 1
+    end = len(mp)
+    while start < end and _is_identity(mp[end - 1]):
+        end -= 1
+    return start, end
+
+
+class ExpectationPlan:
+    r"""
+    The stacked non-trivial parts of a list of MPOs.
+
+    Parameters
+    ----------
+    mpos : list of :class:`~renormalizer.mps.Mpo`
+        The MPOs. Should be defined on the same sites.
+    """
+
+    def __init__(self, mpos: List):
+        self.n_mpos = len(mpos)
+        # used to check whether the MPOs are modified
+        self._mp_list = [list(mpo._mp) for mpo in mpos]
+        groups = defaultdict(list)
+        for impo, mpo in enumerate(mpos):
+            start, end = _nontrivial_span(mpo)
+            shapes = tuple(mpo[i].shape for i in range(start, end))
+            groups[(start, end, shapes)].append(impo)
+
+        # (start, end, indices of the mpos, stacked site tensors)
+        self.groups = []
+        for (start, end, _), indices in groups.items():
+            stacked = [xp.stack([asxp(mpos[impo][isite]) for impo in indices]) for isite in range(start, end)]
+            self.groups.append((start, end, np.array(indices), stacked))
+
+    def match(self, mpos: List) -> bool:
+        """
+        Whether the plan is constructed from ``mpos`` and the MPOs are not modified since then.
+        """
+        if len(mpos) != self.n_mpos:
+            return False
+        for mpo, mp in zip(mpos, self._mp_list):
+            if len(mpo._mp) != len(mp) or any(a is not b for a, b in zip(mpo._mp, mp)):
+                return False
+        return True
+
+    def evaluate(self, mps, mps_conj) -> np.ndarray:
+        r"""
+        The expectation values :math:`\langle \Psi' | \hat O | \Psi \rangle` of the MPOs,
+        where :math:`\Psi'` is ``mps_conj`` (already conjugated).
+        """
+        site_num = len(mps)
+        max_start = max((group[0] for group in self.groups), default=0)
+        min_end = min((group[1] for group in self.groups), default=site_num)
+        l_envs = _norm_environ(mps, mps_conj, "L", max_start)
+        r_envs = _norm_environ(mps, mps_conj, "R", min_end)
+
+        results = np.zeros(self.n_mpos, dtype=np.complex128)
+        for start, end, indices, stacked in self.groups:
+            # legs: (mpos, bra, mpo, ket)
+            environ = l_envs[start][None, :, None, :]
+            for isite, mo in zip(range(start, end), stacked):
+                environ = _contract_stacked(environ, asxp(mps[isite]), mo, asxp(mps_conj[isite]))
+            res = oe.contract("nawb, ab -> n", environ, r_envs[end])
+            results[indices] = asnumpy(res)
+        return results
+
+
+def _norm_environ(mps, mps_conj, domain, stop):
+    # l_envs[i] contracts the sites in [0, i) and r_envs[i] contracts the sites in [i, site_num).
+    # Only the environments up to ``stop`` are calculated. Legs: (bra, ket)
+    site_num = len(mps)
+    envs = [None] * (site_num + 1)
+    if domain == "L":
+        envs[0] = xp.ones((1, 1), dtype=backend.real_dtype)
+        for isite in range(stop):
+            ms, ms_conj = asxp(mps[isite]), asxp(mps_conj[isite])
+            tensor = xp.tensordot(envs[isite], ms_conj, ([0], [0]))
+            legs = list(range(ms.ndim - 1))
+            envs[isite + 1] = xp.tensordot(tensor, ms, (legs, legs))
+    else:
+        assert domain == "R"
+        envs[site_num] = xp.ones((1, 1), dtype=backend.real_dtype)
+        for isite in reversed(range(stop, site_num)):
+            ms, ms_conj = asxp(mps[isite]), asxp(mps_conj[isite])
+            tensor = xp.tensordot(ms_conj, envs[isite + 1], ([-1], [0]))
+            legs = list(range(1, ms.ndim))
+            envs[isite] = xp.tensordot(tensor, ms, (legs, legs))
+    return envs
+
+
+def _contract_stacked(environ, ms, mo, ms_conj):
+    # the operator acts on the first physical leg. The ancilla leg of MPDM is traced out
+    if ms.ndim == 3:
+        subscripts = "nawb, ape, nwpqv, bqf -> nevf"
+    else:
+        assert ms.ndim == 4
+        subscripts = "nawb, apxe, nwpqv, bqxf -> nevf"
+    return oe.contract(subscripts, environ, ms_conj, mo, ms)
+
+
+class ExpectationPlanCache:
+    """
+    LRU cache of :class:`ExpectationPlan` keyed by the identities of the MPOs.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of cached plans. ``0`` disables the cache.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self._plans = OrderedDict()
+
+    def get_plan(self, mpos: List) -> ExpectationPlan:
+        key = tuple(map(id, mpos))
+        plan = self._plans.get(key)
+        # the id could be reused by new objects
+        if plan is not None and plan.match(mpos):
+            self._plans.move_to_end(key)
+            return plan
+        plan = ExpectationPlan(mpos)
+        if 0 < self.maxsize:
+            self._plans[key] = plan
+            while self.maxsize < len(self._plans):
+                self._plans.popitem(last=False)
+        return plan
+
+    def cache_clear(self):
+        self._plans.clear()
+
+
+expectation_plan_cache = ExpectationPlanCache()
@@ -10,13 +10,15 @@ from typing import Tuple, List, Union
 from functools import partial
 from itertools import product
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import logging
 
 import numpy as np
 import scipy
 import opt_einsum as oe
 
-from renormalizer.lib import davidson
+from renormalizer.lib import davidson1
 from renormalizer.model.h_qc import qc_model, int_to_h, generate_ladder_operator, simplify_op
 from renormalizer.model import Model, Op
 from renormalizer.mps.backend import xp, OE_BACKEND, primme, IMPORT_PRIMME_EXCEPTION
@@ -24,7 +26,8 @@ from renormalizer.mps.matrix import multi_tensor_contract, tensordot, asnumpy, a
 from renormalizer.mps.hop_expr import  hop_expr
 from renormalizer.mps.svd_qn import get_qn_mask
 from renormalizer.mps import Mpo, Mps, StackedMpo
-from renormalizer.mps.lib import Environ, cvec2cmat
+from renormalizer.mps.lib import Environ, cvec2cmat, block_aop, PackedLayout
+from renormalizer.mps.parallel import SegmentedMps, parallel_executor, pmap
 from renormalizer.utils import Quantity, CompressConfig, CompressCriteria
 
 
@@ -91,6 +94,9 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
     logger.info(f"e_atol: {mps.optimize_config.e_atol}")
     logger.info(f"procedure: {mps.optimize_config.procedure}")
 
+    if mps.optimize_config.parallel_segments is not None:
+        return optimize_mps_parallel(mps, mpo, omega)
+
     # ensure that mps is left or right-canonical
     # TODO: start from a mix-canonical MPS
     if mps.is_left_canonical:
@@ -111,9 +117,10 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
         environ = Environ(mps, [mpo, mpo], env)
     else:
         if isinstance(mpo, StackedMpo):
-            environ = [Environ(mps, item, env) for item in mpo.mpos]
+            with stacked_executor(mps, mpo) as executor:
+                environ = pmap(executor, lambda item: Environ(mps, item, env), mpo.mpos)
         else:
-            environ = Environ(mps, mpo, env)
+            environ = Environ(mps, mpo, env, block_sparse=mps.optimize_config.block_sparse_environ)
 
     macro_iteration_result = []
     # Idx of the active site with lowest energy for each sweep
@@ -134,7 +141,9 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
 
         logger.debug(f"{mps}")
 
-        micro_iteration_result, res_mps, mpo = single_sweep(mps, mpo, environ, omega, percent, opt_e_idx)
+        with stacked_executor(mps, mpo) as executor:
+            micro_iteration_result, res_mps, mpo = \
+                single_sweep(mps, mpo, environ, omega, percent, opt_e_idx, executor)
 
         opt_e = min(micro_iteration_result)
         macro_iteration_result.append(opt_e[0])
@@ -171,135 +180,269 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
     return macro_iteration_result, res_mps
 
 
+def optimize_mps_parallel(mps: Mps, mpo: Mpo, omega: float = None) -> Tuple[List, Mps]:
+    r"""Real-space parallel DMRG ground state algorithm.
+
+    The chain is partitioned into ``mps.optimize_config.parallel_segments`` segments
+    which are swept in parallel by threads. See :mod:`renormalizer.mps.parallel` for details.
+    Only the two-site algorithm for a single root is supported
+    and the percent in the procedure is not used.
+
+    Parameters
+    ----------
+    mps : renormalizer.mps.Mps
+        initial guess of mps.
+    mpo : renormalizer.mps.Mpo
+        mpo of Hamiltonian
+    omega: float, optional
+        Not supported. Should be ``None``.
+
+    Returns
+    -------
+    energy : list
+        list of energy of each marco sweep.
+    mps : renormalizer.mps.Mps
+        optimized ground state MPS.
+    """
+    optimize_config = mps.optimize_config
+    if optimize_config.method != "2site" or optimize_config.nroots != 1 \
+            or not isinstance(mpo, Mpo) or omega is not None:
+        raise NotImplementedError("Parallel sweeps are only implemented for the two-site "
+                                  "ground state algorithm with a single Mpo")
+
+    compress_config_bk = mps.compress_config
+    segmented: SegmentedMps = None
+
+    def pair_solver(c, ltensor, rtensor, idx, scale):
+        # ``scale`` is only relevant in time evolution
+        _, _, qnmat = segmented._get_big_qn(idx)
+        qn_mask = get_qn_mask(qnmat, mps.qntot)
+        cmo = [asxp(mpo[idx]), asxp(mpo[idx + 1])]
+        ltensor, rtensor = asxp(ltensor), asxp(rtensor)
+        if np.prod(qn_mask.shape) < 1000 or optimize_config.algo == "direct":
+            e, c = eigh_direct(mps, qn_mask, ltensor, rtensor, cmo, None)
+        else:
+            layout = PackedLayout(qn_mask)
+            e, c = eigh_iterative(mps, layout, ltensor, rtensor, cmo, None, [layout.pack(c)])
+        return cvec2cmat(c, qn_mask), e
+
+    macro_iteration_result = []
+    with parallel_executor(optimize_config.parallel_segments) as executor:
+        for isweep, (compress_config, percent) in enumerate(optimize_config.procedure):
+            logger.debug(f"isweep: {isweep}")
+
+            if isinstance(compress_config, int):
+                compress_config = CompressConfig(criteria=CompressCriteria.fixed, max_bonddim=compress_config)
+            assert isinstance(compress_config, CompressConfig)
+            if compress_config.bonddim_should_set:
+                compress_config.set_bonddim(mps.site_num + 1)
+            logger.debug(f"compress config in current loop: {compress_config}")
+
+            if segmented is None:
+                mps.compress_config = compress_config
+                segmented = SegmentedMps(mps, mpo, optimize_config.parallel_segments)
+            segmented.compress_config = compress_config
+
+            macro_iteration_result.append(min(segmented.sweep(pair_solver, executor=executor)))
+
+            logger.debug(
+                f"{isweep+1} sweeps are finished, lowest energy = {min(macro_iteration_result)}"
+            )
+            # check if convergence
+            if isweep > 0 and percent == 0:
+                v1, v2 = sorted(macro_iteration_result)[:2]
+                if np.allclose(v1, v2, rtol=optimize_config.e_rtol, atol=optimize_config.e_atol):
+                    logger.info("DMRG has converged!")
+                    break
+        else:
+            logger.warning("DMRG did not converge! Please increase the procedure!")
+            logger.info(f"The lowest two energies: {sorted(macro_iteration_result)[:2]}.")
+
+    res_mps = segmented.to_mps().normalize("mps_only")
+    res_mps.compress_config = compress_config_bk
+    mps.compress_config = compress_config_bk
+    logger.info(f"{res_mps}")
+    return macro_iteration_result, res_mps
+
+
 def single_sweep(
     mps: Mps,
     mpo: Union[Mpo, StackedMpo],
     environ: Environ,
     omega: float,
     percent: float,
-    last_opt_e_idx: int
+    last_opt_e_idx: int,
+    executor: ThreadPoolExecutor = None,
 ):
 
     method = mps.optimize_config.method
     nroots = mps.optimize_config.nroots
 
+    if omega is None:
+        operator = mpo
+    else:
+        assert isinstance(mpo, Mpo)
+        operator = [mpo, mpo]
+
+    def get_lr(domain, siteidx, lr_method):
+        if isinstance(mpo, StackedMpo):
+            return pmap(executor, lambda environ_item, operator_item:
+                        environ_item.GetLR(domain, siteidx, mps, operator_item, itensor=None, method=lr_method),
+                        environ, operator.mpos)
+        else:
+            return environ.GetLR(domain, siteidx, mps, operator, itensor=None, method=lr_method)
+
+    # in pipelined mode all environment updates and reads are carried out
+    # on a single worker thread so that ``environ`` is never accessed concurrently.
+    # OFS modifies the MPO during the sweep and is not compatible with the pipeline
+    pipeline = mps.optimize_config.pipeline and mps.compress_config.ofs is None
+    if pipeline:
+        pipeline_executor = ThreadPoolExecutor(max_workers=1)
+    # (domain, siteidx) -> future of the environment tensor
+    pending = {}
+
+    def fetch_lr(domain, siteidx, lr_method):
+        future = pending.pop((domain, siteidx), None)
+        if future is not None:
+            return future.result()
+        return get_lr(domain, siteidx, lr_method)
+
+    def submit_lr(domain, siteidx, lr_method):
+        if pipeline and siteidx in range(mps.site_num):
+            pending[(domain, siteidx)] = pipeline_executor.submit(get_lr, domain, siteidx, lr_method)
+
     # in state-averaged calculation, contains C of each state for better initial guess
     averaged_ms = []
     # optmized mps
     res_mps: Union[Mps, List[Mps]] = None
     # energies after optimizing each site
     micro_iteration_result = []
-    for imps in mps.iter_idx_list(full=True):
-        if method == "2site" and (
-            (mps.to_right and imps == mps.site_num - 1)
-            or ((not mps.to_right) and imps == 0)
-        ):
-            break
-
-        if mps.to_right:
-            lmethod, rmethod = "System", "Enviro"
-        else:
-            lmethod, rmethod = "Enviro", "System"
+    try:
+        for imps in mps.iter_idx_list(full=True):
+            if method == "2site" and (
+                (mps.to_right and imps == mps.site_num - 1)
+                or ((not mps.to_right) and imps == 0)
+            ):
+                break
 
-        if method == "1site":
-            lidx = imps - 1
-            cidx = [imps]
-            ridx = imps + 1
-        elif method == "2site":
             if mps.to_right:
-                lidx = imps - 1
-                cidx = [imps, imps + 1]
-                ridx = imps + 2
+                lmethod, rmethod = "System", "Enviro"
             else:
-                lidx = imps - 2
-                cidx = [imps - 1, imps]  # center site
-                ridx = imps + 1
-        else:
-            assert False
-        logger.debug(f"optimize site: {cidx}")
-
-        if omega is None:
-            operator = mpo
-        else:
-            assert isinstance(mpo, Mpo)
-            operator = [mpo, mpo]
+                lmethod, rmethod = "Enviro", "System"
 
-        if isinstance(mpo, StackedMpo):
-            ltensor = [environ_item.GetLR("L", lidx, mps, operator_item, itensor=None, method=lmethod) for environ_item, operator_item in zip(environ, operator.mpos)]
-            rtensor = [environ_item.GetLR("R", ridx, mps, operator_item, itensor=None, method=rmethod) for environ_item, operator_item in zip(environ, operator.mpos)]
-        else:
-            ltensor = environ.GetLR("L", lidx, mps, operator, itensor=None, method=lmethod)
-            rtensor = environ.GetLR("R", ridx, mps, operator, itensor=None, method=rmethod)
+            if method == "1site":
+                lidx = imps - 1
+                cidx = [imps]
+                ridx = imps + 1
+                last_site = imps == (mps.site_num - 1 if mps.to_right else 0)
+            elif method == "2site":
+                if mps.to_right:
+                    lidx = imps - 1
+                    cidx = [imps, imps + 1]
+                    ridx = imps + 2
+                else:
+                    lidx = imps - 2
+                    cidx = [imps - 1, imps]  # center site
+                    ridx = imps + 1
+                last_site = imps == (mps.site_num - 2 if mps.to_right else 1)
+            else:
+                assert False
+            logger.debug(f"optimize site: {cidx}")
+
+            if not last_site:
+                # the environment of the next site is read in the background before
+                # the local problem is solved
+                if mps.to_right:
+                    submit_lr("R", ridx + 1, rmethod)
+                else:
+                    submit_lr("L", lidx - 1, lmethod)
 
-        # get the quantum number pattern
-        qnbigl, qnbigr, qnmat = mps._get_big_qn(cidx)
-        qn_mask = get_qn_mask(qnmat, mps.qntot)
-        cshape = qn_mask.shape
+            # get the quantum number pattern
+            # which is overlapped with the pending environment update of the last site
+            qnbigl, qnbigr, qnmat = mps._get_big_qn(cidx)
+            qn_mask = get_qn_mask(qnmat, mps.qntot)
+            cshape = qn_mask.shape
 
-        # center mo
-        if isinstance(mpo, StackedMpo):
-            cmo = [[asxp(mpo_item[idx]) for idx in cidx] for mpo_item in mpo.mpos]
-        else:
-            cmo = [asxp(mpo[idx]) for idx in cidx]
+            # center mo
+            if isinstance(mpo, StackedMpo):
+                cmo = [[asxp(mpo_item[idx]) for idx in cidx] for mpo_item in mpo.mpos]
+            else:
+                cmo = [asxp(mpo[idx]) for idx in cidx]
 
-        use_direct_eigh = np.prod(cshape) < 1000 or mps.optimize_config.algo == "direct"
-        if use_direct_eigh:
-            e, c = eigh_direct(mps, qn_mask, ltensor, rtensor, cmo, omega)
-        else:
-            # the iterative approach
-            # generate initial guess
-            if nroots == 1:
-                if method == "1site":
-                    # initial guess   b-S-c
-                    #                   a
-                    raw_cguess = mps[cidx[0]]
-                else:
-                    # initial guess b-S-c-S-e
-                    #                 a   d
-                    raw_cguess = tensordot(mps[cidx[0]], mps[cidx[1]], axes=1)
-                cguess = [asnumpy(raw_cguess)[qn_mask]]
+            use_direct_eigh = np.prod(cshape) < 1000 or mps.optimize_config.algo == "direct"
+            if use_direct_eigh:
+                ltensor = fetch_lr("L", lidx, lmethod)
+                rtensor = fetch_lr("R", ridx, rmethod)
+                e, c = eigh_direct(mps, qn_mask, ltensor, rtensor, cmo, omega, executor)
             else:
-                cguess = []
-                for ms in averaged_ms:
+                # the iterative approach
+                layout = PackedLayout(qn_mask)
+                # generate initial guess
+                if nroots == 1:
                     if method == "1site":
-                        raw_cguess = asnumpy(ms)
+                        # initial guess   b-S-c
+                        #                   a
+                        raw_cguess = mps[cidx[0]]
                     else:
-                        if mps.to_right:
-                            raw_cguess = tensordot(ms, mps[cidx[1]], axes=1)
+                        # initial guess b-S-c-S-e
+                        #                 a   d
+                        raw_cguess = tensordot(mps[cidx[0]], mps[cidx[1]], axes=1)
+                    cguess = [layout.pack(asnumpy(raw_cguess))]
+                else:
+                    cguess = []
+                    for ms in averaged_ms:
+                        if method == "1site":
+                            raw_cguess = asnumpy(ms)
                         else:
-                            raw_cguess = tensordot(mps[cidx[0]], ms, axes=1)
-                    cguess.append(asnumpy(raw_cguess)[qn_mask])
-
-            guess_dim = np.sum(qn_mask)
-            cguess.extend(
-                [np.random.rand(guess_dim) - 0.5 for i in range(len(cguess), nroots)]
-            )
-            e, c = eigh_iterative(mps, qn_mask, ltensor, rtensor, cmo, omega, cguess)
-
-        # if multi roots, both davidson and primme return np.ndarray
-        if nroots > 1:
-            e = e.tolist()
-        logger.debug(f"energy: {e}")
-        micro_iteration_result.append((e, cidx))
-
-        cstruct = cvec2cmat(c, qn_mask, nroots=nroots)
-
-        # store the "optimal" mps (usually in the middle of each sweep)
-        if cidx == last_opt_e_idx:
-            if nroots == 1:
-                res_mps = mps.copy()
-                res_mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
-            else:
-                res_mps = [mps.copy() for i in range(len(cstruct))]
-                for iroot in range(len(cstruct)):
-                    res_mps[iroot]._update_mps(
-                        cstruct[iroot], cidx, qnbigl, qnbigr, percent
-                    )
-
-        averaged_ms = mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
-        if mps.compress_config.ofs is not None:
-            mpo.try_swap_site(mps.model, mps.compress_config.ofs_swap_jw)
-
+                            if mps.to_right:
+                                raw_cguess = tensordot(ms, mps[cidx[1]], axes=1)
+                            else:
+                                raw_cguess = tensordot(mps[cidx[0]], ms, axes=1)
+                        cguess.append(layout.pack(asnumpy(raw_cguess)))
+
+                guess_dim = layout.size
+                cguess.extend(
+                    [np.random.rand(guess_dim) - 0.5 for i in range(len(cguess), nroots)]
+                )
+                ltensor = fetch_lr("L", lidx, lmethod)
+                rtensor = fetch_lr("R", ridx, rmethod)
+                e, c = eigh_iterative(mps, layout, ltensor, rtensor, cmo, omega, cguess, executor)
+
+            # if multi roots, both davidson and primme return np.ndarray
+            if nroots > 1:
+                e = e.tolist()
+            logger.debug(f"energy: {e}")
+            micro_iteration_result.append((e, cidx))
+
+            cstruct = cvec2cmat(c, qn_mask, nroots=nroots)
+
+            # store the "optimal" mps (usually in the middle of each sweep)
+            if cidx == last_opt_e_idx:
+                if nroots == 1:
+                    res_mps = mps.copy()
+                    res_mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
+                else:
+                    res_mps = [mps.copy() for i in range(len(cstruct))]
+                    for iroot in range(len(cstruct)):
+                        res_mps[iroot]._update_mps(
+                            cstruct[iroot], cidx, qnbigl, qnbigr, percent
+                        )
+
+            averaged_ms = mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
+            if mps.compress_config.ofs is not None:
+                mpo.try_swap_site(mps.model, mps.compress_config.ofs_swap_jw)
+            if not last_site:
+                # update the environment with the optimized site,
+                # overlapped with the preparation of the next local problem
+                if mps.to_right:
+                    submit_lr("L", lidx + 1, lmethod)
+                else:
+                    submit_lr("R", ridx - 1, rmethod)
+        for future in pending.values():
+            future.result()
+    finally:
+        if pipeline:
+            pipeline_executor.shutdown()
     mps._switch_direction()
     return micro_iteration_result, res_mps, mpo
 
@@ -387,11 +530,14 @@ def eigh_direct(
     rtensor: Union[xp.ndarray, List[xp.ndarray]],
     cmo: List[xp.ndarray],
     omega: float,
+    executor: ThreadPoolExecutor = None,
 ):
     if isinstance(ltensor, list):
         assert isinstance(rtensor, list)
         assert len(ltensor) == len(rtensor)
-        ham = sum([get_ham_direct(mps, qn_mask, ltensor_item, rtensor_item, cmo_item, omega) for ltensor_item, rtensor_item, cmo_item in zip(ltensor, rtensor, cmo)])
+        ham = sum(pmap(executor, lambda ltensor_item, rtensor_item, cmo_item:
+                       get_ham_direct(mps, qn_mask, ltensor_item, rtensor_item, cmo_item, omega),
+                       ltensor, rtensor, cmo))
     else:
         ham = get_ham_direct(mps, qn_mask, ltensor, rtensor, cmo, omega)
     inverse = mps.optimize_config.inverse
@@ -409,7 +555,7 @@ def eigh_direct(
 
 def get_ham_iterative(
     mps: Mps,
-    qn_mask: np.ndarray,
+    layout: PackedLayout,
     ltensor: Union[xp.ndarray, List[xp.ndarray]],
     rtensor: Union[xp.ndarray, List[xp.ndarray]],
     cmo: List[xp.ndarray],
@@ -467,65 +613,98 @@ def get_ham_iterative(
                 backend=OE_BACKEND,
             )
 
-    hdiag = asnumpy(hdiag[qn_mask] * inverse)
+    hdiag = asnumpy(layout.pack(hdiag) * inverse)
 
     # Define the H operator
 
     # contraction expression
-    cshape = qn_mask.shape
-    expr = hop_expr(ltensor, rtensor, cmo, cshape, omega is not None)
-    return hdiag, expr
+    cshape = layout.shape
+    twolayer = omega is not None
+    expr = hop_expr(ltensor, rtensor, cmo, cshape, twolayer)
+    # expressions for a block of vectors stacked on the first axis. Created on demand
+    batch_exprs = {}
+
+    def batch_expr(cstruct):
+        if cstruct.ndim == len(cshape):
+            return expr(cstruct)
+        nvec = len(cstruct)
+        if nvec not in batch_exprs:
+            batch_exprs[nvec] = hop_expr(ltensor, rtensor, cmo, cshape, twolayer, batch=nvec)
+        return batch_exprs[nvec](cstruct)
 
+    return hdiag, batch_expr
 
-def func_sum(funcs):
+
+def func_sum(funcs, executor: ThreadPoolExecutor = None):
     def new_func(*args, **kwargs):
-        return sum([func(*args, **kwargs) for func in funcs])
+        return sum(pmap(executor, lambda func: func(*args, **kwargs), funcs))
     return new_func
 
 
+@contextmanager
+def stacked_executor(mps: Mps, mpo: Union[Mpo, StackedMpo]):
+    """
+    Thread pool to evaluate the MPOs of ``StackedMpo`` in parallel according to
+    ``mps.optimize_config.stacked_workers``. ``None`` is yielded for sequential evaluation.
+    The BLAS threads are limited so that the total number of threads does not exceed the number of cores.
+    """
+    nworkers = mps.optimize_config.stacked_workers
+    if not isinstance(mpo, StackedMpo) or nworkers is None:
+        yield None
+        return
+    with parallel_executor(min(nworkers, len(mpo.mpos))) as executor:
+        yield executor
+
+
 def eigh_iterative(
     mps: Mps,
-    qn_mask: np.ndarray,
+    layout: PackedLayout,
     ltensor: Union[xp.ndarray, List[xp.ndarray]],
     rtensor: Union[xp.ndarray, List[xp.ndarray]],
     cmo: List[xp.ndarray],
     omega: float,
     cguess: List[np.ndarray],
+    executor: ThreadPoolExecutor = None,
 ):
     # iterative algorithm
     inverse = mps.optimize_config.inverse
     if isinstance(ltensor, list):
         assert isinstance(rtensor, list)
         assert len(ltensor) == len(rtensor)
-        ham = [get_ham_iterative(mps, qn_mask, ltensor_item, rtensor_item, cmo_item, omega) for ltensor_item, rtensor_item, cmo_item in zip(ltensor, rtensor, cmo)]
+        ham = pmap(executor, lambda ltensor_item, rtensor_item, cmo_item:
+                   get_ham_iterative(mps, layout, ltensor_item, rtensor_item, cmo_item, omega),
+                   ltensor, rtensor, cmo)
         hdiag = sum([hdiag_item for hdiag_item, expr_item in ham])
-        expr = func_sum([expr_item for hdiag_item, expr_item in ham])
+        expr = func_sum([expr_item for hdiag_item, expr_item in ham], executor)
     else:
-        hdiag, expr = get_ham_iterative(mps, qn_mask, ltensor, rtensor, cmo, omega)
+        hdiag, expr = get_ham_iterative(mps, layout, ltensor, rtensor, cmo, omega)
 
     count = 0
+    batch_size = mps.optimize_config.hop_batch_size
+
+    # dense buffers for unpacking. The forbidden elements are never written
+    buffers = {}
+
+    def apply(x):
+        # x is packed with shape (size,) or (nvec, size)
+        x = asxp(x)
+        key = (x.shape, x.dtype)
+        cstruct = layout.unpack(x, out=buffers.get(key))
+        buffers[key] = cstruct
+        return asnumpy(layout.pack(expr(cstruct))) * inverse
 
     def hop(x):
         nonlocal count
-        count += 1
-        clist = []
         if x.ndim == 1:
-            clist.append(x)
-        else:
-            for icol in range(x.shape[1]):
-                clist.append(x[:, icol])
+            count += 1
+            return apply(x)
+
+        count += x.shape[1]
         res = []
-        for c in clist:
-            # convert c to initial structure according to qn pattern
-            cstruct = asxp(cvec2cmat(c, qn_mask))
-            cout = expr(cstruct) * inverse
-            # convert structure c to 1d according to qn
-            res.append(asnumpy(cout)[qn_mask])
-
-        if len(res) == 1:
-            return res[0]
-        else:
-            return np.stack(res, axis=1)
+        # H * X for blocks of vectors in one contraction
+        for i in range(0, x.shape[1], batch_size):
+            res.append(apply(x[:, i:i+batch_size].T).T)
+        return np.concatenate(res, axis=1)
 
     # Find the eigenvectors
     algo = mps.optimize_config.algo
@@ -533,10 +712,12 @@ def eigh_iterative(
     if algo == "davidson":
         precond = lambda x, e, *args: x / (hdiag - e + 1e-4)
 
-        e, c = davidson(
-            hop, cguess, precond, max_cycle=100, nroots=nroots, max_memory=64000
-        )
-        # if one root, davidson return e as np.float
+        e, c = davidson1(
+            block_aop(hop), cguess, precond, max_cycle=100, nroots=nroots, max_memory=64000
+        )[1:]
+        # if one root, return e as np.float
+        if nroots == 1:
+            e, c = e[0], c[0]
 
     # elif algo == "arpack":
     #    # scipy arpack solver : much slower than pyscf/davidson
@@ -557,7 +738,7 @@ def eigh_iterative(
         if primme is None:
             logger.error("can not import primme")
             raise IMPORT_PRIMME_EXCEPTION
-        h_dim = np.sum(qn_mask)
+        h_dim = layout.size
         precond = lambda x: scipy.sparse.diags(1 / (hdiag + 1e-4)) @ x
         A = scipy.sparse.linalg.LinearOperator((h_dim, h_dim), matvec=hop, matmat=hop)
         M = scipy.sparse.linalg.LinearOperator((h_dim, h_dim), matvec=precond, matmat=hop)
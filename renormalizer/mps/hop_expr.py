@@ -1,11 +1,110 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict, namedtuple
+import logging
+import threading
+
 import opt_einsum as oe
 
 from renormalizer.mps.matrix import asxp
 
 
-def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
+logger = logging.getLogger(__name__)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class ContractPathCache:
+    """
+    Process-wide LRU cache of opt_einsum contraction paths.
+    The path only depends on the subscripts and the shapes of the operands,
+    so local problems at different sites and different time steps with the same shapes
+    share the path search.
+
+    The path is searched with the actual shapes of the operands. If ``memory_limit`` is set,
+    the intermediates of the path are restricted to at most ``memory_limit`` elements,
+    which avoids running out of memory for the nodes with many children in tree tensor networks
+    at the price of more floating point operations.
+    The predicted number of floating point operations and the size of the largest intermediate
+    of each new path are logged at the debug level.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of cached paths. ``0`` disables the cache.
+    memory_limit : int
+        The maximum number of elements of the intermediates. ``None`` means no limit.
+    """
+
+    def __init__(self, maxsize: int = 1024, memory_limit: int = None):
+        self.maxsize = maxsize
+        self.memory_limit = memory_limit
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, subscripts: str, shapes):
+        memory_limit = self.memory_limit
+        key = (subscripts, shapes, memory_limit)
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self.hits += 1
+                self._paths.move_to_end(key)
+                return path
+            self.misses += 1
+        path, info = oe.contract_path(subscripts, *shapes, shapes=True, optimize="auto", memory_limit=memory_limit)
+        logger.debug(
+            f"Contraction path of {len(shapes)} operands: {float(info.opt_cost):g} FLOPs, "
+            f"largest intermediate {float(info.largest_intermediate):g} elements"
+        )
+        with self._lock:
+            if 0 < self.maxsize:
+                self._paths[key] = path
+                while self.maxsize < len(self._paths):
+                    self._paths.popitem(last=False)
+        return path
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._paths))
+
+    def cache_clear(self):
+        with self._lock:
+            self._paths.clear()
+            self.hits = self.misses = 0
+
+
+contract_path_cache = ContractPathCache()
+
+
+def contract_expression(subscripts: str, *operands, constants):
+    """
+    Drop-in replacement of ``oe.contract_expression`` with the contraction path
+    taken from :data:`contract_path_cache`. ``operands`` are either arrays (for the constants)
+    or shapes.
+    """
+    shapes = tuple(tuple(op.shape) if i in constants else tuple(op) for i, op in enumerate(operands))
+    path = contract_path_cache.get_path(subscripts, shapes)
+    return oe.contract_expression(subscripts, *operands, constants=constants, optimize=path)
+
+
+def contract(subscripts: str, *operands):
+    """
+    Drop-in replacement of ``oe.contract`` with the contraction path
+    taken from :data:`contract_path_cache`.
+    """
+    shapes = tuple(tuple(op.shape) for op in operands)
+    path = contract_path_cache.get_path(subscripts, shapes)
+    return oe.contract(subscripts, *operands, optimize=path)
+
+
+def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False, batch:int=None):
+    """
+    The contraction expression of the effective Hamiltonian on the coefficient of shape ``cshape``.
+    If ``batch`` is not ``None``, the expression acts on ``batch`` coefficients
+    stacked on the first axis, i.e., the input and the output are of shape ``(batch, *cshape)``.
+    """
 
     nsite = len(cmo)
     # whether have the ancilla
@@ -33,39 +132,31 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #   |   f   |
             #   O-c-O-i-O
             #   S-d h k-S
-            expr = oe.contract_expression(
-                "abcd, befg, cfhi, jgik, aej -> dhk",
-                ltensor, cmo[0], cmo[0], rtensor, cshape,
-                constants=[0, 1, 2, 3]
-            )
+            subscripts = "abcd, befg, cfhi, jgik, aej -> dhk"
+            operands = [ltensor, cmo[0], cmo[0], rtensor, cshape]
+            constants = [0, 1, 2, 3]
         else:
             #   S-a e   j o-S
             #   O-b-O-g-O-l-O
             #   |   f   k   |
             #   O-c-O-i-O-n-O
             #   S-d h   m p-S
-            expr = oe.contract_expression(
-                "abcd, befg, cfhi, gjkl, ikmn, olnp, aejo -> dhmp",
-                ltensor, cmo[0], cmo[0], cmo[1], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3, 4, 5],
-            )
-        # early return
-        return expr
+            subscripts = "abcd, befg, cfhi, gjkl, ikmn, olnp, aejo -> dhmp"
+            operands = [ltensor, cmo[0], cmo[0], cmo[1], cmo[1], rtensor, cshape]
+            constants = [0, 1, 2, 3, 4, 5]
 
     # Single layer, the most common case
     # Could be written in an automatic way
     # But for now probably an overkill
-    if nsite == 0:
+    elif nsite == 0:
         # S-a   l-S
         #
         # O-b - b-O
         #
         # S-c   k-S
-        expr = oe.contract_expression(
-            "abc, lbk, ck -> al",
-            ltensor, rtensor, cshape,
-            constants=[0, 1],
-        )
+        subscripts = "abc, lbk, ck -> al"
+        operands = [ltensor, rtensor, cshape]
+        constants = [0, 1]
     elif nsite == 1:
         if not ancilla:
             # S-a   l-S
@@ -73,11 +164,9 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             # O-b-O-f-O
             #     e
             # S-c   k-S
-            expr = oe.contract_expression(
-                "abc, bdef, lfk, cek -> adl",
-                ltensor, cmo[0], rtensor, cshape,
-                constants=[0, 1, 2],
-            )
+            subscripts = "abc, bdef, lfk, cek -> adl"
+            operands = [ltensor, cmo[0], rtensor, cshape]
+            constants = [0, 1, 2]
         else:
             # S-a   l-S
             #     d
@@ -85,11 +174,9 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #     e
             # S-c   k-S
             #     g
-            expr = oe.contract_expression(
-                "abc, bdef, lfk, cegk -> adgl",
-                ltensor, cmo[0], rtensor, cshape,
-                constants=[0, 1, 2],
-            )
+            subscripts = "abc, bdef, lfk, cegk -> adgl"
+            operands = [ltensor, cmo[0], rtensor, cshape]
+            constants = [0, 1, 2]
     else:
         if not ancilla:
             # S-a       l-S
@@ -97,11 +184,9 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             # O-b-O-f-O-j-O
             #     e   h
             # S-c       k-S
-            expr = oe.contract_expression(
-                "abc, bdef, fghj, ljk, cehk -> adgl",
-                ltensor, cmo[0], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3],
-            )
+            subscripts = "abc, bdef, fghj, ljk, cehk -> adgl"
+            operands = [ltensor, cmo[0], cmo[1], rtensor, cshape]
+            constants = [0, 1, 2, 3]
         else:
             # S-a       l-S
             #     d   g
@@ -109,10 +194,17 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #     e   h
             # S-c       k-S
             #     m   n
-            expr = oe.contract_expression(
-                "abc, bdef, fghj, ljk, cemhnk -> admgnl",
-                ltensor, cmo[0], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3],
-            )
+            subscripts = "abc, bdef, fghj, ljk, cemhnk -> admgnl"
+            operands = [ltensor, cmo[0], cmo[1], rtensor, cshape]
+            constants = [0, 1, 2, 3]
+
+    if batch is not None:
+        # the vectors are stacked on an extra leading leg of the coefficient
+        # and the output, so that the block is contracted at once
+        inputs, output = subscripts.split("->")
+        inputs = inputs.split(",")
+        inputs[-1] = " z" + inputs[-1].strip()
+        subscripts = ",".join(inputs) + "-> z" + output.strip()
+        operands[-1] = (batch,) + tuple(operands[-1])
 
-    return expr
\ No newline at end of file
+    return contract_expression(subscripts, *operands, constants=constants)
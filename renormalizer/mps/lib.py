@@ -1,23 +1,154 @@
 # -*- coding: utf-8 -*-
 # Author: Jiajun Ren <jiajunren0522@gmail.com>
 
+import logging
+import os
+import shutil
+import tempfile
 from functools import reduce
-from collections import deque
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from renormalizer.mps.backend import np, backend, xp
+from renormalizer.mps.block_sparse import BlockSparseTensor
 from renormalizer.mps.matrix import (Matrix, multi_tensor_contract, asxp,
     asnumpy, tensordot)
+from renormalizer.utils.configs import parse_memory_limit
+
+logger = logging.getLogger(__name__)
+
+
+class EnvironStore:
+    r""" Memory-capped storage of environment tensors keyed by ``(domain, siteidx)``.
+
+    Tensors are kept in memory until the total size exceeds ``memory_limit``.
+    Then the least recently used tensors are moved to ``.npy`` files in ``dump_dir``
+    and are read back as memory-mapped arrays.
+    Spilled tensors can be loaded in advance in a background thread by :meth:`prefetch`.
+
+    Parameters
+    ----------
+    memory_limit : int, float or str, optional
+        The memory budget in bytes or in a format such as ``"4 GB"``.
+        Default is ``None`` which means no limit.
+    dump_dir : str, optional
+        The directory for the spilled tensors. A temporary sub-directory is created
+        at the first spill and removed when the store is garbage-collected.
+    """
+
+    def __init__(self, memory_limit=None, dump_dir=None):
+        self.memory_limit: float = parse_memory_limit(memory_limit)
+        self.dump_dir = dump_dir
+        # in LRU order. The most recently used is at the end
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = {}
+        self._prefetched = {}
+        self._executor = None
+        self._tmp_dir = None
+
+    @property
+    def memory_bytes(self):
+        return self._memory_bytes
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._disk
+
+    def __len__(self):
+        return len(self._memory) + len(self._disk)
+
+    def __setitem__(self, key, array: np.ndarray):
+        self._discard(key)
+        self._memory[key] = array
+        self._memory_bytes += array.nbytes
+        # never spill the tensor just written
+        while self.memory_limit < self._memory_bytes and 1 < len(self._memory):
+            self._spill(next(iter(self._memory)))
+
+    def __getitem__(self, key) -> np.ndarray:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        future = self._prefetched.pop(key, None)
+        if future is not None:
+            return future.result()
+        return np.load(self._disk[key], mmap_mode="r")
+
+    def prefetch(self, key):
+        """
+        Load a spilled tensor in a background thread. No-op if the tensor is in memory.
+        """
+        if key not in self._disk or key in self._prefetched:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetched[key] = self._executor.submit(_load_npy, self._disk[key])
+
+    def _spill(self, key):
+        array = self._memory.pop(key)
+        self._memory_bytes -= array.nbytes
+        if self._tmp_dir is None:
+            dump_dir = self.dump_dir if self.dump_dir is not None else tempfile.gettempdir()
+            os.makedirs(dump_dir, exist_ok=True)
+            self._tmp_dir = tempfile.mkdtemp(prefix="environ_", dir=dump_dir)
+        domain, siteidx = key
+        fname = os.path.join(self._tmp_dir, f"{domain}_{siteidx}.npy")
+        np.save(fname, np.ascontiguousarray(array))
+        self._disk[key] = fname
+
+    def _discard(self, key):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        future = self._prefetched.pop(key, None)
+        if future is not None:
+            future.cancel()
+        fname = self._disk.pop(key, None)
+        if fname is not None:
+            try:
+                os.remove(fname)
+            except OSError:
+                logger.exception(f"Remove {fname} failed")
+
+    def __del__(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._tmp_dir is not None and os.path.exists(self._tmp_dir):
+            try:
+                shutil.rmtree(self._tmp_dir)
+            except OSError:
+                logger.exception(f"Removing temporary environ dir {self._tmp_dir} failed")
+
+
+def _load_npy(fname):
+    return np.load(fname)
 
 
 class Environ:
-    def __init__(self, mps, mpo, domain=None, mps_conj=None):
-        # todo: real disk and other backend
+    r"""
+    The environments of an MPS/MpDm sandwiching an MPO (or a list of MPOs).
+
+    If ``block_sparse`` is ``True``, the environments are built from the
+    :class:`~renormalizer.mps.block_sparse.BlockSparseTensor` form of the sites,
+    so only the blocks allowed by the quantum numbers are contracted and stored.
+    The environments are converted to dense arrays when they are read. The block-sparse
+    mode requires a single MPO and does not support ``mps_conj`` or the memory limit
+    of the environments.
+    """
+    def __init__(self, mps, mpo, domain=None, mps_conj=None, block_sparse=False):
         # todo: contract_one_site_multi_mpo could generalize contract_one_site,
         # we could unify them in the future.
 
         # idx indicates the exact position of L or R, like
         # L(idx-1) - mpo(idx) - R(idx+1)
-        self._virtual_disk = {}
+        compress_config = getattr(mps, "compress_config", None)
+        memory_limit = getattr(compress_config, "environ_memory_limit", None)
+        self.block_sparse = block_sparse
+        if block_sparse and (type(mpo) is list or mps_conj is not None or memory_limit is not None):
+            raise NotImplementedError("Block-sparse environments only support a single MPO without memory limit")
+        if memory_limit is None:
+            self._virtual_disk = {}
+        else:
+            self._virtual_disk = EnvironStore(memory_limit, compress_config.dump_matrix_dir)
         if type(mpo) is list:
             ndim = len(mpo) + 2
         else:
@@ -29,7 +160,7 @@ class Environ:
 
         assert domain in ["L", "R", None]
 
-        if mps_conj is None:
+        if mps_conj is None and not self.block_sparse:
             mps_conj = mps.conj()
 
         if domain is None:
@@ -40,12 +171,18 @@ class Environ:
             start, end, inc = 0, len(mps) - 1, 1
         else:
             start, end, inc = len(mps) - 1, 0, -1
-        self.write_l_sentinel(mps)
-        self.write_r_sentinel(mps)
-
-        tensor = self.sentinel
+        if self.block_sparse:
+            self.write("L", -1, self._block_sparse_sentinel("L", mps, mpo))
+            self.write("R", len(mps), self._block_sparse_sentinel("R", mps, mpo))
+            tensor = self._block_sparse_sentinel(domain, mps, mpo)
+        else:
+            self.write_l_sentinel(mps)
+            self.write_r_sentinel(mps)
+            tensor = self.sentinel
         for idx in range(start, end, inc):
-            if type(mpo) is list:
+            if self.block_sparse:
+                tensor = self._contract_block_sparse(tensor, mps, mpo, idx, domain)
+            elif type(mpo) is list:
                 # a list of mpos
                 tensor = contract_one_site_multi_mpo(tensor, mps[idx], [mp[idx] for mp in mpo], domain, ms_conj=mps_conj[idx])
             else:
@@ -80,6 +217,9 @@ class Environ:
         if siteidx not in range(len(mps)):
             return self.sentinel
 
+        if self.block_sparse:
+            return self._get_lr_block_sparse(domain, siteidx, mps, mpo, itensor, method)
+
         if method == "Scratch":
             itensor = self.sentinel
             if domain == "L":
@@ -111,11 +251,56 @@ class Environ:
 
         return itensor
 
+    def _get_lr_block_sparse(self, domain, siteidx, mps, mpo, itensor, method):
+        if method == "Scratch":
+            itensor = self._block_sparse_sentinel(domain, mps, mpo)
+            if domain == "L":
+                sitelist = range(siteidx + 1)
+            else:
+                sitelist = range(len(mps) - 1, siteidx - 1, -1)
+            for imps in sitelist:
+                itensor = self._contract_block_sparse(itensor, mps, mpo, imps, domain)
+        elif method == "Enviro":
+            itensor = self._virtual_disk[(domain, siteidx)]
+        elif method == "System":
+            if itensor is None:
+                offset = -1 if domain == "L" else 1
+                itensor = self._virtual_disk[(domain, siteidx + offset)]
+            itensor = self._contract_block_sparse(itensor, mps, mpo, siteidx, domain)
+            self.write(domain, siteidx, itensor)
+        return itensor.to_dense()
+
+    @staticmethod
+    def _block_sparse_sentinel(domain, mps, mpo):
+        # the bond at the end of the chain, flowing opposite to the bond of the sites
+        if domain == "L":
+            bond_idx, signs = 0, [1, -1, -1]
+        else:
+            bond_idx, signs = len(mps), [-1, 1, 1]
+        qn = [mps._get_lqn(bond_idx), mpo._get_lqn(bond_idx), mps._get_lqn(bond_idx)]
+        return BlockSparseTensor.from_dense(np.ones((1, 1, 1)), qn, signs, np.zeros_like(mps.qntot))
+
+    @staticmethod
+    def _contract_block_sparse(tensor, mps, mpo, idx, domain):
+        ms = mps.get_block_sparse(idx)
+        return contract_one_site(tensor, ms, mpo.get_block_sparse(idx), domain, ms_conj=ms.conj())
+
     def write(self, domain, siteidx, tensor):
+        if isinstance(tensor, BlockSparseTensor):
+            self._virtual_disk[(domain, siteidx)] = tensor
+            return
         self._virtual_disk[(domain, siteidx)] = asnumpy(tensor)
 
     def read(self, domain: str, siteidx: int):
-        return asxp(self._virtual_disk[(domain, siteidx)])
+        res = self._virtual_disk[(domain, siteidx)]
+        if isinstance(res, BlockSparseTensor):
+            return res.to_dense()
+        res = asxp(res)
+        if isinstance(self._virtual_disk, EnvironStore):
+            # the next environment to be read in the sweep
+            offset = -1 if domain == "L" else 1
+            self._virtual_disk.prefetch((domain, siteidx + offset))
+        return res
 
 
 def contract_one_site_multi_mpo(environ, ms, mos, domain, ms_conj=None):
@@ -439,6 +624,65 @@ def _sum(mps_list, compress=True, temp_m_trunc=None):
     return new_mps
 
 
+class PackedLayout:
+    r"""
+    Layout of the packed vector of the symmetry-allowed elements of a dense tensor.
+    The flat indices of the allowed elements are computed once from ``qn_mask``,
+    so that packing and unpacking is a single ``take``/``put`` on the backend
+    where the array lives.
+
+    Both :meth:`pack` and :meth:`unpack` accept arbitrary leading (batch) axes.
+
+    Parameters
+    ----------
+    qn_mask : np.ndarray
+        Boolean mask of the allowed elements.
+    """
+
+    def __init__(self, qn_mask):
+        qn_mask = asnumpy(qn_mask)
+        self.shape = qn_mask.shape
+        self.index: np.ndarray = np.flatnonzero(qn_mask)
+        # copy on the device if GPU is used
+        self.xp_index = asxp(self.index)
+
+    @property
+    def size(self) -> int:
+        return len(self.index)
+
+    def _index(self, array):
+        if isinstance(array, np.ndarray):
+            return self.index
+        return self.xp_index
+
+    def pack(self, tensor, out=None):
+        """
+        Gather the allowed elements of ``tensor`` with shape ``(..., *self.shape)``
+        to the packed vector with shape ``(..., self.size)``.
+        """
+        if isinstance(tensor, Matrix):
+            tensor = tensor.array
+        lead = tensor.shape[:tensor.ndim - len(self.shape)]
+        flat = tensor.reshape(lead + (-1,))
+        return flat.take(self._index(flat), axis=-1, out=out)
+
+    def unpack(self, vec, out=None):
+        """
+        Scatter the packed vector with shape ``(..., self.size)`` to the dense tensor
+        with shape ``(..., *self.shape)``. Forbidden elements are zero.
+        If ``out`` is provided, only the allowed elements are written.
+        So ``out`` can be reused for different vectors without clearing.
+        """
+        lead = vec.shape[:-1]
+        if out is None:
+            if isinstance(vec, np.ndarray):
+                out = np.zeros(lead + self.shape, dtype=vec.dtype)
+            else:
+                out = xp.zeros(lead + self.shape, dtype=vec.dtype)
+        out.reshape(lead + (-1,))[..., self._index(out)] = vec
+        return out
+
+
 def cvec2cmat(c, qn_mask, nroots=1):
     # recover good quantum number vector c to matrix format
     if nroots == 1:
@@ -455,3 +699,13 @@ def cvec2cmat(c, qn_mask, nroots=1):
             cstruct.append(icstruct)
 
     return cstruct
+
+
+def block_aop(hop):
+    # adapt ``hop`` that accepts a block of vectors as columns of a 2d array
+    # to the ``aop`` interface of ``davidson1`` that accepts a list of vectors
+    def aop(xs):
+        if len(xs) == 1:
+            return [hop(xs[0])]
+        return list(np.ascontiguousarray(hop(np.stack(xs, axis=1)).T))
+    return aop
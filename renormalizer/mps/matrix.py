@@ -6,6 +6,8 @@ import logging
 from typing import List, Union
 
 from renormalizer.mps.backend import np, backend, xp, USE_GPU
+from renormalizer.mps import block_sparse
+from renormalizer.mps.block_sparse import BlockSparseTensor
 
 logger = logging.getLogger(__name__)
 
@@ -207,7 +209,9 @@ def einsum(subscripts, *operands):
     return Matrix(np.einsum(subscripts, *[o.array for o in operands]))
 
 
-def tensordot(a: Union[Matrix, np.ndarray], b: Union[Matrix, np.ndarray, xp.ndarray], axes) -> xp.ndarray:
+def tensordot(a: Union[Matrix, np.ndarray, BlockSparseTensor], b: Union[Matrix, np.ndarray, xp.ndarray, BlockSparseTensor], axes) -> xp.ndarray:
+    if isinstance(a, BlockSparseTensor) or isinstance(b, BlockSparseTensor):
+        return block_sparse.tensordot(a, b, axes)
     return xp.tensordot(asxp(a), asxp(b), axes)
 
 
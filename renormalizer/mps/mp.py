@@ -21,12 +21,14 @@ from renormalizer.mps.matrix import (
     zeros,
     tensordot,
     Matrix)
+from renormalizer.mps.block_sparse import BlockSparseTensor
 from renormalizer.mps.lib import (
     Environ,
     select_basis,
     )
 from renormalizer.mps.hop_expr import hop_expr
 from renormalizer.utils import sizeof_fmt, CompressConfig, CompressCriteria, OFS, calc_vn_entropy
+from renormalizer.utils.container import Container, dump_container, is_container
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +36,9 @@ logger = logging.getLogger(__name__)
 class MatrixProduct:
 
     @classmethod
-    def load(cls, model: Model, fname: str):
+    def load(cls, model: Model, fname: str, mmap: bool = True):
+        if is_container(fname):
+            return cls._load_container(model, fname, mmap)[0]
         npload = np.load(fname, allow_pickle=True)
         mp = cls()
         mp.model = model
@@ -57,6 +61,28 @@ class MatrixProduct:
         mp.to_right = bool(npload["to_right"])
         return mp
 
+    @classmethod
+    def _load_container(cls, model: Model, fname: str, mmap: bool):
+        # load from the binary container. The site tensors are memory-mapped if ``mmap``
+        container = Container(fname, mmap=mmap)
+        if container.version != "0.5":
+            raise ValueError(f"Unknown dump version: {container.version}")
+        mp = cls()
+        mp.model = model
+        nsites = int(container["nsites"])
+        for i in range(nsites):
+            mt = container[f"mt_{i}"]
+            if np.iscomplexobj(mt):
+                mp.dtype = backend.complex_dtype
+            else:
+                mp.dtype = backend.real_dtype
+            mp.append(mt)
+        mp.qn = [container[f"qn_{i}"].astype(int) for i in range(nsites + 1)]
+        mp.qnidx = int(container["qnidx"])
+        mp.qntot = container["qntot"].astype(int)
+        mp.to_right = bool(container["to_right"])
+        return mp, container
+
     def __init__(self):
         # XXX: when modify theses codes, keep in mind to update `metacopy` method
         # set to a list of None upon metacopy. String is used when the matrix is
@@ -1052,6 +1078,12 @@ class MatrixProduct:
         self._mp = [[None]] * num
 
     def dump(self, fname, other_attrs=None):
+        """
+        Dump the matrix product to ``fname`` in a binary container
+        (see :mod:`renormalizer.utils.container`).
+        The site tensors and quantum numbers are stored as contiguous arrays,
+        so that :meth:`load` can memory-map the site tensors without copying.
+        """
 
         if other_attrs is None:
             other_attrs = []
@@ -1060,24 +1092,20 @@ class MatrixProduct:
         assert isinstance(other_attrs, list)
 
         data_dict = dict()
-        # version of the protocol
-        data_dict["version"] = "0.4"
         data_dict["nsites"] = self.site_num
         for idx, mt in enumerate(self):
-            data_dict[f"mt_{idx}"] = mt.array
+            data_dict[f"mt_{idx}"] = asnumpy(mt)
+        for idx, qn in enumerate(self.qn):
+            # compact integer array with shape (bond dim, qn size)
+            qn = np.asarray(qn)
+            data_dict[f"qn_{idx}"] = qn.reshape(len(qn), -1).astype(np.int32)
 
-        for attr in ["qnidx", "qntot", "qn", "to_right"] + other_attrs:
+        for attr in ["qnidx", "qntot", "to_right"] + other_attrs:
             data_dict[attr] = getattr(self, attr)
-        qn = data_dict['qn']
-        arr = np.empty(len(qn), object)
-        arr[:] = qn
-        data_dict['qn'] = arr
-
-        for i in range(self.site_num+1):
-            data_dict[f"subqn_{i}"] = qn[i]
 
         try:
-            np.savez(fname, **data_dict)
+            # version of the protocol
+            dump_container(fname, data_dict, version="0.5")
         except Exception:
             logger.exception(f"Dump MP failed.")
 
@@ -1088,6 +1116,40 @@ class MatrixProduct:
     def _get_sigmaqn(self, idx):
         raise NotImplementedError
 
+    def _get_pleg_qn(self, idx):
+        # quantum numbers and flows of each physical leg of the site
+        raise NotImplementedError
+
+    def _get_lqn(self, bond_idx) -> np.ndarray:
+        # the L-block quantum number of the bond
+        if bond_idx <= self.qnidx:
+            return np.array(self.qn[bond_idx])
+        return self.qntot - np.array(self.qn[bond_idx])
+
+    def get_block_sparse(self, idx) -> BlockSparseTensor:
+        r""" Convert the local site to the block-sparse format.
+
+        The quantum number of the left bond and the physical legs flow in and
+        the quantum number of the right bond flows out,
+        so the returned tensor conserves zero quantum number.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the site.
+
+        Returns
+        -------
+        tensor : renormalizer.mps.block_sparse.BlockSparseTensor
+            The block-sparse site tensor.
+        """
+        pleg_qn = self._get_pleg_qn(idx)
+        qn = [self._get_lqn(idx)] + [q for q, _ in pleg_qn] + [self._get_lqn(idx + 1)]
+        signs = [1] + [s for _, s in pleg_qn] + [-1]
+        return BlockSparseTensor.from_dense(
+            self[idx].array, qn, signs, np.zeros_like(self.qntot)
+        )
+
     def __eq__(self, other):
         for m1, m2 in zip(self, other):
             if not allclose(m1, m2):
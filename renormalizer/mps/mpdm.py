@@ -73,6 +73,10 @@ class MpDm(Mps, Mpo):
         array_down = np.zeros_like(array_up)
         return add_outer(array_up, array_down)
 
+    def _get_pleg_qn(self, idx):
+        array_up = np.array(self.model.basis[idx].sigmaqn)
+        return [(array_up, 1), (np.zeros_like(array_up), 1)]
+
     def evolve_exact(self, h_mpo, evolve_dt, space):
         MPOprop = Mpo.exact_propagator(
             self.model, -1.0j * evolve_dt, space=space, shift=-h_mpo.offset
@@ -9,11 +9,12 @@ import scipy.sparse
 
 from renormalizer.model import Model, HolsteinModel
 from renormalizer.mps.backend import xp
-from renormalizer.mps.matrix import moveaxis, tensordot
+from renormalizer.mps.matrix import moveaxis, tensordot, asnumpy
 from renormalizer.mps.mp import MatrixProduct
 from renormalizer.mps.svd_qn import add_outer
 from renormalizer.mps import svd_qn
 from renormalizer.mps.lib import update_cv
+from renormalizer.mps.mpo_cache import get_mpo_cache
 from renormalizer.mps.symbolic_mpo import construct_symbolic_mpo, _terms_to_table, symbolic_mo_to_numeric_mo, swap_site
 from renormalizer.utils import Quantity
 from renormalizer.model.op import Op
@@ -271,14 +272,25 @@ class Mpo(MatrixProduct):
         if len(terms) == 0:
             raise ValueError("Terms all have factor 0.")
 
-        table, factor = _terms_to_table(model, terms, -self.offset)
+        self.model = model
+        self.to_right = False
+
+        mpo_cache = get_mpo_cache()
+        if mpo_cache is not None:
+            key = mpo_cache.key(model.basis, terms, self.offset)
+            entry = mpo_cache.get(key)
+            if entry is not None:
+                logger.debug(f"MPO loaded from cache {key}")
+                self._restore_cache_entry(entry)
+                return
+
+        table, factor, primary_ops = _terms_to_table(model, terms, -self.offset)
 
         self.dtype = factor.dtype
 
-        mpo_symbol, self.qn, self.qntot, self.qnidx, self.symbolic_out_ops_list, self.primary_ops = construct_symbolic_mpo(table, factor)
+        mpo_symbol, self.qn, self.qntot, self.qnidx, self.symbolic_out_ops_list, self.primary_ops = \
+            construct_symbolic_mpo(table, factor, primary_ops=primary_ops)
         # print(_format_symbolic_mpo(mpo_symbol))
-        self.model = model
-        self.to_right = False
 
         # evaluate the symbolic mpo
         assert model.basis is not None
@@ -287,11 +299,31 @@ class Mpo(MatrixProduct):
             mo_mat = symbolic_mo_to_numeric_mo(model.basis[impo], mo, self.dtype)
             self.append(mo_mat)
 
+        if mpo_cache is not None:
+            mpo_cache.put(key, self._to_cache_entry())
+
+    _cache_attrs = ["dtype", "qn", "qntot", "qnidx", "symbolic_out_ops_list", "primary_ops"]
+
+    def _to_cache_entry(self) -> dict:
+        entry = {attr: getattr(self, attr) for attr in self._cache_attrs}
+        entry["mts"] = [asnumpy(mt) for mt in self]
+        return entry
+
+    def _restore_cache_entry(self, entry: dict):
+        for attr in self._cache_attrs:
+            setattr(self, attr, entry[attr])
+        for mt in entry["mts"]:
+            self.append(mt)
+
 
     def _get_sigmaqn(self, idx):
         array_up = self.model.basis[idx].sigmaqn
         return add_outer(array_up, -array_up)
 
+    def _get_pleg_qn(self, idx):
+        array_up = np.array(self.model.basis[idx].sigmaqn)
+        return [(array_up, 1), (array_up, -1)]
+
     @property
     def is_mps(self):
         return False
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed on-disk cache of constructed MPOs.
+
+The key of an MPO is the SHA-256 digest of the local basis, the (canonicalised)
+operator terms and the offset, so that processes sharing the same cache directory
+reuse MPOs of the same Hamiltonian regardless of how the model object is created.
+The least recently used entries are evicted when the total size of the cache
+exceeds ``max_size``.
+
+The cache is disabled by default. It could be enabled by :func:`set_mpo_cache`
+or by the ``RENO_MPO_CACHE`` environment variable (the cache directory).
+The size limit in bytes could be set by the ``RENO_MPO_CACHE_SIZE`` environment variable.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+from typing import List, Optional
+
+import numpy as np
+
+from renormalizer.model import Op
+from renormalizer.model.basis import BasisSet
+from renormalizer.utils import sizeof_fmt
+
+logger = logging.getLogger(__name__)
+
+# bump when the construction algorithm or the entry layout changes
+CACHE_VERSION = 1
+
+SUFFIX = ".mpo.pkl"
+
+
+def _update_hash(h, obj):
+    if isinstance(obj, np.ndarray):
+        h.update(f"ndarray{obj.dtype.str}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update_hash(h, item)
+    else:
+        # repr of floats is exact
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+
+
+def _basis_description(basis: BasisSet) -> List:
+    # the public attributes fully determine the operator matrices.
+    # Private attributes are transient states or lazily evaluated caches
+    attrs = [(k, v) for k, v in sorted(vars(basis).items()) if not k.startswith("_")]
+    return [type(basis).__qualname__, attrs]
+
+
+def _canonicalise_terms(terms: List[Op]) -> List:
+    # the order of the terms does not affect the operator.
+    # Note that the factors are not summed up for equal terms
+    # because the result of floating point summation depends on the order
+    return sorted((op.to_tuple() for op in terms), key=repr)
+
+
+class MpoCache:
+    r"""
+    On-disk cache of MPOs. Each entry is a pickled dict
+    of the site tensors and the quantum numbers as well as the symbolic information of the MPO.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory of the cache. Created if not exists.
+        Could be shared by multiple processes.
+    max_size : int
+        Maximum total size of the cache in bytes. Default is 1 GiB.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 2**30):
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(basis: List[BasisSet], terms: List[Op], offset) -> str:
+        h = hashlib.sha256()
+        _update_hash(h, ["version", CACHE_VERSION])
+        _update_hash(h, [_basis_description(b) for b in basis])
+        _update_hash(h, _canonicalise_terms(terms))
+        _update_hash(h, ["offset", offset])
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # corrupted or written by an incompatible version
+            logger.warning(f"Failed to load MPO cache entry {path}. Ignored.")
+            self.misses += 1
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("Failed to write MPO cache entry.")
+            return
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                # removed by other processes
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    @property
+    def size(self) -> int:
+        """
+        Total size of the cache in bytes.
+        """
+        return sum(entry[1] for entry in self._entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size is within ``max_size``.
+        """
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            logger.debug(f"Evict MPO cache entry {name} of size {sizeof_fmt(size)}")
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+_mpo_cache: Optional[MpoCache] = None
+if os.environ.get("RENO_MPO_CACHE"):
+    _mpo_cache = MpoCache(os.environ["RENO_MPO_CACHE"], int(os.environ.get("RENO_MPO_CACHE_SIZE", 2**30)))
+
+
+def set_mpo_cache(cache_dir: Optional[str], max_size: int = 2**30) -> Optional[MpoCache]:
+    """
+    Enable the on-disk MPO cache at ``cache_dir``. Set ``cache_dir`` to ``None`` to disable the cache.
+
+    Returns
+    -------
+    mpo_cache : :class:`MpoCache` or None
+        The cache in use.
+    """
+    global _mpo_cache
+    if cache_dir is None:
+        _mpo_cache = None
+    else:
+        _mpo_cache = MpoCache(cache_dir, max_size)
+    return _mpo_cache
+
+
+def get_mpo_cache() -> Optional[MpoCache]:
+    return _mpo_cache
@@ -1,12 +1,14 @@
 # -*- encoding: utf-8 -*-
 
+import inspect
 import logging
-from collections import Counter, deque
+from collections import deque
 from functools import wraps, reduce
 from typing import Union, List, Dict
 import itertools
 
 
+import opt_einsum as oe
 import scipy
 from scipy import stats
 
@@ -20,7 +22,7 @@ from renormalizer.mps.lib import (
     select_basis,
     compressed_sum,
     contract_one_site,
-    cvec2cmat
+    PackedLayout,
 )
 from renormalizer.mps.matrix import (
     multi_tensor_contract,
@@ -31,7 +33,9 @@ from renormalizer.mps.matrix import (
     asxp)
 from renormalizer.mps.mp import MatrixProduct
 from renormalizer.mps.hop_expr import hop_expr
+from renormalizer.mps.expectation import expectation_plan_cache
 from renormalizer.mps.mpo import Mpo
+from renormalizer.mps.parallel import SegmentedMps, parallel_executor
 from renormalizer.utils import (
     OptimizeConfig,
     CompressCriteria,
@@ -39,6 +43,7 @@ from renormalizer.utils import (
     EvolveMethod
 )
 from renormalizer.utils.utils import calc_vn_entropy
+from renormalizer.utils.container import is_container
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +51,11 @@ logger = logging.getLogger(__name__)
 def adaptive_tdvp(fun):
     # evolve t/2 (twice) and t to obtain the O(dt^3) error term in 2nd-order Trotter decomposition
     # J. Chem. Phys. 146, 174107 (2017)
+    # If ``EvolveConfig.adaptive_estimator`` is "embedded" and ``fun`` supports ``n_sweep``,
+    # the 2nd-order step is compared with the 1st-order step obtained by a single forward sweep.
+    # The error of the 1st-order step is O(dt^2) and the 2nd-order result is accepted,
+    # which costs about 1.5 times a plain step rather than 3 times.
+    support_embedded = "n_sweep" in inspect.signature(fun).parameters
 
     @wraps(fun)
     def adaptive_fun(self: "Mps", mpo, evolve_target_t):
@@ -54,6 +64,12 @@ def adaptive_tdvp(fun):
             return fun(self, mpo, evolve_target_t)
         config: EvolveConfig = self.evolve_config.copy()
         config.check_valid_dt(evolve_target_t)
+        embedded = config.adaptive_estimator == "embedded"
+        if embedded and (not support_embedded or config.parallel_segments is not None):
+            logger.debug(f"Embedded error estimator not supported by {fun.__name__}. Use step doubling.")
+            embedded = False
+        elif config.adaptive_estimator not in ["doubling", "embedded"]:
+            raise ValueError(f"Unknown adaptive estimator: {config.adaptive_estimator}")
 
         cur_mps = self
         # prevent bug
@@ -72,16 +88,23 @@ def adaptive_tdvp(fun):
             logger.debug(
                     f"guess_dt: {config.guess_dt}, try time step size: {dt}"
             )
-            
-            mps_half1 = fun(cur_mps, mpo, dt / 2)
-            mps_half2 = fun(mps_half1, mpo, dt / 2)
-            mps = fun(cur_mps, mpo, dt)
-            dis = mps.distance(mps_half2)
-
-            # prevent bug. save "some" memory.
-            del mps_half1, mps
 
-            p = (0.75 * config.adaptive_rtol / (dis/mps_half2.mp_norm + 1e-30)) ** (1./3)
+            if embedded:
+                new_mps = fun(cur_mps, mpo, dt)
+                mps_1st = fun(cur_mps, mpo, dt, n_sweep=1)
+                dis = new_mps.distance(mps_1st)
+                del mps_1st
+                order = 2
+            else:
+                mps_half1 = fun(cur_mps, mpo, dt / 2)
+                new_mps = fun(mps_half1, mpo, dt / 2)
+                mps = fun(cur_mps, mpo, dt)
+                dis = mps.distance(new_mps)
+                # prevent bug. save "some" memory.
+                del mps_half1, mps
+                order = 3
+
+            p = (0.75 * config.adaptive_rtol / (dis/new_mps.mp_norm + 1e-30)) ** (1./order)
             logger.debug(f"distance: {dis}, enlarge p parameter: {p}")
             if p < p_min:
                 p = p_min
@@ -101,20 +124,34 @@ def adaptive_tdvp(fun):
             if np.allclose(evolved_t, evolve_target_t):
                 # normal exit. Note that `dt` could be much less than actually tolerated for the last step
                 # so use `guess_dt` for the last step. Slight inaccuracy won't harm.
-                mps_half2.evolve_config.guess_dt = config.guess_dt
+                new_mps.evolve_config.guess_dt = config.guess_dt
                 logger.debug(
-                    f"evolution converged, new guess_dt: {mps_half2.evolve_config.guess_dt}"
+                    f"evolution converged, new guess_dt: {new_mps.evolve_config.guess_dt}"
                 )
-                return mps_half2
+                return new_mps
             else:
                 # in this case `config.guess_dt == dt`
                 config.guess_dt *= p
                 logger.debug(f"sub-step {dt} further, evolved: {evolved_t}, new guess_dt: {config.guess_dt}")
-                cur_mps = mps_half2
+                cur_mps = new_mps
 
     return adaptive_fun
 
 
+def _rdm_entropy(rdm: Dict) -> Dict:
+    # von Neumann entropy of the density matrices.
+    # Matrices of the same shape are diagonalized together
+    groups = {}
+    for key, dm in rdm.items():
+        groups.setdefault(dm.shape, []).append(key)
+    entropy = {}
+    for keys in groups.values():
+        w_list = np.linalg.eigvalsh(np.array([rdm[key] for key in keys]))
+        for key, w in zip(keys, w_list):
+            entropy[key] = calc_vn_entropy(w)
+    return entropy
+
+
 class Mps(MatrixProduct):
     @classmethod
     def random(cls, model: Model, qntot, m_max, percent=1.0) -> "Mps":
@@ -339,7 +376,11 @@ class Mps(MatrixProduct):
         return mps
 
     @classmethod
-    def load(cls, model: Model, fname: str):
+    def load(cls, model: Model, fname: str, mmap: bool = True):
+        if is_container(fname):
+            mp, container = cls._load_container(model, fname, mmap)
+            mp.coeff = container["coeff"].item(0)
+            return mp
         npload = np.load(fname, allow_pickle=True)
         mp = cls()
         mp.model = model
@@ -414,6 +455,9 @@ class Mps(MatrixProduct):
     def _get_sigmaqn(self, idx):
         return self.model.basis[idx].sigmaqn
 
+    def _get_pleg_qn(self, idx):
+        return [(np.array(self.model.basis[idx].sigmaqn), 1)]
+
     @property
     def is_mps(self):
         return True
@@ -478,38 +522,11 @@ class Mps(MatrixProduct):
             # the naive way, slow and time consuming. Yet predictable and reliable
             return np.array([self.expectation(mpo, self_conj) for mpo in mpos])
 
-        # optimized way, cache for intermediates
-        # hash is used as indices of the matrices.
-        # The chance for collision (the same hash for two different matrices) is
-        # about 1-0.99999999999997 in 1000 matrices.
-        # In which case a RuntimeError is raised and rerun the job should solve the problem
-        hash_to_obj = dict()
-        mpos_hash: List[List] = []
-        for mpo in mpos:
-            mpo_hash = []
-            for m in mpo:
-                m_hash = hash(m)
-                if m_hash not in hash_to_obj:
-                    hash_to_obj[m_hash] = m
-                else:
-                    if not np.allclose(hash_to_obj[m_hash], m.array):
-                        raise RuntimeError("Rare hash collision")
-                mpo_hash.append(m_hash)
-            mpos_hash.append(mpo_hash)
-
+        # optimized way. The identity parts of the MPOs are replaced by the norm environments
+        # and the rest are contracted in batches. See `renormalizer.mps.expectation`
         if self_conj is None:
             self_conj = self._expectation_conj()
-        l_environ_dict = _construct_freq_environ(mpos_hash, hash_to_obj, self, "L", self_conj)
-        r_environ_dict = _construct_freq_environ(mpos_hash, hash_to_obj, self, "R", self_conj)
-        results = []
-        for mpo in mpos:
-            l_environ, l_idx = _get_freq_environ(l_environ_dict, mpo, "L", np.inf)
-            r_environ, r_idx = _get_freq_environ(r_environ_dict, mpo, "R", len(mpo)-l_idx-1)
-            for i in range(l_idx+1, r_idx):
-                l_environ = contract_one_site(l_environ, self[i], mpo[i], "L", self_conj[i])
-            results.append(complex(l_environ.flatten() @ r_environ.flatten()))  # cast to python type
-
-        results = np.array(results)
+        results = expectation_plan_cache.get_plan(mpos).evaluate(self, self_conj)
         if np.allclose(results.imag, 0):
             return results.real
         else:
@@ -865,15 +882,15 @@ class Mps(MatrixProduct):
             mps = self.to_complex()
 
         # the quantum number symmetry is used
-        qn_mask_list = []
+        layout_list = []
         position = [0]
         qntot = mps.qntot
         for imps in range(mps.site_num):
             mps.move_qnidx(imps)
             qnbigl, qnbigr, qnmat = mps._get_big_qn([imps])
-            qn_mask = get_qn_mask(qnmat, mps.qntot)
-            qn_mask_list.append(qn_mask)
-            position.append(position[-1]+np.sum(qn_mask))
+            layout = PackedLayout(get_qn_mask(qnmat, mps.qntot))
+            layout_list.append(layout)
+            position.append(position[-1] + layout.size)
 
         sw_min_list = []
         
@@ -883,7 +900,7 @@ class Mps(MatrixProduct):
 
             # update mps: from left to right
             for imps in range(mps.site_num):
-                mps[imps] = cvec2cmat(asnumpy(y[position[imps]:position[imps + 1]]), qn_mask_list[imps])
+                mps[imps] = layout_list[imps].unpack(y[position[imps]:position[imps + 1]])
             mpo = mpo_t(t, mps=mps)
 
             if self.evolve_config.method == EvolveMethod.tdvp_mu_vmf:
@@ -935,8 +952,8 @@ class Mps(MatrixProduct):
                             coef, ovlp_inv1=S_L_inv_list[imps+1],
                             ovlp_inv0=S_L_inv_list[imps], ovlp0=S_L_list[imps])
 
-                    hop_y[position[imps]:position[imps+1]] = func(0,
-                            mps[imps].array.ravel()).reshape(mps[imps].shape)[qn_mask_list[imps]]
+                    hop_y[position[imps]:position[imps+1]] = layout_list[imps].pack(func(0,
+                            mps[imps].array.ravel()).reshape(mps[imps].shape))
 
                     continue
 
@@ -994,12 +1011,12 @@ class Mps(MatrixProduct):
                         coef, ovlp_inv1=S_L_inv_list[imps+1],
                         ovlp_inv0=S_L_inv_list[imps], ovlp0=S_L_list[imps])
 
-                hop_y[position[imps]:position[imps+1]] = func(0,
-                        asxp(mps[imps].array.ravel())).reshape(mps[imps].shape)[qn_mask_list[imps]]
+                hop_y[position[imps]:position[imps+1]] = layout_list[imps].pack(func(0,
+                        asxp(mps[imps].array.ravel())).reshape(mps[imps].shape))
 
             return hop_y
 
-        init_y = xp.concatenate([asxp(ms.array[qn_mask_list[ims]]) for ims, ms in enumerate(mps)])
+        init_y = xp.concatenate([layout_list[ims].pack(asxp(ms.array)) for ims, ms in enumerate(mps)])
         # the ivp local error, please refer to the Scipy default setting
         sol = solve_ivp(
             func_vmf,
@@ -1012,7 +1029,7 @@ class Mps(MatrixProduct):
 
         # update mps: from left to right
         for imps in range(mps.site_num):
-            mps[imps] = cvec2cmat(asnumpy(sol.y[:, -1][position[imps]:position[imps + 1]]), qn_mask_list[imps])
+            mps[imps] = layout_list[imps].unpack(asnumpy(sol.y[:, -1][position[imps]:position[imps + 1]]))
 
         logger.info(f"{self.evolve_config.method} VMF func called: {sol.nfev}. RKF steps: {len(sol.t)}")
 
@@ -1206,7 +1223,7 @@ class Mps(MatrixProduct):
         return mps
 
     @adaptive_tdvp
-    def _evolve_tdvp_ps(self, mpo, evolve_dt) -> "Mps":
+    def _evolve_tdvp_ps(self, mpo, evolve_dt, n_sweep=2) -> "Mps":
         # PhysRevB.94.165116
         # TDVP projector splitting
         # one-site
@@ -1227,8 +1244,8 @@ class Mps(MatrixProduct):
 
         # statistics for debug output
         local_steps = []
-        # sweep for 2 rounds
-        for i in range(2):
+        # sweep for 2 rounds. A single sweep is a 1st-order integrator
+        for i in range(n_sweep):
             for imps in mps.iter_idx_list(full=True):
                 system = "L" if mps.to_right else "R"
                 l_array = environ.read("L", imps - 1)
@@ -1240,12 +1257,13 @@ class Mps(MatrixProduct):
                 if self.evolve_config.ivp_solver == "krylov":
                     mps_t, j = expm_krylov(
                         lambda y: hop(y.reshape(shape)).ravel(),
-                        -1j * evolve_dt / 2, mps[imps].ravel().array
+                        -1j * evolve_dt / n_sweep, mps[imps].ravel().array,
+                        tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
                     )
                 else:
                     sol = solve_ivp(
                         lambda t, y: hop(y.reshape(shape)).ravel() / coef,
-                        (0, evolve_dt/2),
+                        (0, evolve_dt/n_sweep),
                         mps[imps].ravel().array,
                         method=self.evolve_config.ivp_solver,
                         rtol=self.evolve_config.ivp_rtol,
@@ -1256,17 +1274,22 @@ class Mps(MatrixProduct):
                 local_steps.append(j)
                 mps_t = mps_t.reshape(shape)
 
-                qnbigl, qnbigr, _ = mps._get_big_qn([imps])
-                u, qnlset, v, qnrset = svd_qn.svd_qn(
-                    asnumpy(mps_t),
-                    qnbigl,
-                    qnbigr,
-                    mps.qntot,
-                    QR=True,
-                    system=system,
-                    full_matrices=False,
-                )
-                vt = v.T
+                expansion = mps.compress_config.subspace_expansion
+                if expansion is not None and imps != (len(mps) - 1 if mps.to_right else 0):
+                    environ_tensor = l_array if mps.to_right else r_array
+                    u, qnlset, vt, qnrset = mps._expand_subspace(mps_t, environ_tensor, mpo[imps], imps, expansion)
+                else:
+                    qnbigl, qnbigr, _ = mps._get_big_qn([imps])
+                    u, qnlset, v, qnrset = svd_qn.svd_qn(
+                        asnumpy(mps_t),
+                        qnbigl,
+                        qnbigr,
+                        mps.qntot,
+                        QR=True,
+                        system=system,
+                        full_matrices=False,
+                    )
+                    vt = v.T
 
                 if not mps.to_right and imps != 0:
                     mps[imps] = vt.reshape([-1] + shape[1:])
@@ -1283,12 +1306,13 @@ class Mps(MatrixProduct):
                     if self.evolve_config.ivp_solver == "krylov":
                         mps_t, j = expm_krylov(
                             lambda y: hop_u(y.reshape(shape_u)).ravel(),
-                            1j * evolve_dt / 2, u.ravel()
+                            1j * evolve_dt / n_sweep, u.ravel(),
+                            tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
                         )
                     else:
                         sol = solve_ivp(
                             lambda t, y: hop_u(y.reshape(shape_u)).ravel() / -coef,
-                            (0, evolve_dt/2),
+                            (0, evolve_dt/n_sweep),
                             u.ravel(),
                             method=self.evolve_config.ivp_solver,
                             rtol=self.evolve_config.ivp_rtol,
@@ -1316,12 +1340,13 @@ class Mps(MatrixProduct):
                     if self.evolve_config.ivp_solver == "krylov":
                         mps_t, j = expm_krylov(
                             lambda y: hop_svt(y.reshape(shape_svt)).ravel(),
-                            1j * evolve_dt / 2, vt.ravel()
+                            1j * evolve_dt / n_sweep, vt.ravel(),
+                            tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
                         )
                     else:
                         sol = solve_ivp(
                             lambda t, y: hop_svt(y.reshape(shape_svt)).ravel() / -coef,
-                            (0, evolve_dt/2),
+                            (0, evolve_dt/n_sweep),
                             vt.ravel(),
                             method=self.evolve_config.ivp_solver,
                             rtol=self.evolve_config.ivp_rtol,
@@ -1344,11 +1369,74 @@ class Mps(MatrixProduct):
 
         return mps
 
+    def _expand_subspace(self, ms, environ_tensor, mo, idx, weight):
+        r"""
+        Split the site ``ms`` in the sweep direction with an enlarged renormalized basis.
+        Used in place of the QR decomposition in one-site TDVP.
+
+        The basis is selected from the reduced density matrix of ``ms`` mixed with the projected residual
+        :math:`\hat H |\Psi\rangle`, where :math:`\hat H` is formed by
+        the environment ``environ_tensor`` and the local MPO ``mo``. The mixing ``weight`` is relative to the norm.
+        The new basis has no weight in the state, which is not changed except for the truncation.
+        The basis is populated when the bond is evolved.
+
+        Reference: C. Hubig et al. Phys. Rev. B 91, 155115 (2015)
+
+        Returns
+        -------
+        u, qnlset, vt, qnrset :
+            The same as the QR decomposition of ``ms`` by ``svd_qn``.
+            ``qnrset`` is ``None`` when sweeping to the right and ``qnlset`` is ``None`` otherwise.
+        """
+        qnbigl, qnbigr, _ = self._get_big_qn([idx])
+        ms, mo, environ_tensor = asxp(ms), asxp(mo), asxp(environ_tensor)
+        # the operator acts on the first physical leg
+        if self.to_right:
+            subscripts = "abc, bdef, cek -> adfk" if ms.ndim == 3 else "abc, bdef, cegk -> adgfk"
+            residual = asnumpy(oe.contract(subscripts, environ_tensor, mo, ms))
+            a = asnumpy(ms).reshape(-1, ms.shape[-1])
+            residual = residual.reshape(len(a), -1)
+            dm = a @ a.T.conj()
+            dm_residual = residual @ residual.T.conj()
+            qnbig = qnbigl
+        else:
+            subscripts = "bdef, lfk, cek -> bcdl" if ms.ndim == 3 else "bdef, lfk, cegk -> bcdgl"
+            residual = asnumpy(oe.contract(subscripts, mo, environ_tensor, ms))
+            a = asnumpy(ms).reshape(ms.shape[0], -1)
+            residual = residual.reshape(-1, a.shape[1])
+            dm = a.T @ a.conj()
+            dm_residual = residual.T @ residual.conj()
+            qnbig = qnbigr
+        residual_norm = np.trace(dm_residual).real
+        if 0 < residual_norm:
+            dm = dm + weight * np.trace(dm).real / residual_norm * dm_residual
+
+        # the enlarged basis could be in any quantum number sector.
+        # Sectors not reachable have no weight and are discarded
+        comp_qnbig = self.qntot - qnbig.reshape(-1, len(self.qntot))
+        if self.to_right:
+            u, s, qnnew = svd_qn.eigh_qn(dm, qnbig, comp_qnbig, self.qntot, system="L")
+        else:
+            u, s, qnnew = svd_qn.eigh_qn(dm, comp_qnbig, qnbig, self.qntot, system="R")
+
+        if self.compress_config.bonddim_should_set:
+            self.compress_config.set_bonddim(len(self)+1)
+        m_trunc = self.compress_config.compute_m_trunc(s, idx, self.to_right)
+        # numerical noise of the eigenvalues
+        m_trunc = min(m_trunc, max(int(np.sum(s > 1e-7 * s.max())), 1))
+        basis, _, qnset, _ = select_basis(u, s, qnnew, None, m_trunc)
+
+        if self.to_right:
+            return basis, qnset, basis.T.conj() @ a, None
+        else:
+            return a @ basis.conj(), None, basis.T, qnset
+
     @adaptive_tdvp
-    def _evolve_tdvp_ps2(self, mpo, evolve_dt) -> "Mps":
+    def _evolve_tdvp_ps2(self, mpo, evolve_dt, n_sweep=2) -> "Mps":
         # PhysRevB.94.165116
         # TDVP projector splitting
         # two-site
+        coef = None
         if np.iscomplex(evolve_dt):
             mps = self.copy()
             if self.evolve_config.ivp_solver != "krylov":
@@ -1360,14 +1448,18 @@ class Mps(MatrixProduct):
             if self.evolve_config.ivp_solver != "krylov":
                 coef = 1j
 
+        if self.evolve_config.parallel_segments is not None:
+            assert n_sweep == 2
+            return mps._evolve_tdvp_ps2_parallel(mpo, evolve_dt, coef)
+
         # construct the environment matrix
         # almost half is not used. Not a big deal.
         environ = Environ(mps, mpo)
 
         # statistics for debug output
         local_steps = []
-        # sweep for 2 rounds
-        for i in range(2):
+        # sweep for 2 rounds. A single sweep is a 1st-order integrator
+        for i in range(n_sweep):
             for imps in mps.iter_idx_list(full=False):
                 if mps.to_right:
                     lidx, cidx0, cidx1, ridx = range(imps - 1, imps + 3)
@@ -1390,13 +1482,14 @@ class Mps(MatrixProduct):
                 if self.evolve_config.ivp_solver == "krylov":
                     mps_t, j = expm_krylov(
                         lambda y: hop(y.reshape(ms2.shape)).ravel(),
-                        -1j * evolve_dt / 2,
-                        ms2.ravel()
+                        -1j * evolve_dt / n_sweep,
+                        ms2.ravel(),
+                        tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
                     )
                 else:
                     sol = solve_ivp(
                         lambda t, y: hop(y.reshape(ms2.shape)).ravel() / coef,
-                        (0, evolve_dt/2),
+                        (0, evolve_dt/n_sweep),
                         ms2.ravel(),
                         method=self.evolve_config.ivp_solver,
                         rtol=self.evolve_config.ivp_rtol,
@@ -1431,12 +1524,13 @@ class Mps(MatrixProduct):
                 if self.evolve_config.ivp_solver == "krylov":
                     mps_t, j = expm_krylov(
                         lambda y: hop(y.reshape(ms1.shape)).ravel(),
-                        1j * evolve_dt / 2, ms1.ravel()
+                        1j * evolve_dt / n_sweep, ms1.ravel(),
+                        tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
                     )
                 else:
                     sol = solve_ivp(
                         lambda t, y: hop(y.reshape(ms1.shape)).ravel() / -coef,
-                        (0, evolve_dt/2),
+                        (0, evolve_dt/n_sweep),
                         ms1.ravel(),
                         method=self.evolve_config.ivp_solver,
                         rtol=self.evolve_config.ivp_rtol,
@@ -1457,6 +1551,54 @@ class Mps(MatrixProduct):
         #logger.debug(f"current mps: {mps}")
         return mps
 
+    def _evolve_tdvp_ps2_parallel(self, mpo, evolve_dt, coef) -> "Mps":
+        # TDVP-PS2 with the real-space parallel sweeps, see ``renormalizer.mps.parallel``.
+        # Each pair (site) inside the segments is evolved by dt/2 twice,
+        # and the pair (site) at the boundaries is evolved by dt once in a sweep
+        local_steps = []
+
+        def propagate(ms, hop, dt, sign):
+            # ``sign`` is -1 for the backward evolution
+            if self.evolve_config.ivp_solver == "krylov":
+                mps_t, j = expm_krylov(
+                    lambda y: hop(y.reshape(ms.shape)).ravel(),
+                    -1j * sign * dt, ms.ravel(),
+                    tol=self.evolve_config.krylov_tol, max_dim=self.evolve_config.krylov_max_dim
+                )
+            else:
+                sol = solve_ivp(
+                    lambda t, y: hop(y.reshape(ms.shape)).ravel() / (sign * coef),
+                    (0, dt),
+                    ms.ravel(),
+                    method=self.evolve_config.ivp_solver,
+                    rtol=self.evolve_config.ivp_rtol,
+                    atol=self.evolve_config.ivp_atol,
+                )
+                mps_t, j = sol.y, sol.nfev
+            local_steps.append(j)
+            return mps_t.reshape(ms.shape)
+
+        def pair_solver(ms2, l_array, r_array, idx, scale):
+            ms2 = asxp(ms2)
+            hop = hop_expr(asxp(l_array), asxp(r_array), [mpo[idx], mpo[idx + 1]], ms2.shape)
+            return propagate(ms2, hop, evolve_dt * scale, 1),
+
+        def site_solver(ms1, l_array, r_array, idx, scale):
+            ms1 = asxp(ms1)
+            hop = hop_expr(asxp(l_array), asxp(r_array), [mpo[idx]], ms1.shape)
+            return propagate(ms1, hop, evolve_dt * scale, -1)
+
+        nsegments = self.evolve_config.parallel_segments
+        segmented = SegmentedMps(self, mpo, nsegments)
+        with parallel_executor(nsegments) as executor:
+            segmented.sweep(pair_solver, site_solver, executor)
+        mps = segmented.to_mps()
+
+        steps_stat = stats.describe(local_steps)
+        logger.debug(f"TDVP-PS Krylov space: {steps_stat}")
+        mps.evolve_config.stat = steps_stat
+        return mps
+
     def evolve_exact(self, h_mpo, evolve_dt, space):
         MPOprop = Mpo.exact_propagator(self.model, -1j * evolve_dt, space, -h_mpo.offset)
         new_mps = MPOprop.apply(self, canonicalise=True)
@@ -1485,6 +1627,45 @@ class Mps(MatrixProduct):
             res = np.tensordot(res, mt.array, axes=1).reshape(1, dim1, dim2)
         return res[0, :, 0]
     
+    def _rdm_environ(self):
+        r""" Environments of the norm :math:`\langle \Psi | \Psi \rangle` used by the
+        reduced density matrices. ``l_envs[i]`` contracts the sites left to ``i`` and
+        ``r_envs[i]`` contracts the sites right to ``i``. The legs are ``(bra, ket)``.
+        """
+        l_envs = [xp.ones((1, 1), dtype=self.dtype)]
+        for ms in self:
+            ms = asxp(ms)
+            tensor = xp.tensordot(l_envs[-1], ms.conj(), ([0], [0]))
+            legs = list(range(ms.ndim - 1))
+            l_envs.append(xp.tensordot(tensor, ms, (legs, legs)))
+        r_envs = [xp.ones((1, 1), dtype=self.dtype)]
+        for ims in reversed(range(self.site_num)):
+            ms = asxp(self[ims])
+            tensor = xp.tensordot(ms.conj(), r_envs[-1], ([-1], [0]))
+            legs = list(range(1, ms.ndim))
+            r_envs.append(xp.tensordot(tensor, ms, (legs, legs)))
+        # l_envs[i]: sites [0, i). r_envs[i]: sites (i, site_num)
+        return l_envs[:-1], r_envs[::-1][1:]
+
+    @staticmethod
+    def _open_site(ms, ltensor=None, rtensor=None):
+        # contract the bra and ket of ``ms`` with one of the environments except the physical leg.
+        # The legs of the result are (p_bra, p_ket, bond_bra, bond_ket) with ``ltensor``
+        # and (bond_bra, bond_ket, p_bra, p_ket) with ``rtensor``.
+        if ltensor is not None:
+            tensor = xp.tensordot(ltensor, ms.conj(), ([0], [0]))
+            if ms.ndim == 3:
+                tensor = xp.tensordot(tensor, ms, ([0], [0]))
+            else:
+                tensor = xp.tensordot(tensor, ms, ([0, 2], [0, 2]))
+        else:
+            tensor = xp.tensordot(ms.conj(), rtensor, ([-1], [0]))
+            if ms.ndim == 3:
+                tensor = xp.tensordot(tensor, ms, ([-1], [-1]))
+            else:
+                tensor = xp.tensordot(tensor, ms, ([2, -1], [2, -1]))
+        return tensor.transpose((0, 2, 1, 3))
+
     def calc_1site_rdm(self, idx=None):
         r""" Calculate 1-site reduced density matrix
         
@@ -1502,8 +1683,6 @@ class Mps(MatrixProduct):
             :math:`\{0:\rho_0, 1:\rho_1, \cdots\}`. The key is the index of the site.
         """
 
-        identity = Mpo.identity(self.model)
-        environ = Environ(self, identity, "R")
         if idx is None:
             idx = list(range(self.site_num))
         elif type(idx) is int:
@@ -1513,86 +1692,99 @@ class Mps(MatrixProduct):
         else:
             assert False
 
+        l_envs, r_envs = self._rdm_environ()
         rdm = {}
-        for ims, ms in enumerate(self):
-            ltensor = environ.GetLR(
-                "L", ims-1, self, identity, itensor=None, method="System"
-            )
-            rtensor = environ.GetLR(
-                "R", ims+1, self, identity, itensor=None, method="Enviro"
-            )
-            if ims not in idx:
-                continue
-
-            ltensor = ltensor.reshape(ltensor.shape[0], ltensor.shape[-1])
-            rtensor = rtensor.reshape(rtensor.shape[0], rtensor.shape[-1])
-            
-            tensor = tensordot(ltensor, ms.conj(), ([0],[0]))
-            tensor = tensordot(tensor, rtensor, ([-1],[0]))
+        for ims in idx:
+            ms = asxp(self[ims])
+            tensor = xp.tensordot(l_envs[ims], ms.conj(), ([0],[0]))
+            tensor = xp.tensordot(tensor, r_envs[ims], ([-1],[0]))
             if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([0,-1],[0,-1]))
+                tensor = xp.tensordot(tensor, ms, ([0,-1],[0,-1]))
             else:
-                tensor = tensordot(tensor, ms, ([0,-1,-2],[0,-1,-2]))
+                tensor = xp.tensordot(tensor, ms, ([0,-1,-2],[0,-1,-2]))
             assert xp.allclose(tensor, tensor.T.conj())
             rdm[ims] = asnumpy(tensor)
 
         return rdm
     
-    def calc_2site_rdm(self):
+    def calc_2site_rdm(self, pairs=None, cutoff=None):
         r""" Calculate 2-site reduced density matrix
         
         :math:`\rho_{ij} = \textrm{Tr}_{k \neq i, k \neq j} | \Psi \rangle \langle \Psi |`.
-        
+
+        All the density matrices are obtained in one left-to-right sweep.
+        The transfer tensors of all the left sites that are still required are stacked
+        and carried through the MPS together, so each site is contracted only once
+        per sweep with a single batched contraction. The cost is roughly
+        :math:`O(N^2 d^2 M^3)` and the memory is :math:`O(N d^2 M^2)`, where
+        ``N`` is the number of sites, ``d`` the physical dimension and ``M`` the bond dimension.
+
+        Parameters
+        ----------
+        pairs : list of tuple, optional
+            The site pairs to calculate. The order of the two indices does not matter.
+            Default is ``None``, which means all the pairs.
+        cutoff : int, optional
+            Only calculate the pairs :math:`(i, j)` with :math:`|i-j| \le` ``cutoff``.
+            Default is ``None``, which means no cutoff.
+
         Returns
         -------
         rdm: Dict
-            :math:`\{(0,1):\rho_{01}, (0,2):\rho_{02}, \cdots\}`. The key is a tuple of index of the site.
+            :math:`\{(0,1):\rho_{01}, (0,2):\rho_{02}, \cdots\}`. The key is a tuple of index of the site
+            with the smaller index first.
         """
-        
-        identity = Mpo.identity(self.model)
-        environ_R = Environ(self, identity, "R")
-        environ_L = Environ(self, identity, "L")
-        L_component = []
-        R_component = []
+        if pairs is None:
+            pairs = itertools.combinations(range(self.site_num), 2)
+        pairs = {tuple(sorted(pair)) for pair in pairs}
+        if cutoff is not None:
+            pairs = {(i, j) for i, j in pairs if j - i <= cutoff}
+        for i, j in pairs:
+            if i == j or i < 0 or self.site_num <= j:
+                raise ValueError(f"Invalid site pair: {(i, j)}")
+        # the right partners of each left site
+        partners = [[] for _ in range(self.site_num)]
+        for i, j in pairs:
+            partners[i].append(j)
+        last_partner = [max(js) if js else -1 for js in partners]
+
+        l_envs, r_envs = self._rdm_environ()
         rdm = {}
-        # first construct 1-site environment
-        for ims, ms in enumerate(self):
-            ltensor = environ_L.GetLR("L", ims-1, self, identity,
-                    itensor=None, method="Enviro")
-            ltensor = ltensor.reshape(ltensor.shape[0], ltensor.shape[-1])
-            tensor = tensordot(ltensor, ms.conj(), ([0],[0]))
-            if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([0],[0]))
-            elif ms.ndim == 4:
-                tensor = tensordot(tensor, ms, ([0,2],[0,2]))
-            L_component.append(tensor.transpose((0,2,1,3)))
-            
-            rtensor = environ_R.GetLR("R", ims+1, self, identity,
-                    itensor=None, method="Enviro")
-            rtensor = rtensor.reshape(rtensor.shape[0], rtensor.shape[-1])
-            tensor = tensordot(ms.conj(), rtensor, ([-1],[0]))
-            if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([-1],[-1]))
-            elif ms.ndim == 4:
-                tensor = tensordot(tensor, ms, ([2,-1],[2,-1]))
-            R_component.append(tensor.transpose((0,2,1,3)))
-        
-        # merge two 1-site environment together
-        for ims in range(self.site_num):
-            tensor = L_component[ims]
-            for jms in range(ims+1, self.site_num):
-                if jms != ims+1:
-                    kms = jms - 1
-                    tensor = tensordot(tensor, self[kms].conj(), ([2],[0]))
-                    if self[kms].ndim == 3:
-                        tensor = tensordot(tensor, self[kms], ([2,3],[0,1]))
-                    elif self[kms].ndim == 4:
-                        tensor = tensordot(tensor, self[kms], ([2,3,4],[0,1,2]))
-                
-                rtensor = R_component[jms]
-                res = tensordot(tensor, rtensor,
-                        ([2,3],[0,1])).transpose(0,2,1,3)
-                rdm[(ims, jms)] = asnumpy(res.reshape(res.shape[0]*res.shape[1],-1))
+        # stacked transfer tensors with legs (open sites, bond_bra, bond_ket)
+        stack = None
+        # the left sites in the stack and their physical dimensions
+        open_sites = []
+        for jms in range(self.site_num):
+            ms = asxp(self[jms])
+            if open_sites:
+                # close the transfer tensors at site j
+                rtensor = self._open_site(ms, rtensor=r_envs[jms])
+                res = xp.tensordot(stack, rtensor, ([1, 2], [0, 1]))
+                offset = 0
+                for ims, pdim in open_sites:
+                    if jms in partners[ims]:
+                        tensor = res[offset:offset + pdim ** 2].reshape(pdim, pdim, *res.shape[1:])
+                        tensor = tensor.transpose(0, 2, 1, 3)
+                        rdm[(ims, jms)] = asnumpy(tensor.reshape(tensor.shape[0]*tensor.shape[1], -1))
+                    offset += pdim ** 2
+                # drop the left sites that are finished
+                keep = [last_partner[ims] > jms for ims, _ in open_sites]
+                if not all(keep):
+                    rows = np.concatenate([np.full(pdim ** 2, k) for k, (_, pdim) in zip(keep, open_sites)])
+                    stack = stack[xp.asarray(np.flatnonzero(rows))]
+                    open_sites = [site for k, site in zip(keep, open_sites) if k]
+            if open_sites:
+                # carry the transfer tensors through site j
+                stack = xp.tensordot(stack, ms.conj(), ([1], [0]))
+                legs = list(range(ms.ndim - 1))
+                stack = xp.tensordot(stack, ms, ([leg + 1 for leg in legs], legs))
+            if jms < last_partner[jms]:
+                # open a new transfer tensor at site j
+                ltensor = self._open_site(ms, ltensor=l_envs[jms])
+                pdim = ltensor.shape[0]
+                ltensor = ltensor.reshape(pdim ** 2, *ltensor.shape[2:])
+                stack = ltensor if stack is None or not open_sites else xp.concatenate([stack, ltensor])
+                open_sites.append((jms, pdim))
         return rdm
     
     def calc_edof_rdm(self) -> np.ndarray:
@@ -1600,30 +1792,77 @@ class Mps(MatrixProduct):
         
         :math:`\rho_{ij} = \langle \Psi | a_i^\dagger a_j | \Psi \rangle`
 
+        The matrix is obtained by one left-to-right sweep. The transfer tensors with
+        :math:`a_i^\dagger` inserted are stacked and carried through the MPS together, and
+        :math:`a_j` is inserted at the site of each :math:`j` to close the stacked tensors
+        with the right environment. No MPO is constructed.
+
         .. note::
             This function is designed for single-electron system. Fermionic commutation relation is not considered.
         
         """
         
-        key = "edof_reduced_density_matrix"
-        n_e = self.model.n_edofs
         e_dofs = self.model.e_dofs
-        if key not in self.model.mpos:
-            mpos = []
-            for idx, dof1 in enumerate(e_dofs):
-                for dof2 in e_dofs[idx:]:
-                    op = Op(r"a^\dagger a", [dof1, dof2])
-                    mpo = Mpo(self.model, terms=op)
-                    mpos.append(mpo)
-            self.model.mpos[key] = mpos
-        else:
-            mpos = self.model.mpos[key]
-        expectations = deque(self.expectations(mpos))
+        n_e = self.model.n_edofs
         reduced_density_matrix = np.zeros((n_e, n_e), dtype=backend.complex_dtype)
-        for idx in range(n_e):
-            for jdx in range(idx, n_e):
-                reduced_density_matrix[idx, jdx] = expectations.popleft()
-                reduced_density_matrix[jdx, idx] = np.conj(reduced_density_matrix[idx, jdx])
+        # the indices of the electronic DoFs on each site
+        site_edofs = {}
+        for idx, dof in enumerate(e_dofs):
+            site_edofs.setdefault(self.model.dof_to_siteidx[dof], []).append(idx)
+        last_site = max(site_edofs.keys(), default=-1)
+
+        def apply_op(op_mats, ms):
+            # apply the local operators on the physical leg of the ket.
+            # The result has an extra leading leg for the operators
+            op_mats = xp.asarray(np.array(op_mats), dtype=ms.dtype)
+            return xp.moveaxis(xp.tensordot(op_mats, ms, ([2], [1])), 1, 2)
+
+        l_envs, r_envs = self._rdm_environ()
+        # stacked transfer tensors with legs (e_dofs, bond_bra, bond_ket)
+        stack = None
+        open_idx = []
+        for ims, ms in enumerate(self):
+            ms = asxp(ms)
+            basis = self.model.basis[ims]
+            idx_list = site_edofs.get(ims, [])
+            # the bra part shared by all the contractions. Legs: (bond_ket, p..., bond_bra)
+            bra = None
+            if stack is not None:
+                bra = xp.tensordot(stack, ms.conj(), ([1], [0]))
+            if idx_list:
+                # the pairs on the same site from the 1-site rdm
+                env = xp.tensordot(l_envs[ims], ms.conj(), ([0], [0]))
+                env = xp.tensordot(env, r_envs[ims], ([-1], [0]))
+                for idx in idx_list:
+                    for jdx in idx_list:
+                        op_mat = basis.op_mat(Op(r"a^\dagger a", [e_dofs[idx], e_dofs[jdx]]))
+                        ket = apply_op([op_mat], ms)[0]
+                        reduced_density_matrix[idx, jdx] = complex(xp.tensordot(env, ket, ms.ndim))
+                if bra is not None:
+                    # close the stacked tensors with the annihilation operators
+                    kets = apply_op([basis.op_mat(Op("a", e_dofs[jdx])) for jdx in idx_list], ms)
+                    res = xp.tensordot(xp.tensordot(bra, r_envs[ims], ([-1], [0])), kets,
+                            (list(range(1, ms.ndim + 1)), list(range(1, ms.ndim + 1))))
+                    res = asnumpy(res)
+                    for i, idx in enumerate(open_idx):
+                        for j, jdx in enumerate(idx_list):
+                            reduced_density_matrix[idx, jdx] = res[i, j]
+                            reduced_density_matrix[jdx, idx] = np.conj(res[i, j])
+            if ims == last_site:
+                break
+            if bra is not None:
+                # carry the stacked tensors through the site
+                legs = list(range(ms.ndim - 1))
+                stack = xp.tensordot(bra, ms, ([leg + 1 for leg in legs], legs))
+            if idx_list:
+                # open new transfer tensors with the creation operators
+                kets = apply_op([basis.op_mat(Op(r"a^\dagger", e_dofs[idx])) for idx in idx_list], ms)
+                legs = list(range(ms.ndim - 1))
+                tensor = xp.tensordot(l_envs[ims], ms.conj(), ([0], [0]))
+                tensor = xp.tensordot(tensor, kets, (legs, [leg + 1 for leg in legs]))
+                tensor = tensor.transpose(1, 0, 2)
+                stack = tensor if stack is None else xp.concatenate([stack, tensor])
+                open_idx.extend(idx_list)
 
         return reduced_density_matrix
     
@@ -1660,10 +1899,7 @@ class Mps(MatrixProduct):
             else:
                 rdm = self.calc_2site_rdm()
             
-            entropy = {}
-            for key, dm in rdm.items():
-                w, v = scipy.linalg.eigh(dm)
-                entropy[key] = calc_vn_entropy(w)
+            entropy = _rdm_entropy(rdm)
 
         elif entropy_type == "mutual":
             entropy = self.calc_2site_mutual_entropy()
@@ -1673,28 +1909,37 @@ class Mps(MatrixProduct):
             raise ValueError(f"unsupported entropy type {entropy_type}")
         return entropy
     
-    def calc_2site_mutual_entropy(self):
+    def calc_2site_mutual_entropy(self, pairs=None, cutoff=None):
         r""" 
         Calculate mutual entropy between two sites.
         
         :math:`m_{ij} = (s_i + s_j - s_{ij})/2`
             
         See Chemical Physics 323 (2006) 519–531
+
+        Parameters
+        ----------
+        pairs : list of tuple, optional
+            The site pairs to calculate. Default is ``None``, which means all the pairs.
+        cutoff : int, optional
+            Only calculate the pairs :math:`(i, j)` with :math:`|i-j| \le` ``cutoff``.
+            Default is ``None``, which means no cutoff.
         
         Returns
         -------
         mutual_entropy : 2d np.ndarry
-            mutual entropy with shape (nsite, nsite)
+            mutual entropy with shape (nsite, nsite). The elements of the pairs
+            not calculated are zero.
 
         """
-        entropy_1site = self.calc_entropy("1site")
-        entropy_2site = self.calc_entropy("2site")
+        entropy_2site = _rdm_entropy(self.calc_2site_rdm(pairs, cutoff))
+        sites = sorted(set(itertools.chain.from_iterable(entropy_2site.keys())))
+        entropy_1site = _rdm_entropy(self.calc_1site_rdm(sites))
         nsites = self.site_num
         mut_entropy = np.zeros((nsites, nsites))
-        for isite, jsite in itertools.combinations(range(nsites),2):
-            key = (isite, jsite) if (isite, jsite) in entropy_2site.keys() else (jsite, isite)
+        for (isite, jsite), entropy in entropy_2site.items():
             mut_entropy[isite, jsite] = (entropy_1site[isite] + entropy_1site[jsite] -
-                    entropy_2site[key]) / 2
+                    entropy) / 2
         mut_entropy += mut_entropy.T
         return mut_entropy
 
@@ -2012,72 +2257,3 @@ def min_abs(t1, t2):
         return t1
     else:
         return t2
-
-
-def _construct_freq_environ(mpos_hash: List[List[int]], hash_to_obj: Dict[int, Matrix], mps: Mps, domain: str, mps_conj):
-    """
-    Construct environment tensors that are most frequently shown in the group of MPOs
-    """
-    assert domain in ["L", "R"]
-    # count mpo sequence frequency
-    counter = Counter()
-    for mpo_hash in mpos_hash:
-        for i in range(1, len(mpo_hash)+1):
-            if domain == "L":
-                mpo_seq = mpo_hash[:i]
-            else:
-                mpo_seq = reversed(mpo_hash[-i:])
-            counter.update([tuple(mpo_seq)])
-
-    # transform the counter into a list of matrices.
-    # The most frequent sequences first. If the same freq, then shorter sequences first
-    # Note that shorter sequences are not less frequent than longer sequences
-    most_common = list(counter.items())
-    most_common.sort(key=lambda x: (-x[1], len(x[0])))
-    matrices_list = []
-    hash_list = []
-    for hashes, n in most_common:
-        # discard unique ones because they do not need to be cached
-        if n == 1:
-            break
-        # cache ``len(mps)`` sequences
-        # sequences with the same length may be treated differently.
-        if len(mps) < len(matrices_list):
-            break
-        hash_list.append(hashes)
-        matrices_list.append(list(map(hash_to_obj.get, hashes)))
-
-    # contract the tensors
-    result = {(): xp.ones((1, 1, 1), dtype=backend.real_dtype)}
-    for m_hashes, matrices in zip(hash_list, matrices_list):
-        environ = result[tuple(m_hashes[:-1])]
-        if domain == "L":
-            idx = len(matrices)-1
-        else:
-            idx = -len(matrices)
-        ms, ms_conj = mps[idx], mps_conj[idx]
-        result[tuple(m_hashes)] = contract_one_site(environ, ms, matrices[-1], domain=domain, ms_conj=ms_conj)
-    return result
-
-
-def _get_freq_environ(environ_dict, mpo, domain, max_length):
-    assert domain in ["L", "R"]
-
-    if domain == "L":
-        it = mpo
-    else:
-        it = reversed(mpo)
-
-    hashes = []
-    for mo in it:
-        hashes.append(hash(mo))
-        if (not tuple(hashes) in environ_dict) or (max_length < len(hashes)):
-            hashes.pop()
-            break
-    if domain == "L":
-        i = len(hashes) - 1
-    else:
-        i = len(mpo) - len(hashes)
-
-    environ = environ_dict[tuple(hashes)]
-    return environ, i
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+r"""
+Real-space parallel two-site sweeps.
+
+The chain is partitioned into segments and the two-site sweeps within each segment
+are carried out in parallel. Neighbouring segments sweep towards each other and
+meet at their common boundary, where the two-site problem across the boundary is solved
+and the environments of both segments are exchanged.
+The wavefunction is represented as
+
+.. math::
+    |\Psi\rangle = \Psi_0 V_1 \Psi_1 V_2 \cdots \Psi_{n-1}
+
+where :math:`\Psi_s` are the site tensors of the segments and :math:`V_b` is the (pseudo-)inverse
+of the bond matrix at the boundary :math:`b`, which is :math:`\Lambda_b^{-1}` after the boundary is updated.
+
+Reference: E. M. Stoudenmire and S. R. White, Phys. Rev. B 87, 155137 (2013);
+P. Secular et al., Phys. Rev. B 101, 235123 (2020)
+
+In time evolution, the two segments next to a boundary evolve independently before they are merged
+by :math:`\Lambda_b^{-1}`, which introduces an error of :math:`O(\tau^2/\lambda_{\textrm{min}})` per step
+where :math:`\lambda_{\textrm{min}}` is the smallest singular value kept at the boundary.
+The parallel sweeps are therefore suitable for entangled states with small time steps.
+For nearly product states the sequential sweeps should be used.
+
+The segments are processed by threads because the heavy work is done by BLAS,
+which releases the GIL. The number of BLAS threads is limited so that
+the total number of threads does not exceed the number of cores.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from renormalizer.mps import svd_qn
+from renormalizer.mps.backend import threadpoolctl
+from renormalizer.mps.lib import contract_one_site
+from renormalizer.mps.matrix import asnumpy, asxp
+from renormalizer.mps.svd_qn import add_outer
+
+logger = logging.getLogger(__name__)
+
+# singular values below this (relative to the largest) are not inverted at the boundaries.
+# Inverting tiny singular values amplifies the error of the boundary recombination
+INVERSE_RCOND = 1e-6
+
+
+def inverse_singular_values(s: np.ndarray) -> np.ndarray:
+    # singular values below the threshold are discarded rather than amplified
+    s_inv = np.zeros_like(s)
+    mask = s > INVERSE_RCOND * s.max()
+    s_inv[mask] = 1 / s[mask]
+    return s_inv
+
+
+def regularized_inverse(matrix: np.ndarray) -> np.ndarray:
+    # pseudo-inverse of the bond matrix, see ``inverse_singular_values``
+    u, s, vh = np.linalg.svd(matrix, full_matrices=False)
+    return vh.T.conj() @ np.diag(inverse_singular_values(s)) @ u.T.conj()
+
+
+def available_cores() -> int:
+    # respect the CPU affinity of the process, e.g., set by the job scheduler
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+@contextmanager
+def parallel_executor(nworkers: Optional[int]):
+    """
+    Thread pool with ``nworkers`` workers. ``None`` is yielded if ``nworkers`` is ``None`` or not larger than 1.
+    The BLAS threads are limited so that the total number of threads does not exceed the number of cores.
+    """
+    if nworkers is None or nworkers <= 1:
+        yield None
+        return
+    blas_threads = max(1, available_cores() // nworkers)
+    if threadpoolctl is None:
+        logger.warning("threadpoolctl is not installed. BLAS threads may be oversubscribed by the workers.")
+        limits = nullcontext()
+    else:
+        limits = threadpoolctl.threadpool_limits(limits=blas_threads, user_api="blas")
+    with limits, ThreadPoolExecutor(max_workers=nworkers) as executor:
+        yield executor
+
+
+def pmap(executor: Optional[ThreadPoolExecutor], func, *iterables) -> List:
+    # map in parallel if the executor is available
+    if executor is None:
+        return list(map(func, *iterables))
+    return list(executor.map(func, *iterables))
+
+
+def split_segments(site_num: int, nsegments: int) -> List[range]:
+    """
+    Partition the sites into ``nsegments`` consecutive segments of (almost) equal length.
+    Each segment has at least two sites.
+    """
+    nsegments = max(1, min(nsegments, site_num // 2))
+    bounds = np.linspace(0, site_num, nsegments + 1).round().astype(int)
+    return [range(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class SegmentedMps:
+    r"""
+    MPS partitioned into segments for real-space parallel two-site sweeps.
+
+    A sweep consists of two phases. In the first phase the even segments sweep to the right
+    and the odd segments sweep to the left, and they meet at the right boundaries of the even segments.
+    In the second phase the directions are reversed and the segments meet at the right boundaries
+    of the odd segments.
+
+    Parameters
+    ----------
+    mps : :class:`~renormalizer.mps.Mps`
+        The MPS. Not modified.
+    mpo : :class:`~renormalizer.mps.Mpo`
+        The operator that forms the environments.
+    nsegments : int
+        The number of segments. Reduced if the MPS is too short.
+    compress_config : :class:`~renormalizer.utils.configs.CompressConfig`, optional
+        The truncation after each two-site update. Default is the compress config of ``mps``.
+    """
+
+    def __init__(self, mps, mpo, nsegments: int, compress_config=None):
+        self.mps = mps
+        self.mpo = mpo
+        self.site_num = site_num = len(mps)
+        self.qntot = np.array(mps.qntot)
+        self.segments = split_segments(site_num, nsegments)
+        self.compress_config = mps.compress_config if compress_config is None else compress_config
+        if self.compress_config.bonddim_should_set:
+            self.compress_config.set_bonddim(site_num + 1)
+
+        lc = mps.copy().ensure_left_canonical()
+        rc = mps.copy().ensure_right_canonical()
+
+        # the boundaries are the indices of the bonds between the segments
+        self.boundaries = [seg.start for seg in self.segments[1:]]
+        # bond matrices between the left-canonical basis and the right-canonical basis
+        bond_matrices = {}
+        tensor = np.ones((1, 1))
+        for isite in range(site_num - 1):
+            tensor = self._transfer(tensor, lc[isite], rc[isite])
+            if isite + 1 in self.boundaries:
+                bond_matrices[isite + 1] = tensor
+
+        # the site tensors. The canonical center is at the start of the even segments
+        # and at the end of the odd segments
+        self.ms = [None] * site_num
+        # L-block quantum numbers of the right bond of site i-1 (qn_left[i])
+        # and the left bond of site i (qn_right[i]). They are different at the boundaries
+        self.qn_left = [None] * (site_num + 1)
+        self.qn_right = [None] * (site_num + 1)
+        for iseg, seg in enumerate(self.segments):
+            even = iseg % 2 == 0
+            canonical = rc if even else lc
+            for isite in seg:
+                self.ms[isite] = asnumpy(canonical[isite])
+            for ibond in range(seg.start + 1, seg.stop):
+                self.qn_left[ibond] = self.qn_right[ibond] = canonical._get_lqn(ibond)
+            # move the canonical center to the start (end) of the even (odd) segments
+            if even and seg.start in bond_matrices:
+                self.ms[seg.start] = np.tensordot(bond_matrices[seg.start], self.ms[seg.start], 1)
+                self.qn_right[seg.start] = lc._get_lqn(seg.start)
+            else:
+                self.qn_right[seg.start] = canonical._get_lqn(seg.start)
+            if not even and seg.stop in bond_matrices:
+                self.ms[seg.stop - 1] = np.tensordot(self.ms[seg.stop - 1], bond_matrices[seg.stop], 1)
+                self.qn_left[seg.stop] = rc._get_lqn(seg.stop)
+            else:
+                self.qn_left[seg.stop] = canonical._get_lqn(seg.stop)
+        self.qn_left[0] = self.qn_right[0]
+        self.qn_right[site_num] = self.qn_left[site_num]
+
+        # pseudo-inverse of the bond matrices at the boundaries
+        self.inverse = {b: regularized_inverse(bond_matrices[b]) for b in self.boundaries}
+
+        # the environments. ``("L", i)`` contracts the sites up to i and ``("R", i)`` from i.
+        # The keys used by different segments do not overlap
+        self.environ = {("L", -1): np.ones((1, 1, 1)), ("R", site_num): np.ones((1, 1, 1))}
+        tensor = self.environ[("L", -1)]
+        for isite in range(site_num - 1):
+            tensor = asnumpy(contract_one_site(asxp(tensor), lc[isite], mpo[isite], "L"))
+            self.environ[("L", isite)] = tensor
+        tensor = self.environ[("R", site_num)]
+        for isite in range(site_num - 1, 0, -1):
+            tensor = asnumpy(contract_one_site(asxp(tensor), rc[isite], mpo[isite], "R"))
+            self.environ[("R", isite)] = tensor
+
+    @staticmethod
+    def _transfer(tensor, ms_l, ms_r):
+        # contract one site of <ms_l|ms_r>. Legs of tensor: (ms_l, ms_r)
+        ms_l, ms_r = asnumpy(ms_l), asnumpy(ms_r)
+        tensor = np.tensordot(tensor, ms_l.conj(), ([0], [0]))
+        legs = list(range(ms_r.ndim - 1))
+        return np.tensordot(tensor, ms_r, (legs, legs))
+
+    def _get_big_qn(self, idx: int):
+        # the super-L-block and super-R-block quantum numbers of the sites (idx, idx+1)
+        sigmaqn0 = np.array(self.mps._get_sigmaqn(idx))
+        sigmaqn1 = np.array(self.mps._get_sigmaqn(idx + 1))
+        qnbigl = add_outer(np.array(self.qn_right[idx]), sigmaqn0)
+        qnbigr = add_outer(sigmaqn1, self.qntot - np.array(self.qn_left[idx + 2]))
+        qnmat = add_outer(qnbigl, qnbigr)
+        return qnbigl, qnbigr, qnmat
+
+    def _split(self, c, idx: int, to_right: bool):
+        # split the two-site tensor with truncation. The canonical center is moved according to ``to_right``
+        qnbigl, qnbigr, _ = self._get_big_qn(idx)
+        u, s, qnlset, v, _, _ = svd_qn.svd_qn(
+            asnumpy(c), qnbigl, qnbigr, self.qntot, system="L" if to_right else "R", full_matrices=False
+        )
+        if to_right:
+            m_trunc = self.compress_config.compute_m_trunc(s, idx, True)
+        else:
+            m_trunc = self.compress_config.compute_m_trunc(s, idx + 1, False)
+        u, s, v = u[:, :m_trunc], s[:m_trunc], v[:, :m_trunc]
+        qn = np.array(qnlset[:m_trunc])
+        u = u.reshape(list(qnbigl.shape[:-1]) + [m_trunc])
+        vt = v.T.reshape([m_trunc] + list(qnbigr.shape[:-1]))
+        self.qn_left[idx + 1] = self.qn_right[idx + 1] = qn
+        return u, s, vt
+
+    def pair(self, idx: int):
+        """
+        The two-site tensor of ``idx`` and ``idx+1`` and the environments.
+        """
+        c = np.tensordot(self.ms[idx], self.ms[idx + 1], 1)
+        return c, self.environ[("L", idx - 1)], self.environ[("R", idx + 2)]
+
+    def sweep_segment(self, iseg: int, to_right: bool, pair_solver: Callable, site_solver: Callable = None):
+        """
+        Sweep the segment. The boundary is not included.
+
+        Parameters
+        ----------
+        iseg : int
+            The index of the segment
+        to_right : bool
+            The direction of the sweep.
+        pair_solver : callable
+            ``pair_solver(c, ltensor, rtensor, idx, scale)`` returns the updated two-site tensor ``c``
+            of the sites ``idx`` and ``idx+1`` followed by other results. ``scale`` is the fraction of
+            the time step in time evolution algorithms.
+        site_solver : callable, optional
+            ``site_solver(c, ltensor, rtensor, idx, scale)`` returns the updated one-site tensor
+            of the site ``idx``. Used for the backward evolution in TDVP.
+
+        Returns
+        -------
+        results : list
+            The results of ``pair_solver`` other than the updated tensor.
+        """
+        seg = self.segments[iseg]
+        results = []
+        mpo = self.mpo
+        if to_right:
+            pairs = range(seg.start, seg.stop - 1)
+        else:
+            pairs = range(seg.stop - 2, seg.start - 1, -1)
+        for i, idx in enumerate(pairs):
+            c, ltensor, rtensor = self.pair(idx)
+            c, *res = pair_solver(c, ltensor, rtensor, idx, 0.5)
+            results.extend(res)
+            u, s, vt = self._split(c, idx, to_right)
+            if to_right:
+                self.ms[idx] = u
+                self.ms[idx + 1] = np.tensordot(np.diag(s), vt, 1)
+                center = idx + 1
+                ltensor = contract_one_site(asxp(ltensor), u, mpo[idx], "L")
+                self.environ[("L", idx)] = asnumpy(ltensor)
+            else:
+                self.ms[idx] = np.tensordot(u, np.diag(s), 1)
+                self.ms[idx + 1] = vt
+                center = idx
+                rtensor = contract_one_site(asxp(rtensor), vt, mpo[idx + 1], "R")
+                self.environ[("R", idx + 1)] = asnumpy(rtensor)
+            # the backward evolution of the sites at the boundaries is carried out in ``merge``
+            if site_solver is None or i == len(pairs) - 1:
+                continue
+            self.ms[center] = asnumpy(site_solver(self.ms[center], ltensor, rtensor, center, 0.5))
+        return results
+
+    def _evolve_boundary_sites(self, boundary: int, site_solver: Callable, scale: float):
+        # backward evolution of the two sites at the boundary, each of which is the center
+        # of the segment it belongs to
+        idx = boundary - 1
+        self.ms[idx] = asnumpy(site_solver(
+            self.ms[idx], self.environ[("L", idx - 1)], self.environ[("R", idx + 1)], idx, scale
+        ))
+        self.ms[idx + 1] = asnumpy(site_solver(
+            self.ms[idx + 1], self.environ[("L", idx)], self.environ[("R", idx + 2)], idx + 1, scale
+        ))
+
+    def merge(self, boundary: int, pair_solver: Callable, site_solver: Callable = None, scale: float = 1):
+        """
+        Update the two sites across the boundary with ``pair_solver`` and exchange the environments.
+        If ``site_solver`` is provided, the backward evolution of the two sites is split evenly
+        before and after the update to keep the time step symmetric.
+        """
+        if site_solver is not None:
+            self._evolve_boundary_sites(boundary, site_solver, scale / 2)
+        idx = boundary - 1
+        c = np.tensordot(np.tensordot(self.ms[idx], self.inverse[boundary], 1), self.ms[idx + 1], 1)
+        ltensor, rtensor = self.environ[("L", idx - 1)], self.environ[("R", idx + 2)]
+        c, *res = pair_solver(c, ltensor, rtensor, idx, scale)
+        u, s, vt = self._split(c, idx, True)
+        self.ms[idx] = np.tensordot(u, np.diag(s), 1)
+        self.ms[idx + 1] = np.tensordot(np.diag(s), vt, 1)
+        self.inverse[boundary] = np.diag(inverse_singular_values(s))
+        self.environ[("L", idx)] = asnumpy(contract_one_site(asxp(ltensor), u, self.mpo[idx], "L"))
+        self.environ[("R", idx + 1)] = asnumpy(contract_one_site(asxp(rtensor), vt, self.mpo[idx + 1], "R"))
+        if site_solver is not None:
+            self._evolve_boundary_sites(boundary, site_solver, scale / 2)
+        return res
+
+    def sweep(self, pair_solver: Callable, site_solver: Callable = None, executor: ThreadPoolExecutor = None):
+        """
+        A full sweep of the two phases. The boundaries at the right end of the odd segments
+        are updated by half at the start and half at the end of the sweep,
+        so that the sweep is symmetric in time as the sequential two-site TDVP.
+
+        Returns
+        -------
+        results : list
+            The results of ``pair_solver`` other than the updated tensor.
+        """
+        results = []
+
+        def merge_all(boundaries, scale):
+            for res in pmap(executor, lambda b: self.merge(b, pair_solver, site_solver, scale), boundaries):
+                results.extend(res)
+
+        nsegments = len(self.segments)
+        # boundaries at the right end of the even and odd segments
+        boundaries = [[seg.stop for seg in self.segments[parity:-1:2]] for parity in range(2)]
+        merge_all(boundaries[1], 0.5)
+        for phase in range(2):
+            # even segments sweep to the right in the first phase and odd segments in the second phase
+            seg_results = pmap(
+                executor,
+                lambda iseg: self.sweep_segment(iseg, iseg % 2 == phase, pair_solver, site_solver),
+                range(nsegments),
+            )
+            for res in seg_results:
+                results.extend(res)
+            merge_all(boundaries[phase], 1 if phase == 0 else 0.5)
+        return results
+
+    def to_mps(self):
+        """
+        The MPS in the left-canonical form.
+        """
+        mps = self.mps.copy()
+        for isite in range(self.site_num):
+            ms = self.ms[isite]
+            if isite + 1 in self.inverse:
+                ms = np.tensordot(ms, self.inverse[isite + 1], 1)
+            mps[isite] = ms
+        qn = [np.array(q).tolist() for q in self.qn_right]
+        # the convention of the last bond
+        qn[-1] = (self.qntot - np.array(self.qn_right[-1])).tolist()
+        mps.qn = qn
+        mps.qnidx = self.site_num - 1
+        mps.to_right = False
+        mps.move_qnidx(0)
+        mps.to_right = True
+        return mps.canonicalise()
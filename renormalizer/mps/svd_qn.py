@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 # Author: Jiajun Ren <jiajunren0522@gmail.com>
 import logging
+from typing import Union
 
 import scipy.linalg
 
 from renormalizer.mps.backend import np, backend
+from renormalizer.mps.block_sparse import BlockSparseTensor
 
 logger = logging.getLogger(__name__)
 
@@ -97,7 +99,7 @@ def blockrecover(indices, U, dim):
 
 
 def svd_qn(
-        coef_array: np.ndarray,
+        coef_array: Union[np.ndarray, BlockSparseTensor],
         qnbigl: np.ndarray,
         qnbigr: np.ndarray,
         qntot: np.ndarray,
@@ -111,8 +113,10 @@ def svd_qn(
 
     Parameters
     ----------
-    coef_array : np.ndarray
-        The coefficient array to be decomposed
+    coef_array : Union[np.ndarray, BlockSparseTensor]
+        The coefficient array to be decomposed. If a
+        :class:`~renormalizer.mps.block_sparse.BlockSparseTensor` is provided, the blocks are
+        gathered directly from the stored symmetry sectors without forming the dense array.
     qnbigl : np.ndarray
         Quantum number of the left side (aka the super-L-block quantum number).
         Corresponds to the first index (or indices) of ``cstruct``.
@@ -154,7 +158,11 @@ def svd_qn(
         New quantum number for V (super-R-block).
     """
     SVD = not QR
-    coef_matrix = coef_array.reshape((np.prod(qnbigl.shape[:-1]), np.prod(qnbigr.shape[:-1])))
+    matrix_shape = (int(np.prod(qnbigl.shape[:-1])), int(np.prod(qnbigr.shape[:-1])))
+    if isinstance(coef_array, BlockSparseTensor):
+        coef_matrix = None
+    else:
+        coef_matrix = coef_array.reshape(matrix_shape)
 
     assert qntot.ndim == 1
     qn_size = len(qntot)
@@ -180,9 +188,12 @@ def svd_qn(
         if len(rset) == 0:
             continue
         lset = np.where(get_qn_mask(localqnl, nl))[0]
-        block = coef_matrix.ravel().take(
-            (lset * coef_matrix.shape[1]).reshape(-1, 1) + rset
-        )
+        if coef_matrix is None:
+            block = coef_array.matrix_block(qnbigl.ndim - 1, lset, rset)
+        else:
+            block = coef_matrix.ravel().take(
+                (lset * coef_matrix.shape[1]).reshape(-1, 1) + rset
+            )
         dim = min(block.shape)
         if SVD:
             block_u, block_s, block_vt = optimized_svd(
@@ -205,11 +216,11 @@ def svd_qn(
 
         blockappend(
             block_u_list, block_u_list0, qnl_list, qnl_list0, block_su_list0,
-            block_u, nl, dim, lset, coef_matrix.shape[0], full_matrices=full_matrices,
+            block_u, nl, dim, lset, matrix_shape[0], full_matrices=full_matrices,
         )
         blockappend(
             block_v_list, block_v_list0, qnr_list, qnr_list0, block_sv_list0,
-            block_vt.T, nr, dim, rset, coef_matrix.shape[1], full_matrices=full_matrices,
+            block_vt.T, nr, dim, rset, matrix_shape[1], full_matrices=full_matrices,
         )
 
     # sanity check
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 import itertools
-from collections import namedtuple, OrderedDict
+import time
+from collections import namedtuple, OrderedDict, defaultdict
 from typing import List, Set, Tuple, Dict
 
 import numpy as np
@@ -20,16 +21,19 @@ logger = logging.getLogger(__name__)
 OpTuple = namedtuple("OpTuple", ["symbol", "qn", "factor"])
 
 
-def construct_symbolic_mpo(table, factor, algo="Hopcroft-Karp"):
+def construct_symbolic_mpo(table, factor, algo="Hopcroft-Karp", primary_ops=None):
     r"""
     A General Compact (Symbolic) MPO Construction Routine
 
     Args:
 
     table: an operator table with shape (operator nterm, nsite). Each entry contains elementary operators on each site.
+        If ``primary_ops`` is provided, each entry is instead the index of the elementary operator in ``primary_ops``
+        (as returned by ``_terms_to_table``).
     factor (np.ndarray): one prefactor vector (dim: operator nterm)
     algo: the algorithm used to select local ops, "Hopcroft-Karp"(default), "Hungarian".
           They are both global optimal and have only minor performance difference.
+    primary_ops: the elementary operators referred by the integer table.
 
     Note:
     op with the same op.symbol must have the same op.qn and op.factor
@@ -103,17 +107,20 @@ def construct_symbolic_mpo(table, factor, algo="Hopcroft-Karp"):
     The local mpo is the transformation matrix between 0'',1'' to 0'''
     """
 
-    qn_size = len(table[0][0].qn)
+    if primary_ops is None:
+        table, primary_ops = _op_table_to_int(table)
+    qn_size = len(primary_ops[0].qn)
     # Simplest case. Cut to the chase
     if len(table) == 1:
         # The first layer: number of sites. The middle array: in and out virtual bond
         # the 4th layer: operator sums
         mpo: List[np.ndarray[List[Op]]] = []
         mpoqn = [np.zeros((1, qn_size), dtype=int)]
-        primary_ops = list(set(table[0]))
+        table_ops = [primary_ops[i] for i in table[0]]
+        primary_ops = list(set(table_ops))
         op2idx = dict(zip(primary_ops, range(len(primary_ops))))
         out_ops_list: List[List[OpTuple]] = [[OpTuple([0], qn=0, factor=1)]]
-        for op in table[0]:
+        for op in table_ops:
             mo = np.full((1, 1), None)
             mo[0][0] = [op]
             mpo.append(mo)
@@ -133,7 +140,8 @@ def construct_symbolic_mpo(table, factor, algo="Hopcroft-Karp"):
     logger.debug(f"symbolic mpo algorithm: {algo}")
     logger.debug(f"Input operator terms: {len(table)}")
 
-    table, factor, primary_ops = _transform_table(table, factor)
+    time_start = time.time()
+    table, factor = _transform_table(table, factor)
 
     # add the first and last column for convenience
     ta = np.zeros((table.shape[0], 1), dtype=np.uint16)
@@ -145,13 +153,17 @@ def construct_symbolic_mpo(table, factor, algo="Hopcroft-Karp"):
 
     in_ops = [[OpTuple([0], qn=np.zeros(qn_size, dtype=int), factor=1)]]
 
+    time_table = time.time()
     out_ops_list = _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo)
     # number of sites + 1. Note that the table was expanded for convenience
     assert len(out_ops_list) == len(table[0]) - 1
+    time_matching = time.time()
     mpo = []
     for i in range(len(out_ops_list)-1):
         mo = compose_symbolic_mo(out_ops_list[i], out_ops_list[i+1], primary_ops)
         mpo.append(mo)
+    logger.debug(f"Symbolic MPO time cost. Table: {time_table - time_start:.2f}s, "
+                 f"matching: {time_matching - time_table:.2f}s, composing: {time.time() - time_matching:.2f}s")
 
     mpoqn = []
     for out_ops in out_ops_list:
@@ -175,6 +187,7 @@ def _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo="Hopcroft-K
         table_row = table[:, :2]
         table_col = table[:, 2:]
         out_ops, table, factor = _construct_symbolic_mpo_one_site(table_row, table_col, [in_ops], factor, primary_ops, algo)
+        logger.debug(f"site {isite + 1}/{nsite} done. bond dimension: {len(out_ops)}, remaining terms: {len(table)}")
 
         # debug
         # logger.debug(f"in_ops: {in_ops}")
@@ -193,28 +206,21 @@ def _construct_symbolic_mpo_one_site(table_row, table_col, in_ops_list, factor,
     term_row, row_unique_inverse = np.unique(table_row, axis=0, return_inverse=True)
     assert len(in_ops_list) + k == term_row.shape[1]
 
-    # faster version of the following code
-    # term_col, col_unique_inverse = np.unique(table_col, axis=0, return_inverse=True)
-    term_col = {}
-    col_unique_inverse = []
-    for row in table_col:
-        row_bytes = row.tobytes()
-        i_and_row = term_col.get(row_bytes)
-        if i_and_row is None:
-            i_and_row = (len(term_col), row)
-            term_col[row_bytes] = i_and_row
-        col_unique_inverse.append(i_and_row[0])
-    term_col = [v[1] for v in term_col.values()]
+    row_unique_inverse = row_unique_inverse.reshape(-1)
+    # the unique cols in the order of the first appearance
+    term_col, col_unique_inverse = _unique_rows(table_col)
 
     # get the non_redudant ops
     # the +1 trick is to use the csr sparse matrix format
-    non_red = scipy.sparse.diags(np.arange(1, table_row.shape[0] + 1), format="csr", dtype=np.uint32)
-    coord = np.array([[newidx, oldidx] for oldidx, newidx in enumerate(row_unique_inverse)])
-    mask = scipy.sparse.csr_matrix((np.ones(len(coord), dtype=np.uint32), (coord[:, 0], coord[:, 1])))
-    non_red = mask.dot(non_red)
-    coord = np.array([[oldidx, newidx] for oldidx, newidx in enumerate(col_unique_inverse)])
-    mask = scipy.sparse.csr_matrix((np.ones(len(coord), dtype=np.uint32), (coord[:, 0], coord[:, 1])))
-    non_red = non_red.dot(mask)
+    # in each row the cols are arranged by the index of the term.
+    # The order affects the bipartite matching result
+    term_idx = np.argsort(row_unique_inverse, kind="stable")
+    indptr = np.zeros(len(term_row) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(row_unique_inverse, minlength=len(term_row)))
+    non_red = scipy.sparse.csr_matrix(
+        ((term_idx + 1).astype(np.uint32), col_unique_inverse[term_idx], indptr),
+        shape=(len(term_row), len(term_col)),
+    )
     # use sparse matrix to represent non_red will be inefficient a little
     # bit compared to dense matrix, but saves a lot of memory when the
     # number of terms is huge
@@ -305,92 +311,156 @@ def _terms_to_table(model: Model, terms: List[Op], const: float):
     r"""
     constructing a general operator table
     according to model.model and model.order
-    """
 
-    table = []
-    factor_list = []
-    
-    dummy_table_entry = []
+    Returns the integer table with shape (nterm, nsite), in which each entry is the index
+    of the elementary operator in ``primary_ops``, the factors and ``primary_ops``.
+    """
+    time_start = time.time()
+    nsite = len(model.basis)
+    dof_to_siteidx = model.dof_to_siteidx
+
+    # elementary operator -> index in primary_ops
+    op2idx: Dict[Op, int] = {}
+    # a cheaper key to identify the elementary operator -> index in primary_ops
+    key2idx: Dict[Tuple, int] = {}
+    primary_ops: List[Op] = []
+
+    def get_idx(key, op_info):
+        idx = key2idx.get(key)
+        if idx is None:
+            if isinstance(op_info, Op):
+                op = op_info
+            else:
+                symbol, dofs, qn_list = op_info
+                op = Op(symbol, dofs, qn=qn_list)
+            idx = op2idx.get(op)
+            if idx is None:
+                idx = len(primary_ops)
+                op2idx[op] = idx
+                primary_ops.append(op)
+            key2idx[key] = idx
+        return idx
+
+    identity_ops = []
     for b in model.basis:
         if b.multi_dof:
             dof = b.dof[0]
         else:
             dof = b.dof
-        op = Op.identity(dof, qn_size=model.qn_size)
-        dummy_table_entry.append(op)
-    for op in terms:
-        elem_ops, factor = op.split_elementary(model.dof_to_siteidx)
-        table_entry = dummy_table_entry.copy()
-        for elem_op in elem_ops:
-            # it is ensured in `elem_op` every symbol is on the same site
-            site_idx = model.dof_to_siteidx[elem_op.dofs[0]]
-            table_entry[site_idx] = elem_op
-        table.append(table_entry)
-        factor_list.append(factor)
+        identity_ops.append(Op.identity(dof, qn_size=model.qn_size))
+    # index of the identity operator on each site. -1 if not registered yet
+    identity_idx = np.full(nsite, -1, dtype=np.int64)
+
+    nterm = len(terms) + (const != 0)
+    assert nterm < np.iinfo(np.uint32).max
+    table = np.empty((nterm, nsite), dtype=np.uint16)
+    factor_list = []
+    for iterm, op in enumerate(terms):
+        # site index -> (key, op_info) of the elementary operator
+        elem_ops = _split_elementary_key(op, dof_to_siteidx)
+        # register the ops in the order of the sites to be consistent with
+        # the row-major traversal of the table
+        if identity_idx.min() < 0:
+            for isite in range(nsite):
+                if isite in elem_ops:
+                    table[iterm, isite] = get_idx(*elem_ops[isite])
+                else:
+                    if identity_idx[isite] < 0:
+                        identity_idx[isite] = get_idx(("I", isite), identity_ops[isite])
+                    table[iterm, isite] = identity_idx[isite]
+        else:
+            table[iterm] = identity_idx
+            for isite in sorted(elem_ops):
+                table[iterm, isite] = get_idx(*elem_ops[isite])
+        factor_list.append(op.factor)
+        if iterm % 100000 == 0 and iterm != 0:
+            logger.debug(f"operator terms processed: {iterm}/{len(terms)}")
 
     # const
     if const != 0:
-        table_entry = dummy_table_entry.copy()
+        for isite in range(nsite):
+            if identity_idx[isite] < 0:
+                identity_idx[isite] = get_idx(("I", isite), identity_ops[isite])
+        table[-1] = identity_idx
         factor_list.append(const)
-        table.append(table_entry)
-
-    factor_list = np.array(factor_list)
-    logger.debug(f"# of operator terms: {len(table)}")
-
-    return table, factor_list
 
+    # check the index of different operators could be represented with np.uint16
+    assert len(primary_ops) < np.iinfo(np.uint16).max
 
-def _transform_table(table, factor):
-    """Transforms the table to integer table and combine duplicate terms."""
+    factor_list = np.array(factor_list)
+    logger.debug(f"# of operator terms: {len(table)}, # of elementary operators: {len(primary_ops)}. "
+                 f"time cost: {time.time() - time_start:.2f}s")
+
+    return table, factor_list, primary_ops
+
+
+def _split_elementary_key(op: Op, dof_to_siteidx) -> Dict[int, Tuple]:
+    # equivalent to ``Op.split_elementary`` but returns a cheap hashable key of each elementary operator
+    # and the (symbol, dofs, qn) to construct the elementary operator,
+    # so that ``Op`` objects are only constructed for operators not seen before
+    try:
+        site_idx_list = [dof_to_siteidx[dof] for dof in op.dofs]
+    except KeyError as e:
+        raise ValueError(f"Unknown DoF name {e.args[0]} in {op}.")
+    if len(op.dofs) == 1:
+        key = (op.symbol, op.dofs[0], op.qn_list[0].tobytes())
+        return {site_idx_list[0]: (key, (op.symbol, op.dofs, op.qn_list))}
+    if len(set(site_idx_list)) == len(site_idx_list):
+        # the most common case. Each DoF is on a different site
+        res = {}
+        for site_idx, elem_symbol, elem_name, qn in zip(site_idx_list, op.split_symbol, op.dofs, op.qn_list):
+            res[site_idx] = ((elem_symbol, elem_name, qn.tobytes()), (elem_symbol, [elem_name], [qn]))
+        return res
+    # group operators according to site index.
+    # Note that the order of operators on each site is not changed
+    grouped: Dict[int, List] = defaultdict(list)
+    for site_idx, elem_symbol, elem_name, qn in zip(site_idx_list, op.split_symbol, op.dofs, op.qn_list):
+        grouped[site_idx].append((elem_symbol, elem_name, qn))
+    res = {}
+    for site_idx, elem_info in grouped.items():
+        key = tuple((elem_symbol, elem_name, qn.tobytes()) for elem_symbol, elem_name, qn in elem_info)
+        symbols, dofs, qn_list = zip(*elem_info)
+        res[site_idx] = (key, (" ".join(symbols), list(dofs), list(qn_list)))
+    return res
 
-    # use np.uint32, np.uint16 to save memory
-    max_uint32 = np.iinfo(np.uint32).max
-    max_uint16 = np.iinfo(np.uint16).max
 
-    # translate the symbolic operator table to an easy to manipulate numpy array
+def _op_table_to_int(table):
+    """Transforms the table of ``Op`` to integer table."""
     table = np.array(table)
     # unique operators with DoF names taken into consideration
     # The inclusion of DoF names is necessary for multi-dof basis.
-    unique_op = OrderedDict.fromkeys(table.ravel())
-    # Convert Set(table.ravel()) to List will change the Op order in list, OrderedDict made reproducible
-    unique_op = list(unique_op.keys())
-
+    # OrderedDict made reproducible
+    primary_ops = list(OrderedDict.fromkeys(table.ravel()).keys())
     # check the index of different operators could be represented with np.uint16
-    assert len(unique_op) < max_uint16
+    assert len(primary_ops) < np.iinfo(np.uint16).max
+    op2idx = dict(zip(primary_ops, range(len(primary_ops))))
+    new_table = np.array([op2idx[op] for op in table.ravel()], dtype=np.uint16).reshape(table.shape)
+    return new_table, primary_ops
+
+
+def _unique_rows(table):
+    # unique rows of the integer table in the order of the first appearance
+    # and the inverse index. Faster than ``np.unique(table, axis=0)`` by viewing each row as a scalar
+    table = np.ascontiguousarray(table)
+    if table.shape[1] == 0:
+        return table[:1], np.zeros(len(table), dtype=np.int64)
+    row_view = table.view(np.dtype((np.void, table.dtype.itemsize * table.shape[1]))).reshape(-1)
+    _, first_idx, inverse = np.unique(row_view, return_index=True, return_inverse=True)
+    order = np.argsort(first_idx)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return table[first_idx[order]], rank[inverse.reshape(-1)]
 
-    # Construct mapping from easy-to-manipulate integer to actual Op
-    primary_ops = list(unique_op)
 
-    op2idx = dict(zip(unique_op, range(len(unique_op))))
-    new_table = np.vectorize(op2idx.get)(table).astype(np.uint16)
-
-    del unique_op
-
-    if __debug__:
-        qn_size = len(table[0][0].qn)
-        qn_table = np.array([[x.qn for x in ta] for ta in table])
-        factor_table = np.array([[x.factor for x in ta] for ta in table])
-        for idx in range(len(primary_ops)):
-            coord = np.nonzero(new_table == idx)
-            # check that op with the same symbol has the same factor and qn
-            for j in range(qn_size):
-                assert np.unique(qn_table[:, :, j][coord]).size == 1
-            assert np.all(factor_table[coord] == factor_table[coord][0])
-
-        del factor_table, qn_table
+def _transform_table(table, factor):
+    """Combine duplicate terms in the integer table."""
 
     # combine the same terms but with different factors(add them together)
-    unique_term, unique_inverse = np.unique(new_table, axis=0, return_inverse=True)
-    # it is efficient to vectorize the operation that moves the rows and cols
-    # and sum them together
-    coord = np.array([[newidx, oldidx] for oldidx, newidx in enumerate(unique_inverse)])
-    mask = scipy.sparse.csr_matrix((np.ones(len(coord)), (coord[:, 0], coord[:, 1])))
-    factor = mask.dot(factor)
-
-    # check the index of interaction could be represented with np.uint32
-    assert table.shape[0] < max_uint32
+    unique_term, unique_inverse = np.unique(table, axis=0, return_inverse=True)
+    new_factor = np.zeros(len(unique_term), dtype=factor.dtype)
+    np.add.at(new_factor, unique_inverse.reshape(-1), factor)
 
-    return np.array(unique_term), factor, primary_ops
+    return unique_term, new_factor
 
 
 # translate the numbers into symbolic Matrix Operator
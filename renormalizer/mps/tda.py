@@ -10,8 +10,8 @@ import opt_einsum as oe
 from renormalizer.mps.matrix import tensordot, multi_tensor_contract, asnumpy, asxp
 from renormalizer.mps.backend import xp, USE_GPU, primme, IMPORT_PRIMME_EXCEPTION
 from renormalizer.mps import Mps
-from renormalizer.mps.lib import Environ, compressed_sum
-from renormalizer.lib import davidson
+from renormalizer.mps.lib import Environ, compressed_sum, block_aop
+from renormalizer.lib import davidson1
 
 logger = logging.getLogger(__name__)
 
@@ -186,66 +186,82 @@ class TDA(object):
             assert offset == xsize
             return tda_coeff
             
+        # environments independent of the coefficients.
+        # l_env[i]: sites < i, both bra and ket are left canonical
+        # r_env[i]: sites > i, both bra and ket are right canonical
+        l_env = [xp.ones((1, 1, 1))]
+        for ims in range(site_num - 1):
+            ms = asxp(mps_l_cano[ims])
+            l_env.append(_contract_l(l_env[-1], ms, asxp(mpo[ims]), ms, oe_backend))
+        r_env = [xp.ones((1, 1, 1))]
+        for ims in range(site_num - 1, 0, -1):
+            ms = asxp(mps_r_cano[ims])
+            r_env.append(_contract_r(r_env[-1], ms, asxp(mpo[ims]), ms, oe_backend))
+        r_env = r_env[::-1]
+
         def hop(x):
-            # H*X
+            # H*X. The columns of X are stacked on the first leg ``z`` of the
+            # ket tensors and the environments and contracted at once.
+            # The sum over the sites of the ket tangent vector is accumulated
+            # in the environments, so that a single sweep in each direction is required.
             nonlocal count
-            count += 1
-            
-            assert len(x) == xsize
-            tda_coeff = reshape_x(x)
-    
-            res = [np.zeros_like(coeff) if coeff is not None else None for coeff in tda_coeff]
-            
-            # fix ket and sweep bra and accumulate into res
+            if x.ndim == 1:
+                return hop(x.reshape(-1, 1)).ravel()
+            assert x.shape[0] == xsize
+            count += x.shape[1]
+
+            # ket tangent tensors with the batch leg
+            tangent = []
+            offset = 0
+            for ims, shape in enumerate(xshape):
+                if tangent_u[ims] is None:
+                    tangent.append(None)
+                    continue
+                size = int(np.prod(shape))
+                coeff = asxp(x[offset:offset+size].T.reshape((-1,) + shape))
+                tangent.append(oe.contract("adk, zkr -> zadr", asxp(tangent_u[ims]), coeff, backend=oe_backend))
+                offset += size
+            assert offset == xsize
+
+            # lx_env[i]: sites < i with the ket tangent vector at one of them
+            lx_env = [None]
+            for ims in range(site_num - 1):
+                env = None
+                bra, mo = asxp(mps_l_cano[ims]), asxp(mpo[ims])
+                if lx_env[-1] is not None:
+                    env = _contract_l(lx_env[-1], bra, mo, asxp(mps_r_cano[ims]), oe_backend)
+                if tangent[ims] is not None:
+                    tmp = _contract_l(l_env[ims], bra, mo, tangent[ims], oe_backend)
+                    env = tmp if env is None else env + tmp
+                lx_env.append(env)
+            # rx_env[i]: sites > i with the ket tangent vector at one of them
+            rx_env = [None]
+            for ims in range(site_num - 1, 0, -1):
+                env = None
+                bra, mo = asxp(mps_r_cano[ims]), asxp(mpo[ims])
+                if rx_env[-1] is not None:
+                    env = _contract_r(rx_env[-1], bra, mo, asxp(mps_l_cano[ims]), oe_backend)
+                if tangent[ims] is not None:
+                    tmp = _contract_r(r_env[ims], bra, mo, tangent[ims], oe_backend)
+                    env = tmp if env is None else env + tmp
+                rx_env.append(env)
+            rx_env = rx_env[::-1]
+
+            res = []
             for ims in range(site_num):
-                if tda_coeff[ims] is None:
-                    assert tangent_u[ims] is None
+                if tangent_u[ims] is None:
                     continue
-                
-                # mix-canonical mps
-                mps_tangent = merge(mps_l_cano, mps_r_cano, ims+1)
-                mps_tangent[ims] = tensordot(tangent_u[ims], tda_coeff[ims], (-1, 0))
-                
-                mps_tangent_conj = mps_r_cano.copy()
-                environ = Environ(mps_tangent, mpo, "R", mps_conj=mps_tangent_conj)
-                
-                for ims_conj in range(site_num):
-                    ltensor = environ.GetLR(
-                        "L", ims_conj-1, mps_tangent, mpo, itensor=None,
-                        mps_conj=mps_tangent_conj,
-                        method="System"
-                    )
-                    rtensor = environ.GetLR(
-                        "R", ims_conj+1, mps_tangent, mpo, itensor=None,
-                        mps_conj=mps_tangent_conj,
-                        method="Enviro"
-                    )
-                    if tda_coeff[ims_conj] is not None:
-                        # S-a   l-S
-                        #     d
-                        # O-b-O-f-O
-                        #     e
-                        # S-c   k-S
-    
-                        path = [
-                            ([0, 1], "abc, cek -> abek"),
-                            ([2, 0], "abek, bdef -> akdf"),
-                            ([1, 0], "akdf, lfk -> adl"),
-                        ]
-                        out = multi_tensor_contract(
-                            path, ltensor, asxp(mps_tangent[ims_conj]),
-                            asxp(mpo[ims_conj]), rtensor
-                        )
-                        res[ims_conj] += asnumpy(tensordot(tangent_u[ims_conj], out,
-                            ([0,1], [0,1])))
-                    
-                    # mps_conj combine 
-                    mps_tangent_conj[ims_conj] = mps_l_cano[ims_conj]    
-            
-            res = [mat for mat in res if mat is not None]
-    
-            return np.concatenate(res, axis=None)
-        
+                mo = asxp(mpo[ims])
+                out = _contract_local(l_env[ims], tangent[ims], mo, r_env[ims], oe_backend)
+                if lx_env[ims] is not None:
+                    out = out + _contract_local(lx_env[ims], asxp(mps_r_cano[ims]), mo, r_env[ims], oe_backend)
+                if rx_env[ims] is not None:
+                    out = out + _contract_local(l_env[ims], asxp(mps_l_cano[ims]), mo, rx_env[ims], oe_backend)
+                out = oe.contract("adk, zadl -> zkl", asxp(tangent_u[ims]), out, backend=oe_backend)
+                res.append(asnumpy(out).reshape(len(out), -1))
+
+            return np.concatenate(res, axis=1).T
+
         if algo == "davidson":
             if restart:
                 cguess = [cguess[:,i] for i in range(cguess.shape[1])]
@@ -253,12 +269,12 @@ class TDA(object):
                 cguess = [np.random.random(xsize) - 0.5]
             precond = lambda x, e, *args: x / (hdiag - e + 1e-4)
             
-            e, c = davidson(
-                hop, cguess, precond, max_cycle=100,
+            e, c = davidson1(
+                block_aop(hop), cguess, precond, max_cycle=100,
                 nroots=nroots, max_memory=64000
-            )
+            )[1:]
             if nroots == 1:
-                c = [c]
+                e = e[0]
             c = np.stack(c, axis=1)
 
         elif algo == "primme":
@@ -269,14 +285,6 @@ class TDA(object):
             if not restart:
                 cguess = None
 
-            def multi_hop(x):
-                if x.ndim == 1:
-                    return hop(x)
-                elif x.ndim == 2:
-                    return np.stack([hop(x[:,i]) for i in range(x.shape[1])],axis=1)
-                else:
-                    assert False
-    
             def precond(x): 
                 if x.ndim == 1:
                     return np.einsum("i, i -> i", 1/(hdiag+1e-4), x)
@@ -285,7 +293,7 @@ class TDA(object):
                 else:
                     assert False
             A = scipy.sparse.linalg.LinearOperator((xsize,xsize),
-                    matvec=multi_hop, matmat=multi_hop)
+                    matvec=hop, matmat=hop)
             M = scipy.sparse.linalg.LinearOperator((xsize,xsize),
                     matvec=precond, matmat=precond)
             e, c = primme.eigsh(A, k=min(nroots,xsize), which="SA", 
@@ -514,3 +522,40 @@ def merge(mpsl, mpsr, idx):
     for imps in range(idx, mpsr.site_num):
         mps[imps] = mpsr[imps]
     return mps
+
+
+# the leading ``z`` leg of the ket and the environment is optional and is the batch leg
+
+def _contract_l(ltensor, bra, mo, ket, oe_backend):
+    #   S-a   e-S
+    #     d
+    #   O-b-O-g-O
+    #     f
+    #   S-c   h-S
+    lz = "z" if ltensor.ndim == 4 else ""
+    kz = "z" if ket.ndim == 4 else ""
+    z = lz or kz
+    return oe.contract(f"{lz}abc, ade, bdfg, {kz}cfh -> {z}egh", ltensor, bra, mo, ket, backend=oe_backend)
+
+
+def _contract_r(rtensor, bra, mo, ket, oe_backend):
+    #   S-a   e-S
+    #     d
+    #   O-b-O-g-O
+    #     f
+    #   S-c   h-S
+    rz = "z" if rtensor.ndim == 4 else ""
+    kz = "z" if ket.ndim == 4 else ""
+    z = rz or kz
+    return oe.contract(f"{rz}egh, ade, bdfg, {kz}cfh -> {z}abc", rtensor, bra, mo, ket, backend=oe_backend)
+
+
+def _contract_local(ltensor, ket, mo, rtensor, oe_backend):
+    # S-a   l-S
+    #     d
+    # O-b-O-f-O
+    #     e
+    # S-c   k-S
+    lz, kz, rz = ["z" if t.ndim == 4 else "" for t in (ltensor, ket, rtensor)]
+    z = lz or kz or rz
+    return oe.contract(f"{lz}abc, {kz}cek, bdef, {rz}lfk -> {z}adl", ltensor, ket, mo, rtensor, backend=oe_backend)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from renormalizer.mps import Mps, Mpo, MpDm
+from renormalizer.mps.block_sparse import BlockSparseTensor, tensordot
+from renormalizer.mps.lib import Environ, contract_one_site
+from renormalizer.mps.svd_qn import svd_qn
+from renormalizer.tests.parameter import holstein_model
+
+
+@pytest.mark.parametrize("mp", (
+        Mps.random(holstein_model, 1, 10).canonicalise(),
+        Mpo(holstein_model),
+        MpDm.max_entangled_ex(holstein_model),
+))
+def test_site_roundtrip(mp):
+    for i in range(len(mp)):
+        tensor = mp.get_block_sparse(i)
+        assert tensor.density <= 1
+        assert np.allclose(tensor.to_dense(), mp[i].array)
+
+
+def test_environ():
+    mps = Mps.random(holstein_model, 1, 10).canonicalise()
+    mpo = Mpo(holstein_model)
+    mps_conj = mps.conj()
+    l_dense = np.ones((1, 1, 1))
+    l_block = None
+    for i in range(len(mps)):
+        ms = mps.get_block_sparse(i)
+        mo = mpo.get_block_sparse(i)
+        if l_block is None:
+            l_block = BlockSparseTensor.from_dense(
+                np.ones((1, 1, 1)), [ms.qn[0], mo.qn[0], ms.qn[0]], [1, -1, -1], [0]
+            )
+        l_dense = contract_one_site(l_dense, mps[i], mpo[i], "L", mps_conj[i])
+        l_block = contract_one_site(l_block, ms, mo, "L", ms.conj())
+        assert np.allclose(l_block.to_dense(), l_dense)
+    e = l_block.to_dense().ravel()[0]
+    assert e == pytest.approx(mps.expectation(mpo))
+
+
+def test_svd_qn():
+    mps = Mps.random(holstein_model, 1, 10).canonicalise()
+    idx = mps.qnidx
+    qnbigl, qnbigr, _ = mps._get_big_qn([idx])
+    array = mps[idx].array
+    qn = [mps.qn[idx], mps._get_sigmaqn(idx), mps.qn[idx + 1]]
+    tensor = BlockSparseTensor.from_dense(array, qn, [1, 1, 1], mps.qntot)
+    system = "L" if mps.to_right else "R"
+    dense_res = svd_qn(array, qnbigl, qnbigr, mps.qntot, system=system, full_matrices=False)
+    block_res = svd_qn(tensor, qnbigl, qnbigr, mps.qntot, system=system, full_matrices=False)
+    for a, b in zip(dense_res, block_res):
+        assert np.allclose(a, b)
+
+
+def test_tensordot():
+    qn = [np.array([[0], [1], [1]]), np.array([[0], [1]]), np.array([[0], [1], [2]])]
+    a_dense = np.random.rand(3, 2, 3)
+    a = BlockSparseTensor.from_dense(a_dense, qn, [1, 1, -1], [0])
+    a_dense = a.to_dense()
+    res = tensordot(a.conj(), a, axes=([0, 1], [0, 1]))
+    assert np.allclose(res.to_dense(), np.tensordot(a_dense.conj(), a_dense, axes=([0, 1], [0, 1])))
+    assert np.allclose(res.transpose(1, 0).to_dense(), res.to_dense().T)
+    assert tensordot(a.conj(), a, axes=3) == pytest.approx(a.norm() ** 2)
+    with pytest.raises(ValueError):
+        tensordot(a, a, axes=([0], [0]))
+
+
+@pytest.mark.parametrize("mps", (
+        Mps.random(holstein_model, 1, 10).canonicalise(),
+        MpDm.max_entangled_ex(holstein_model).canonicalise(),
+))
+def test_environ_block_sparse(mps):
+    mpo = Mpo(holstein_model)
+    dense = Environ(mps, mpo)
+    block = Environ(mps, mpo, block_sparse=True)
+    for domain, i in dense._virtual_disk:
+        assert isinstance(block._virtual_disk[(domain, i)], BlockSparseTensor)
+        assert np.allclose(block.read(domain, i), dense.read(domain, i))
+        if i not in range(len(mps)):
+            continue
+        for method in ["System", "Scratch"]:
+            assert np.allclose(
+                block.GetLR(domain, i, mps, mpo, method=method),
+                dense.GetLR(domain, i, mps, mpo, method=method),
+            )
@@ -145,6 +145,64 @@ def test_tdvp_ps2(init_state, mpo, solver):
     assert max(mps.bond_dims) == 5
 
 
+@pytest.mark.parametrize("init_state", (init_mps, init_mpdm))
+def test_tdvp_ps2_parallel(init_state):
+    mps = init_state.copy()
+    mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps2)
+    mps.evolve_config.parallel_segments = 2
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=5)
+    # lower accuracy because of the truncation
+    mps = check_result(mps, mpo, 0.2, 5, atol=1e-3)
+    assert max(mps.bond_dims) == 5
+
+
+@pytest.mark.parametrize("init_state", (init_mps, init_mpdm))
+def test_tdvp_ps2_parallel_boundaries(init_state):
+    # the merge at the boundaries inside the chain converges to the sequential result
+    # as the time step decreases
+    mps = init_state.copy()
+    mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps2)
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=5)
+    for i in range(5):
+        mps = mps.evolve(mpo, 0.2)
+    distances = []
+    for nsteps in (5, 10):
+        mps_sequential = mps.copy()
+        mps_parallel = mps.copy()
+        mps_parallel.evolve_config.parallel_segments = 3
+        for i in range(nsteps):
+            mps_sequential = mps_sequential.evolve(mpo, 0.1 / nsteps)
+            mps_parallel = mps_parallel.evolve(mpo, 0.1 / nsteps)
+        distances.append(mps_sequential.distance(mps_parallel))
+    assert distances[1] < 0.6 * distances[0]
+    assert distances[1] < 2e-3
+
+
+@pytest.mark.parametrize("init_state_class", (Mps, MpDm))
+def test_tdvp_ps_expansion(init_state_class):
+    # start from the product state
+    init_state = Mpo.onsite(model, r"a^\dagger", dof_set={0}) @ Mps.ground_state(model, False)
+    if init_state_class is MpDm:
+        init_state = MpDm.from_mps(init_state)
+    assert max(init_state.bond_dims) == 1
+    mps = init_state.copy()
+    mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps)
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=5, subspace_expansion=1e-4)
+    # lower accuracy because the first step is taken with the product state
+    mps = check_result(mps, mpo, 0.1, 5, atol=1e-3)
+    assert max(mps.bond_dims) == 5
+
+
+@pytest.mark.parametrize("method", (EvolveMethod.tdvp_ps, EvolveMethod.tdvp_ps2))
+@pytest.mark.parametrize("estimator", ("doubling", "embedded"))
+def test_tdvp_ps_adaptive(method, estimator):
+    mps = init_mps.copy()
+    mps.evolve_config = EvolveConfig(method, adaptive=True, guess_dt=0.1)
+    mps.evolve_config.adaptive_estimator = estimator
+    mps = check_result(mps, mpo, 0.5, 5)
+    # the step size is enlarged
+    assert 0.1 < abs(mps.evolve_config.guess_dt)
+
 @pytest.mark.parametrize("init_state, mpo", (
         [init_mps, mpo],
         [init_mpdm, mpo],
@@ -158,6 +158,63 @@ def test_stackedmpo():
     assert np.all(np.abs(np.array(energies2) - np.array(energies1) * 2) < 1e-8)
 
 
+@pytest.mark.parametrize("method", (
+        "1site",
+        "2site",
+))
+@pytest.mark.parametrize("stacked", (True, False))
+def test_pipeline(method, stacked):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.method = method
+    h = StackedMpo([mpo, mpo]) if stacked else mpo
+    energies1, _ = optimize_mps(mps.copy(), h)
+    mps.optimize_config.pipeline = True
+    energies2, mps_opt = optimize_mps(mps.copy(), h)
+    assert np.allclose(energies1, energies2)
+    factor = 2 if stacked else 1
+    assert mps_opt.expectation(mpo) * factor == pytest.approx(energies2[-1], rel=1e-5)
+
+
+@pytest.mark.parametrize("method", (
+        "1site",
+        "2site",
+))
+@pytest.mark.parametrize("pipeline", (True, False))
+def test_stacked_workers(method, pipeline):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.method = method
+    mps.optimize_config.pipeline = pipeline
+    h = StackedMpo([mpo, mpo.scale(0.5), mpo.scale(0.5)])
+    energies1, _ = optimize_mps(mps.copy(), h)
+    mps.optimize_config.stacked_workers = 3
+    energies2, mps_opt = optimize_mps(mps.copy(), h)
+    assert np.allclose(energies1, energies2)
+    assert mps_opt.expectation(mpo) * 2 == pytest.approx(energies2[-1], rel=1e-5)
+
+
+@pytest.mark.parametrize("nsegments", (2, 3))
+def test_parallel_segments(nsegments):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.parallel_segments = nsegments
+    energies, mps_opt = optimize_mps(mps.copy(), mpo)
+    assert energies[-1] == pytest.approx(GS_E, rel=1e-5)
+    assert mps_opt.expectation(mpo) == pytest.approx(GS_E, rel=1e-5)
+
+
+@pytest.mark.parametrize("method", ("1site", "2site"))
+def test_block_sparse_environ(method):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.method = method
+    mps.optimize_config.block_sparse_environ = True
+    energies, mps_opt = optimize_mps(mps.copy(), mpo)
+    assert energies[-1] == pytest.approx(GS_E, rel=1e-5)
+    assert mps_opt.expectation(mpo) == pytest.approx(GS_E, rel=1e-5)
+
+
 def test_pyscf_solver():
     try:
         from pyscf import M, mcscf, fci
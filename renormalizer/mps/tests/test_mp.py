@@ -9,7 +9,7 @@ from renormalizer.mps import Mps, Mpo, MpDm
 from renormalizer.mps.matrix import tensordot, asnumpy
 from renormalizer.mps.lib import Environ
 from renormalizer.tests.parameter import custom_model, holstein_model
-from renormalizer.utils import CompressCriteria
+from renormalizer.utils import CompressCriteria, EvolveMethod
 
 def test_save_load():
     model = holstein_model
@@ -27,6 +27,51 @@ def test_save_load():
     os.remove(fname)
 
 
+@pytest.mark.parametrize("mp", (
+        Mps.random(holstein_model, 1, 10),
+        Mpo(holstein_model),
+        MpDm.max_entangled_ex(holstein_model).expand_bond_dimension(Mpo(holstein_model), include_ex=False),
+))
+def test_binary_container(mp, tmp_path):
+    fname = str(tmp_path / "mp.npz")
+    mp.dump(fname)
+    for mmap in [True, False]:
+        mp2 = mp.__class__.load(holstein_model, fname, mmap=mmap)
+        assert len(mp2) == len(mp)
+        for mt1, mt2 in zip(mp, mp2):
+            assert np.allclose(mt1.array, mt2.array)
+            # memory mapped instead of copied
+            assert isinstance(mt2.array.base, np.memmap) == mmap
+        for qn1, qn2 in zip(mp.qn, mp2.qn):
+            assert np.array_equal(qn1, qn2)
+        assert np.array_equal(mp.qntot, mp2.qntot)
+        assert (mp.qnidx, mp.to_right) == (mp2.qnidx, mp2.to_right)
+        # copy-on-write
+        mp2[0].array[:] = 0
+        assert np.allclose(mp.__class__.load(holstein_model, fname)[0].array, mp[0].array)
+
+
+def test_load_legacy():
+    # the npz protocol before the binary container
+    model = holstein_model
+    mps = Mps.random(model, 1, 10)
+    mps.coeff = 0.5
+    data_dict = {"version": "0.4", "nsites": len(mps), "coeff": mps.coeff}
+    for i, mt in enumerate(mps):
+        data_dict[f"mt_{i}"] = mt.array
+    for attr in ["qnidx", "qntot", "to_right"]:
+        data_dict[attr] = getattr(mps, attr)
+    qn = np.empty(len(mps.qn), object)
+    qn[:] = mps.qn
+    data_dict["qn"] = qn
+    fname = f"{id(mps)}.npz"
+    np.savez(fname, **data_dict)
+    mps2 = Mps.load(model, fname)
+    os.remove(fname)
+    assert mps2.coeff == 0.5
+    assert mps2.expectation(Mpo(model)) == pytest.approx(mps.expectation(Mpo(model)))
+
+
 def check_distance(a: Mps, b: Mps):
     d1 = (a - b).mp_norm
     d2 = a.distance(b)
@@ -59,6 +104,29 @@ def test_environ():
         e = complex(tensordot(l, r, axes=((0, 1, 2), (0, 1, 2)))).real
         assert pytest.approx(e) == mps.expectation(mpo)
 
+def test_environ_memory_limit(tmp_path):
+    mps = Mps.random(holstein_model, 1, 10)
+    mpo = Mpo(holstein_model)
+    mps = mps.evolve(mpo, 10)
+    environ = Environ(mps, mpo)
+    mps.compress_config.environ_memory_limit = "1 kb"
+    mps.compress_config.dump_matrix_dir = str(tmp_path)
+    environ_limited = Environ(mps, mpo)
+    assert len(environ_limited._virtual_disk._disk) != 0
+    for i in range(len(mps)-1):
+        for key in [("L", i), ("R", i+1)]:
+            assert np.allclose(asnumpy(environ.read(*key)), asnumpy(environ_limited.read(*key)))
+    # evolution with the memory limit gives the same result
+    mps1 = mps.copy()
+    mps1.compress_config.environ_memory_limit = None
+    mps1.evolve_config.method = mps.evolve_config.method = EvolveMethod.tdvp_ps
+    mps1 = mps1.evolve(mpo, 10)
+    mps2 = mps.evolve(mpo, 10)
+    assert mps1.distance(mps2) == pytest.approx(0, abs=1e-10)
+    del environ_limited
+    assert len(os.listdir(tmp_path)) == 0
+
+
 # multi_mpo routine for single mpo calculation
 @pytest.mark.parametrize("mpdm", (True, False))
 def test_environ_multi_mpo(mpdm):
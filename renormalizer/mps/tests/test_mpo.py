@@ -40,6 +40,23 @@ def test_symbolic_mpo(nsites, nterms):
     assert np.allclose(dense_mpo, qutip_ham.data.todense())
 
 
+def test_integer_table():
+    # the integer table pipeline is consistent with the op table
+    from renormalizer.mps.symbolic_mpo import _terms_to_table, construct_symbolic_mpo
+    model = holstein_model.switch_scheme(4)
+    table, factor, primary_ops = _terms_to_table(model, model.ham_terms, 0.5)
+    assert table.shape == (len(model.ham_terms) + 1, len(model.basis))
+    op_table = [[primary_ops[i] for i in row] for row in table]
+    for op, row in zip(model.ham_terms, op_table):
+        elem_ops, _ = op.split_elementary(model.dof_to_siteidx)
+        assert [o for o in row if not o.symbol.startswith("I")] == elem_ops
+    res1 = construct_symbolic_mpo(table, factor, primary_ops=primary_ops)
+    res2 = construct_symbolic_mpo(op_table, factor)
+    for mpoqn1, mpoqn2 in zip(res1[1], res2[1]):
+        assert np.array_equal(mpoqn1, mpoqn2)
+    assert [len(mo) for mo in res1[0]] == [len(mo) for mo in res2[0]]
+
+
 @pytest.mark.parametrize("nsites", [5, 10])
 # More sites make MPO representation not efficient
 # Not good for testing
@@ -176,4 +193,30 @@ def test_phonon_onsite():
     assert np.allclose(p2.ph_occupations, [2, 0, 0, 0, 0, 0])
     b = b2.conj_trans()
     assert b.distance(Mpo.ph_onsite(holstein_model, r"b", 0, 0)) == 0
-    assert b.apply(p2).normalize("mps_only").distance(p1) == pytest.approx(0, abs=1e-5)
\ No newline at end of file
+    assert b.apply(p2).normalize("mps_only").distance(p1) == pytest.approx(0, abs=1e-5)
+
+def test_mpo_cache(tmp_path):
+    from renormalizer.mps.mpo_cache import set_mpo_cache
+    model = holstein_model
+    mpo_ref = Mpo(model)
+    cache = set_mpo_cache(str(tmp_path), max_size=10 * mpo_ref.total_bytes)
+    try:
+        mpo1 = Mpo(model, offset=Quantity(1))
+        assert (cache.hits, cache.misses) == (0, 1)
+        # reversed order of the terms hits the same entry
+        mpo2 = Mpo(model, model.ham_terms[::-1], offset=Quantity(1))
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert mpo2.primary_ops == mpo1.primary_ops
+        for mt1, mt2 in zip(mpo1, mpo2):
+            assert np.allclose(mt1, mt2)
+        mps = Mps.random(model, 1, 10)
+        assert mps.expectation(mpo2) == pytest.approx(mps.expectation(mpo_ref) - 1)
+        # different offset
+        Mpo(model)
+        assert cache.misses == 2
+        # least recently used entries are evicted
+        for i in range(20):
+            Mpo(model, offset=Quantity(i + 2))
+        assert cache.size <= cache.max_size
+    finally:
+        set_mpo_cache(None)
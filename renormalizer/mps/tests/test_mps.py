@@ -6,7 +6,7 @@ import pytest
 from renormalizer.model import Model
 from renormalizer.model.basis import BasisSHO, BasisMultiElectronVac, BasisMultiElectron, BasisSimpleElectron
 from renormalizer.model.op import Op
-from renormalizer.mps import Mps, Mpo
+from renormalizer.mps import Mps, Mpo, MpDm
 from renormalizer.tests import parameter
 
 
@@ -43,14 +43,37 @@ def test_expectations(mpos):
     assert np.allclose(e1, e2)
 
 
+def test_expectation_plan():
+    from renormalizer.mps.expectation import expectation_plan_cache
+
+    model = parameter.holstein_model
+    mps = Mps.random(model, 1, 20)
+    mpos = [Mpo(model, Op("n", dof)) for dof in model.v_dofs] + [Mpo(model)]
+    expectation_plan_cache.cache_clear()
+    plan = expectation_plan_cache.get_plan(mpos)
+    # one group for each local operator and one for the Hamiltonian
+    assert len(plan.groups) == len(model.v_dofs) + 1
+    assert {group[1] - group[0] for group in plan.groups[:-1]} == {1}
+    assert expectation_plan_cache.get_plan(mpos) is plan
+    assert np.allclose(mps.expectations(mpos), mps.expectations(mpos, opt=False))
+    # modified MPOs are detected
+    mpos[0][model.order[model.v_dofs[0]]] = 2 * mpos[0][model.order[model.v_dofs[0]]].array
+    assert expectation_plan_cache.get_plan(mpos) is not plan
+    assert np.allclose(mps.expectations(mpos), mps.expectations(mpos, opt=False))
+
+
 def check_reduced_density_matrix(basis):
     model = Model(basis, [])
     mps = Mps.random(model, 1, 20)
-    rdm = mps.calc_edof_rdm().real
-    assert np.allclose(np.diag(rdm), mps.e_occupations)
+    # MpDm with correlations between the electronic DoFs
+    hopping = [Op(r"a^\dagger a", [i, j]) for i in model.e_dofs for j in model.e_dofs]
+    mpdm = Mpo(Model(basis, hopping)).apply(MpDm.from_mps(mps))
     # only test a sample. Should be enough.
     mpo = Mpo(model, Op(r"a^\dagger a", [0, 3]))
-    assert rdm[-1][0] == pytest.approx(mps.expectation(mpo))
+    for mp in [mps, mpdm]:
+        rdm = mp.calc_edof_rdm().real
+        assert np.allclose(np.diag(rdm), mp.e_occupations)
+        assert rdm[-1][0] == pytest.approx(mp.expectation(mpo))
 
 
 def test_reduced_density_matrix():
@@ -86,9 +109,93 @@ def test_site_entropy():
             (entropy_1site[0]+entropy_1site[1]-entropy_2site[(0,1)])/2)
 
 
+def test_2site_rdm_subset():
+    mps = Mps.random(parameter.holstein_model, 1, 20)
+    mps.canonicalise().normalize("mps_only")
+    rdm = mps.calc_2site_rdm()
+    assert len(rdm) == mps.site_num * (mps.site_num - 1) // 2
+    # partial trace of the 2-site rdm is the 1-site rdm
+    rdm_1site = mps.calc_1site_rdm()
+    d2, d6 = mps.pbond_list[2], mps.pbond_list[6]
+    rho = rdm[(2, 6)].reshape(d2, d6, d2, d6)
+    assert np.allclose(np.einsum("ijkj->ik", rho), rdm_1site[2])
+    assert np.allclose(np.einsum("ijil->jl", rho), rdm_1site[6])
+    rdm_cutoff = mps.calc_2site_rdm(cutoff=2)
+    assert set(rdm_cutoff.keys()) == {(i, j) for i, j in rdm.keys() if j - i <= 2}
+    rdm_pairs = mps.calc_2site_rdm(pairs=[(5, 1), (0, 6)])
+    assert set(rdm_pairs.keys()) == {(1, 5), (0, 6)}
+    for key, dm in list(rdm_cutoff.items()) + list(rdm_pairs.items()):
+        assert np.allclose(dm, rdm[key])
+    entropy_mutual = mps.calc_2site_mutual_entropy(cutoff=1)
+    assert np.allclose(np.triu(entropy_mutual, 2), 0)
+    assert np.allclose(np.diag(entropy_mutual, 1), np.diag(mps.calc_2site_mutual_entropy(), 1))
+
+
 def test_load_from_dense_wfn():
     model = Model(basis=[BasisSimpleElectron(i) for i in range(5)], ham_terms=[])
     ref_mps = Mps.random(model, 1, 20)
     dense_wfn = ref_mps.todense()
     loaded_mps = Mps.from_dense(model, dense_wfn)
     assert np.allclose(dense_wfn, loaded_mps.todense())
+
+
+def test_contract_path_cache():
+    from renormalizer.mps.hop_expr import hop_expr, contract_path_cache
+    from renormalizer.mps.gs import construct_mps_mpo
+
+    mps, mpo = construct_mps_mpo(parameter.holstein_model, 10, 1)
+    contract_path_cache.cache_clear()
+    ltensor = np.random.rand(10, mpo[3].shape[0], 10)
+    rtensor = np.random.rand(10, mpo[3].shape[-1], 10)
+    cshape = (10, mpo[3].shape[1], 10)
+    c = np.random.rand(*cshape)
+    expr1 = hop_expr(ltensor, rtensor, [mpo[3].array], cshape)
+    expr2 = hop_expr(ltensor, rtensor, [mpo[3].array], cshape)
+    info = contract_path_cache.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+    assert np.allclose(expr1(c), expr2(c))
+    std = np.einsum("abc, bdef, lfk, cek -> adl", ltensor, mpo[3].array, rtensor, c)
+    assert np.allclose(expr1(c), std)
+
+    contract_path_cache.maxsize = 1
+    hop_expr(ltensor, np.random.rand(10, mpo[3].shape[0], 10), [], (10, 10))
+    assert contract_path_cache.cache_info().currsize == 1
+    contract_path_cache.maxsize = 1024
+
+
+@pytest.mark.parametrize("nsite", [1, 2])
+@pytest.mark.parametrize("twolayer", [False, True])
+def test_batch_hop_expr(nsite, twolayer):
+    from renormalizer.mps.hop_expr import hop_expr
+    from renormalizer.mps.gs import construct_mps_mpo
+
+    mps, mpo = construct_mps_mpo(parameter.holstein_model, 10, 1)
+    cmo = [mpo[3 + i].array for i in range(nsite)]
+    nlayer = 3 if twolayer else 2
+    ltensor = np.random.rand(10, *[mpo[3].shape[0]] * (nlayer - 1), 10)
+    rtensor = np.random.rand(10, *[mpo[2 + nsite].shape[-1]] * (nlayer - 1), 10)
+    cshape = (10, *[mo.shape[1] for mo in cmo], 10)
+    c = np.random.rand(3, *cshape)
+    expr = hop_expr(ltensor, rtensor, cmo, cshape, twolayer)
+    batch_expr = hop_expr(ltensor, rtensor, cmo, cshape, twolayer, batch=3)
+    assert np.allclose(batch_expr(c), np.array([expr(ci) for ci in c]))
+
+
+def test_packed_layout():
+    from renormalizer.mps.lib import PackedLayout, cvec2cmat
+
+    qn_mask = np.random.rand(4, 3, 5) > 0.5
+    layout = PackedLayout(qn_mask)
+    assert layout.size == qn_mask.sum()
+    c = np.random.rand(layout.size)
+    cstruct = layout.unpack(c)
+    assert np.array_equal(cstruct, cvec2cmat(c, qn_mask))
+    assert np.array_equal(layout.pack(cstruct), c)
+    # batch
+    cs = np.random.rand(2, layout.size)
+    out = layout.unpack(cs)
+    assert np.array_equal(out[1], layout.unpack(cs[1]))
+    assert np.array_equal(layout.pack(out), cs)
+    # reuse the buffer
+    assert layout.unpack(cs[::-1], out=out) is out
+    assert np.array_equal(out[0], layout.unpack(cs[1]))
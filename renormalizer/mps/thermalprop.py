@@ -154,7 +154,8 @@ def load_thermal_state(model, path: str):
 
     Args:
         model (:class:`MolList`): system information
-        path (str): the path to load thermal state from. Should be an numpy ``.npz`` file.
+        path (str): the path to load thermal state from. Should be a file written by ``MpDm.dump``.
+            The site tensors are memory-mapped rather than read into memory at once.
     Returns: Loaded MpDm
     """
     try:
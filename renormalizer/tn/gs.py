@@ -1,4 +1,6 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from typing import List
 
 
@@ -7,6 +9,8 @@ import scipy
 from renormalizer.lib import davidson
 from renormalizer.mps.backend import primme, IMPORT_PRIMME_EXCEPTION, np
 from renormalizer.mps.matrix import asnumpy, asxp
+from renormalizer.mps.lib import PackedLayout
+from renormalizer.mps.parallel import parallel_executor, pmap, regularized_inverse
 from renormalizer.tn.node import TreeNodeTensor
 from renormalizer.tn.tree import TTNS, TTNO, TTNEnviron
 from renormalizer.tn.hop_expr import hop_expr2
@@ -18,13 +22,20 @@ logger = logging.getLogger(__name__)
 def optimize_ttns(ttns: TTNS, ttno: TTNO, procedure=None):
     if procedure is None:
         procedure = ttns.optimize_config.procedure
-    ttne = TTNEnviron(ttns, ttno)
+    ttne = TTNEnviron(ttns, ttno, nworkers=ttns.optimize_config.environ_workers)
+    nworkers = ttns.optimize_config.parallel_segments
+    if nworkers is not None:
+        nworkers = min(nworkers, sum(bool(child.children) for child in ttns.root.children))
     e_list = []
-    for m, percent in procedure:
-        # todo: better converge condition
-        micro_e = optimize_recursion(ttns.root, ttns, ttno, ttne, m, percent)
-        logger.info(f"Micro e: {micro_e}")
-        e_list.append(micro_e[-1])
+    with parallel_executor(nworkers) as executor:
+        for m, percent in procedure:
+            # todo: better converge condition
+            if executor is None:
+                micro_e = optimize_recursion(ttns.root, ttns, ttno, ttne, m, percent)
+            else:
+                micro_e = optimize_recursion_parallel(ttns, ttno, ttne, m, percent, executor)
+            logger.info(f"Micro e: {micro_e}")
+            e_list.append(micro_e[-1])
     return e_list
 
 
@@ -57,22 +68,83 @@ def optimize_recursion(
     return micro_e
 
 
+def optimize_recursion_parallel(
+    ttns: TTNS, ttno: TTNO, ttne: TTNEnviron, m: int, percent: float, executor: ThreadPoolExecutor
+) -> List[float]:
+    r"""Optimize the subtrees of the root in parallel and then the root with each of its children.
+
+    The canonical center is at the root when entering and leaving.
+    For each child :math:`i` the root is QR decomposed as :math:`C = Q_i v_i^T` toward the child,
+    and :math:`v_i` is absorbed into the child. The subtree of the child is then optimized
+    with :math:`Q_i` as the (fixed) root, independently of the other subtrees.
+    Afterwards the child is decomposed toward the root as :math:`Q'_i W_i` and the changes of all subtrees
+    are merged into the root by :math:`C \leftarrow C \times_i (v_i^T)^{+} W_i`, which is
+    the tree analogue of the :math:`\Lambda^{-1}` bond matrices in real-space parallel DMRG.
+    The root is finally optimized with each of its children sequentially to remove the error of the merge.
+    """
+    root = ttns.root
+    assert root.children  # 2 site can't do only one node
+    ichildren = [ichild for ichild, child in enumerate(root.children) if child.children]
+    root_tensor = root.tensor
+    children_qn = [child.qn for child in root.children]
+    v_list = []
+    new_qn = []
+    for ichild in ichildren:
+        # the decomposition is based on the original root tensor and quantum numbers
+        root.tensor = root_tensor
+        for child, qn in zip(root.children, children_qn):
+            child.qn = qn
+        v = ttns.decompose_to_child(root, ichild)
+        new_qn.append(root.children[ichild].qn)
+        # the environment of the subtree with Q_i as the root
+        ttne.build_parent_environ_node(root, ichild, ttns, ttno)
+        ttns.merge_to_child(root, ichild, v)
+        v_list.append(v)
+    root.tensor = root_tensor
+    for ichild, qn in zip(ichildren, new_qn):
+        root.children[ichild].qn = qn
+
+    # the subtrees share no tensor or environment slot
+    micro_e_list = pmap(
+        executor, lambda ichild: optimize_recursion(root.children[ichild], ttns, ttno, ttne, m), ichildren
+    )
+
+    # merge the subtrees to the root
+    for ichild, v in zip(ichildren, v_list):
+        w = ttns.decompose_to_parent(root.children[ichild])
+        ttns.merge_to_parent(root.children[ichild], regularized_inverse(v.T) @ w)
+    for ichild in ichildren:
+        ttne.build_children_environ_node(root.children[ichild], ttns, ttno)
+
+    micro_e = list(chain(*micro_e_list))
+    for ichild, child in enumerate(root.children):
+        ttne.build_parent_environ_node(root, ichild, ttns, ttno)
+    for child in root.children:
+        e, c = optimize_2site(child, ttns, ttno, ttne)
+        micro_e.append(e)
+        # cano to root
+        ttns.update_2site(child, c, m, percent, cano_parent=True)
+        # update env
+        ttne.update_2site(child, ttns, ttno)
+    return micro_e
+
+
 def optimize_2site(snode: TreeNodeTensor, ttns: TTNS, ttno: TTNO, ttne: TTNEnviron):
     cguess = ttns.merge_with_parent(snode)
-    qn_mask = ttns.get_qnmask(snode, include_parent=True)
-    cguess = cguess[qn_mask].ravel()
+    layout = PackedLayout(ttns.get_qnmask(snode, include_parent=True))
+    cguess = layout.pack(cguess)
     expr, hdiag = hop_expr2(snode, ttns, ttno, ttne)
-    hdiag = hdiag[qn_mask].ravel()
+    hdiag = layout.pack(hdiag)
 
     def hop(x):
-        cstruct = vec2tensor(x, qn_mask)
-        ret = expr(asxp(cstruct))[qn_mask].ravel()
+        cstruct = layout.unpack(asxp(x))
+        ret = layout.pack(expr(cstruct))
         return asnumpy(ret)
 
     assert ttns.optimize_config.nroots == 1
     algo: str = ttns.optimize_config.algo
     e, c = eigh_iterative(hop, hdiag, cguess, algo)
-    c = vec2tensor(c, qn_mask)
+    c = layout.unpack(c)
     return e, c
 
 
@@ -124,8 +196,3 @@ def eigh_iterative(hop, hdiag, cguess, algo):
 
     return e, c
 
-
-def vec2tensor(c, qn_mask):
-    cstruct = np.zeros(qn_mask.shape, dtype=c.dtype)
-    np.place(cstruct, qn_mask, c)
-    return cstruct
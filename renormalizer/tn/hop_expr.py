@@ -2,6 +2,7 @@ import opt_einsum as oe
 
 from renormalizer.mps.backend import np
 from renormalizer.mps.matrix import asxp
+from renormalizer.mps.hop_expr import contract_expression, contract
 from renormalizer.tn.node import TreeNodeTensor
 from renormalizer.tn.tree import TTNS, TTNO, TTNEnviron
 
@@ -116,6 +117,13 @@ def hop_expr2(snode: TreeNodeTensor, ttns: TTNS, ttno: TTNO, ttne: TTNEnviron):
     return expr, hdiag
 
 
+# The contraction paths are planned with the actual shapes of the node and cached in
+# ``renormalizer.mps.hop_expr.contract_path_cache``. The indices are labeled by the nodes
+# so the paths are effectively cached per node and reused in the following sweeps.
+# Set ``contract_path_cache.memory_limit`` to cap the size of the intermediates
+# for the nodes with many children.
+
+
 def _contract_expression(args, x_shape, x_indices, y_indices):
     # contract_expression in interleaved format
     args_fake = args.copy()
@@ -123,7 +131,7 @@ def _contract_expression(args, x_shape, x_indices, y_indices):
     args_fake.append(y_indices)
     indices, tensors = oe.parser.convert_interleaved_input(args_fake)
     args = [asxp(t) for t in tensors[:-1]] + [x_shape]
-    expr = oe.contract_expression(
+    expr = contract_expression(
         indices,
         *args,
         constants=list(range(len(tensors)))[:-1],
@@ -150,4 +158,5 @@ def _get_hdiag(args, input_indices):
             pass
         new_args.append(tuple(arg))
     new_args.append(input_indices)
-    return oe.contract(*new_args)
+    indices, tensors = oe.parser.convert_interleaved_input(new_args)
+    return contract(indices, *tensors)
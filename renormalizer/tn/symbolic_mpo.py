@@ -58,8 +58,8 @@ def construct_symbolic_mpo(tn: BasisTree, terms: List[Op], const: float = 0):
     basis = list(chain(*[n.basis_sets for n in nodes]))
     model = Model(basis, [])
     qn_size = model.qn_size
-    table, factor = _terms_to_table(model, terms, const)
-    table, factor, primary_ops = _transform_table(table, factor)
+    table, factor, primary_ops = _terms_to_table(model, terms, const)
+    table, factor = _transform_table(table, factor)
 
     dummy_in_ops = [[OpTuple([0], qn=np.zeros(qn_size, dtype=int), factor=1)]]
     out_ops: List[List[OpTuple]]
@@ -89,6 +89,16 @@ def test_tdvp_vmf(ttns_and_ttno):
     check_result(ttns, ttno, 0.5, 2, op_n_list)
 
 
+@pytest.mark.parametrize("ttns_and_ttno", [init_tree, init_tree_mctdh])
+def test_tdvp_vmf_parallel(ttns_and_ttno):
+    ttns, ttno, op_n_list = ttns_and_ttno
+    ttns = ttns + ttns.random(ttns.basis, 1, 5).scale(1e-5, inplace=True)
+    ttns.canonicalise()
+    ttns.evolve_config = EvolveConfig(EvolveMethod.tdvp_vmf, ivp_rtol=1e-4, ivp_atol=1e-7, force_ovlp=False)
+    ttns.evolve_config.environ_workers = 4
+    check_result(ttns, ttno, 0.5, 2, op_n_list)
+
+
 @pytest.mark.parametrize("ttns_and_ttno", [init_chain, init_tree, init_tree_mctdh])
 def test_pc(ttns_and_ttno):
     ttns, ttno, op_n_list = ttns_and_ttno
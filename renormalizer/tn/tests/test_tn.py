@@ -1,6 +1,6 @@
 import pytest
 
-from renormalizer import BasisHalfSpin, Model, Mpo, Mps
+from renormalizer import BasisHalfSpin, BasisDummy, Model, Mpo, Mps
 from renormalizer.mps.backend import np
 from renormalizer.model.model import heisenberg_ops
 from renormalizer.tn.node import TreeNodeBasis
@@ -76,6 +76,19 @@ def test_ttns(basis):
             np.testing.assert_allclose(e3, e2)
 
 
+@pytest.mark.parametrize("basis", [basis_binary, basis_multi_basis])
+def test_environ_parallel(basis):
+    ttns = TTNS.random(basis, 0, 5, 1)
+    ttno = TTNO(basis, heisenberg_ops(nspin))
+    env1 = TTNEnviron(ttns, ttno)
+    env2 = TTNEnviron(ttns, ttno, nworkers=4)
+    for enode1, enode2 in zip(env1.node_list, env2.node_list):
+        np.testing.assert_allclose(enode2.environ_parent, enode1.environ_parent)
+        for environ1, environ2 in zip(enode1.environ_children, enode2.environ_children):
+            np.testing.assert_allclose(environ2, environ1)
+    np.testing.assert_allclose(ttns.expectation(ttno, nworkers=4), ttns.expectation(ttno))
+
+
 @pytest.mark.parametrize("basis", [basis_binary, basis_multi_basis])
 def test_push_cano(basis):
     ttns = TTNS.random(basis, 0, 5, 1)
@@ -97,6 +110,55 @@ def test_from_mps():
     np.testing.assert_allclose(e, e_ref)
 
 
+def test_mutual_info():
+    mps = Mps.random(model, 1, 10)
+    mutual_info_ref = mps.calc_2site_mutual_entropy()
+    basis, ttns, ttno = from_mps(mps)
+    mutual_info = ttns.calc_2site_mutual_entropy()
+    # the basis sets in the TTNS are reversed
+    idx = [[str(b.dofs) for b in model.basis].index(str(b.dofs)) for b in basis.basis_list]
+    np.testing.assert_allclose(mutual_info, mutual_info_ref[np.ix_(idx, idx)], atol=1e-10)
+
+    for contract_primitive in [False, True]:
+        tree = BasisTree.from_mutual_info(model.basis, mutual_info_ref, contract_primitive=contract_primitive)
+        assert sorted(str(b.dofs) for b in tree.basis_list if not isinstance(b, BasisDummy)) == sorted(
+            str(b.dofs) for b in model.basis
+        )
+        assert all(len(node.children) <= 2 for node in tree.node_list)
+        cost = tree.estimate_cost(model.basis, mutual_info_ref, m_max=10)
+        assert len(cost) == len(tree)
+        assert all(1 <= c["bond_dim"] <= 10 for c in cost)
+        ttns = TTNS.random(tree, qntot=1, m_max=10)
+        assert ttns.expectation(TTNO(tree, model.ham_terms)) is not None
+
+
+def test_hop_expr_memory_limit():
+    from renormalizer.mps.hop_expr import contract_path_cache
+    from renormalizer.tn.hop_expr import hop_expr1
+
+    # the root has many children
+    root = TreeNodeBasis([basis_list[0]])
+    for i in range(1, 5):
+        root.add_child(TreeNodeBasis([basis_list[i]]))
+    basis = BasisTree(root)
+    ttns = TTNS.random(basis, qntot=0, m_max=4)
+    ttno = TTNO(basis, heisenberg_ops(5))
+    ttne = TTNEnviron(ttns, ttno)
+    c = np.random.rand(*ttns.root.shape)
+
+    contract_path_cache.cache_clear()
+    expr1, hdiag1 = hop_expr1(ttns.root, ttns, ttno, ttne, return_hdiag=True)
+    contract_path_cache.memory_limit = c.size
+    try:
+        expr2, hdiag2 = hop_expr1(ttns.root, ttns, ttno, ttne, return_hdiag=True)
+    finally:
+        contract_path_cache.memory_limit = None
+    # new paths are planned under the memory limit
+    assert contract_path_cache.cache_info().currsize == 4
+    np.testing.assert_allclose(expr1(c), expr2(c))
+    np.testing.assert_allclose(hdiag1, hdiag2)
+
+
 @pytest.mark.parametrize("basis_tree", [basis_binary, basis_multi_basis])
 @pytest.mark.parametrize("ite", [False, True])
 def test_gs_heisenberg(basis_tree, ite):
@@ -118,7 +180,8 @@ def test_gs_heisenberg(basis_tree, ite):
 
 
 @pytest.mark.parametrize("scheme", [3, 4])
-def test_gs_holstein(scheme):
+@pytest.mark.parametrize("parallel", [False, True])
+def test_gs_holstein(scheme, parallel):
     if scheme == 3:
         model = holstein_model
         basis = holstein_scheme3()
@@ -133,9 +196,16 @@ def test_gs_holstein(scheme):
             node_list[2*i].add_child(node_list[2*i+1])
         basis = BasisTree(root)
     m = 4
+    if parallel:
+        # the convergence of the parallel sweeps depends more on the initial guess
+        np.random.seed(0)
     ttns = TTNS.random(basis, qntot=1, m_max=m)
     ttno = TTNO(basis, model.ham_terms)
     procedure = [[m, 0.4], [m, 0.2], [m, 0.1], [m, 0], [m, 0]]
+    if parallel:
+        ttns.optimize_config.parallel_segments = 3
+        # the merge at the root slows down the convergence
+        procedure += [[m, 0], [m, 0]]
     e1 = optimize_ttns(ttns, ttno, procedure)
     e2 = 0.08401412 + model.gs_zpe
     np.testing.assert_allclose(min(e1), e2)
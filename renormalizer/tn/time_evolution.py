@@ -1,14 +1,16 @@
 from math import factorial
 from typing import Union, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 import scipy
 from scipy import stats
 import opt_einsum as oe
 
-from renormalizer.mps.lib import compressed_sum
+from renormalizer.mps.lib import compressed_sum, PackedLayout
 from renormalizer.mps.backend import np, xp
-from renormalizer.mps.matrix import asxp
+from renormalizer.mps.matrix import asxp, asnumpy
+from renormalizer.mps.parallel import parallel_executor, pmap
 from renormalizer.lib import solve_ivp, expm_krylov
 from renormalizer.utils.configs import EvolveMethod
 from renormalizer.tn.node import TreeNodeTensor
@@ -19,15 +21,72 @@ from renormalizer.tn.hop_expr import hop_expr0, hop_expr1, hop_expr2
 logger = logging.getLogger(__name__)
 
 
-def time_derivative_vmf(ttns: TTNS, ttno: TTNO):
-    # todo: benchmark and optimize
-    # parallel over multiple processors?
-    environ_s = TTNEnviron(ttns, TTNO.identity(ttns.basis))
-    environ_h = TTNEnviron(ttns, ttno)
-
-    deriv_list = []
-    for inode, node in enumerate(ttns.node_list):
-        hop = hop_expr1(node, ttns, ttno, environ_h)
+class VmfEngine:
+    r"""
+    Evaluate the VMF time derivatives of a TTNS for many parameter vectors.
+
+    The parameters are the symmetry-allowed elements of all node tensors concatenated
+    in the order of ``ttns.node_list``, as in :meth:`TTNS.from_tensors`.
+    A working TTNS and its environments are constructed once, and each evaluation scatters
+    the parameters into the node tensors in place and rebuilds the environments in the same
+    environment trees, so that no Python objects are reconstructed
+    and the contraction paths are reused. The derivatives of different nodes are independent
+    once the environments are built and are evaluated in parallel if ``executor`` is provided.
+
+    Parameters
+    ----------
+    ttns: TTNS
+        Template providing the topology, shape and QN. Not modified.
+    ttno: TTNO
+        The Hamiltonian.
+    executor: ThreadPoolExecutor
+        Thread pool to build the environments and evaluate the node derivatives.
+        ``None`` for the serial evaluation.
+    """
+
+    def __init__(self, ttns: TTNS, ttno: TTNO, executor: ThreadPoolExecutor = None):
+        self.ttns = ttns.copy()
+        self.ttno = ttno
+        self.executor = executor
+        self.layouts = [PackedLayout(self.ttns.get_qnmask(node)) for node in self.ttns.node_list]
+        offsets = np.cumsum([0] + [layout.size for layout in self.layouts])
+        self.slices = [slice(start, end) for start, end in zip(offsets[:-1], offsets[1:])]
+        self.size = offsets[-1]
+        # contiguous node tensors, so that the parameters can be scattered in place
+        for node, layout in zip(self.ttns.node_list, self.layouts):
+            node.tensor = layout.unpack(layout.pack(node.tensor))
+        self.identity = TTNO.identity(ttns.basis)
+        self.environ_s = TTNEnviron(self.ttns, self.identity, build_environ=False)
+        self.environ_h = TTNEnviron(self.ttns, ttno, build_environ=False)
+
+    def get_params(self) -> np.ndarray:
+        # the parameters of the template
+        return np.concatenate(
+            [layout.pack(node.tensor) for node, layout in zip(self.ttns.node_list, self.layouts)]
+        )
+
+    def set_params(self, params: np.ndarray):
+        params = asnumpy(params)
+        assert len(params) == self.size
+        for node, layout, sl in zip(self.ttns.node_list, self.layouts, self.slices):
+            if np.iscomplexobj(params) and not np.iscomplexobj(node.tensor):
+                node.tensor = node.tensor.astype(params.dtype)
+            layout.unpack(params[sl], out=node.tensor)
+
+    def time_derivative(self, params: np.ndarray) -> np.ndarray:
+        self.set_params(params)
+        ttns, ttno, executor = self.ttns, self.ttno, self.executor
+        for environ, op in [(self.environ_s, self.identity), (self.environ_h, ttno)]:
+            environ.build_children_environ(ttns, op, executor)
+            environ.build_parent_environ(ttns, op, executor)
+
+        deriv_list = pmap(executor, self._node_derivative, range(len(ttns.node_list)))
+        return np.concatenate(deriv_list)
+
+    def _node_derivative(self, inode: int) -> np.ndarray:
+        ttns, ttno = self.ttns, self.ttno
+        node = ttns.node_list[inode]
+        hop = hop_expr1(node, ttns, ttno, self.environ_h)
         # idx1: children+physical, idx2: parent
         dim_parent = node.shape[-1]
         tensor = asxp(node.tensor)
@@ -37,12 +96,15 @@ def time_derivative_vmf(ttns: TTNS, ttno: TTNO):
             # apply projector and S^-1
             tensor = tensor.reshape(shape_2d)
             proj = tensor.conj() @ tensor.T
-            ovlp = environ_s.node_list[inode].environ_parent.reshape(dim_parent, dim_parent)
+            ovlp = self.environ_s.node_list[inode].environ_parent.reshape(dim_parent, dim_parent)
             ovlp_inv = regularized_inversion(ovlp, ttns.evolve_config.reg_epsilon)
             deriv = oe.contract("bf, bg, fh -> gh", deriv, xp.eye(proj.shape[0]) - proj, asxp(ovlp_inv.T))
-        qnmask = ttns.get_qnmask(node).reshape(deriv.shape)
-        deriv_list.append(deriv[qnmask].ravel())
-    return np.concatenate(deriv_list)
+        return self.layouts[inode].pack(asnumpy(deriv).reshape(node.shape))
+
+
+def time_derivative_vmf(ttns: TTNS, ttno: TTNO):
+    engine = VmfEngine(ttns, ttno)
+    return engine.time_derivative(engine.get_params())
 
 
 def regularized_inversion(m, eps):
@@ -53,14 +115,16 @@ def regularized_inversion(m, eps):
 
 
 def evolve_tdvp_vmf(ttns: TTNS, ttno: TTNO, coeff: Union[complex, float], tau: float, first_step=None):
-    def ivp_func(t, params):
-        ttns_t = TTNS.from_tensors(ttns, params)
-        return coeff * time_derivative_vmf(ttns_t, ttno)
-
-    init_y = np.concatenate([node.tensor[ttns.get_qnmask(node)].ravel() for node in ttns.node_list])
     atol = ttns.evolve_config.ivp_atol
     rtol = ttns.evolve_config.ivp_rtol
-    sol = solve_ivp(ivp_func, (0, tau), init_y, first_step=first_step, atol=atol, rtol=rtol)
+    with parallel_executor(ttns.evolve_config.environ_workers) as executor:
+        engine = VmfEngine(ttns, ttno, executor)
+
+        def ivp_func(t, params):
+            return coeff * engine.time_derivative(params)
+
+        init_y = engine.get_params()
+        sol = solve_ivp(ivp_func, (0, tau), init_y, first_step=first_step, atol=atol, rtol=rtol)
     logger.info(f"VMF func called: {sol.nfev}. RKF steps: {len(sol.t)}")
     new_ttns = TTNS.from_tensors(ttns, sol.y[:, -1])
     new_ttns.canonicalise()
@@ -79,7 +143,7 @@ def evolve_prop_and_compress_tdrk4(ttns: TTNS, ttno: TTNO, coeff: Union[complex,
 def evolve_tdvp_ps(ttns: TTNS, ttno: TTNO, coeff: Union[complex, float], tau: float):
     ttns.check_canonical()
     # second order 1-site projector splitting
-    ttne = TTNEnviron(ttns, ttno)
+    ttne = TTNEnviron(ttns, ttno, nworkers=ttns.evolve_config.environ_workers)
 
     # in MPS language: left to right sweep
     local_steps1 = _tdvp_ps_forward(ttns, ttno, ttne, coeff, tau / 2)
@@ -177,7 +241,7 @@ def _tdvp_ps_backward(ttns: TTNS, ttno: TTNO, ttne: TTNEnviron, coeff: Union[com
 def evolve_tdvp_ps2(ttns: TTNS, ttno: TTNO, coeff: Union[complex, float], tau: float):
     ttns.check_canonical()
     # second order 2-site projector splitting
-    tte = TTNEnviron(ttns, ttno)
+    tte = TTNEnviron(ttns, ttno, nworkers=ttns.evolve_config.environ_workers)
     # in MPS language: left to right sweep
     local_steps1 = _tdvp_ps2_recursion_forward(ttns.root, ttns, ttno, tte, coeff, tau / 2)
     # in MPS language: right to left sweep
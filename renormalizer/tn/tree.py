@@ -1,5 +1,7 @@
 from typing import List, Dict, Tuple, Union, Callable
 from numbers import Number
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
 
 import scipy
@@ -12,9 +14,11 @@ from renormalizer.mps.backend import np, backend, xp
 from renormalizer.mps.matrix import asnumpy, asxp_oe_args, tensordot
 from renormalizer.mps.svd_qn import add_outer, svd_qn, blockrecover, get_qn_mask
 from renormalizer.mps.lib import select_basis
-from renormalizer.mps.mps import normalize
+from renormalizer.mps.mps import normalize, _rdm_entropy
+from renormalizer.mps.parallel import parallel_executor, pmap
 from renormalizer.utils.configs import CompressConfig, OptimizeConfig, EvolveConfig, EvolveMethod
 from renormalizer.utils import calc_vn_entropy
+from renormalizer.utils.container import Container, dump_container, is_container
 from renormalizer.tn.node import TreeNodeTensor, TreeNodeBasis, copy_connection, TreeNodeEnviron
 from renormalizer.tn.treebase import Tree, BasisTree
 from renormalizer.tn.symbolic_mpo import construct_symbolic_mpo, symbolic_mo_to_numeric_mo_general
@@ -27,15 +31,24 @@ class TTNBase(Tree):
     # A tree whose tree node is TreeNodeTensor
 
     @classmethod
-    def load(cls, basis: BasisTree, fname: str, other_attrs=None):
-        npload = np.load(fname, allow_pickle=True)
-        assert npload["version"] == "0.1"
+    def load(cls, basis: BasisTree, fname: str, other_attrs=None, mmap: bool = True):
+        if other_attrs is None:
+            other_attrs = []
+        if is_container(fname):
+            npload = Container(fname, mmap=mmap)
+            version = npload.version
+        else:
+            npload = np.load(fname, allow_pickle=True)
+            version = npload["version"]
+        assert version in ["0.1", "0.2"]
 
         nsites = int(npload["nsites"])
         nodes = []
         for i in range(nsites):
             tensor = npload[f"tensor_{i}"]
-            qn = npload[f"qn_{i}"]
+            qn = npload[f"qn_{i}"] if f"qn_{i}" in npload else None
+            if version == "0.2" and qn is not None:
+                qn = qn.astype(int)
             nodes.append(TreeNodeTensor(tensor, qn))
         copy_connection(basis.node_list, nodes)
         instance = cls(basis, root=nodes[0])
@@ -48,11 +61,15 @@ class TTNBase(Tree):
         super().__init__(root)
 
     def dump(self, fname: str, other_attrs=None):
+        """
+        Dump the tree to ``fname`` in a binary container
+        (see :mod:`renormalizer.utils.container`)
+        so that :meth:`load` can memory-map the node tensors without copying.
+        """
         if other_attrs is None:
             other_attrs = []
 
         data_dict = {
-            "version": "0.1",
             "nsites": len(self),
         }
 
@@ -60,11 +77,12 @@ class TTNBase(Tree):
             data_dict[attr] = getattr(self, attr)
 
         for i, node in enumerate(self.node_list):
-            data_dict[f"tensor_{i}"] = node.tensor
-            data_dict[f"qn_{i}"] = node.qn
+            data_dict[f"tensor_{i}"] = asnumpy(node.tensor)
+            if node.qn is not None and node.qn.dtype != object:
+                data_dict[f"qn_{i}"] = node.qn.astype(np.int32)
 
         try:
-            np.savez(fname, **data_dict)
+            dump_container(fname, data_dict, version="0.2")
         except Exception:
             logger.exception(f"Dump MP failed.")
 
@@ -326,11 +344,11 @@ EVOLVE_METHODS = {}
 
 class TTNS(TTNBase):
     @classmethod
-    def load(cls, basis: BasisTree, fname: str, other_attrs=None):
+    def load(cls, basis: BasisTree, fname: str, other_attrs=None, mmap: bool = True):
         if other_attrs is None:
             other_attrs = []
         other_attrs = other_attrs + ["coeff"]
-        return super().load(basis, fname, other_attrs)
+        return super().load(basis, fname, other_attrs, mmap)
 
     @classmethod
     def random(cls, basis: BasisTree, qntot, m_max, percent=1.0):
@@ -544,7 +562,7 @@ class TTNS(TTNBase):
         else:
             return complex(val)
 
-    def expectation(self, ttno: TTNO, bra: "TTNS" = None) -> Number:
+    def expectation(self, ttno: TTNO, bra: "TTNS" = None, nworkers: int = None) -> Number:
         """
         Calculate the expectation value of <bra|TTNO|self>.
 
@@ -554,6 +572,9 @@ class TTNS(TTNBase):
             The operator for expectation
         bra: TTNS
             The bra state in TTNS format. Defaults to None and the bra is the same as self.
+        nworkers: int
+            Number of threads to contract the independent subtrees in parallel.
+            Defaults to None and the contraction is serial.
 
         Returns
         -------
@@ -575,7 +596,8 @@ class TTNS(TTNBase):
         ttns_extended = TTNS(basis_tree_ttns, root=snode)
         ttno_extended = TTNO(basis_tree_ttno, [], root=onode)
         environ = TTNEnviron(ttns_extended, ttno_extended, build_environ=False)
-        environ.build_children_environ(ttns_extended, ttno_extended)
+        with parallel_executor(nworkers) as executor:
+            environ.build_children_environ(ttns_extended, ttno_extended, executor)
         val = environ.root.environ_children[0].ravel()[0]
 
         for node in [self.basis.root, self.root, ttno.root]:
@@ -586,6 +608,83 @@ class TTNS(TTNBase):
         else:
             return complex(val)
 
+    def calc_rdm(self, basis_sets: List[BasisSet]) -> np.ndarray:
+        r"""
+        Calculate the reduced density matrix of the basis sets
+        :math:`\rho = \textrm{Tr}_{\textrm{others}} | \Psi \rangle \langle \Psi |`.
+
+        The TTNS should be canonical with the canonical center at the root.
+        The subtrees off the paths from the basis sets to the root are isometries
+        and are contracted to identity, so only the nodes on the paths are involved.
+
+        Parameters
+        ----------
+        basis_sets: List[BasisSet]
+            The basis sets of the density matrix.
+
+        Returns
+        -------
+        The density matrix with shape ``(d, d)``, where ``d`` is the product of the
+        dimensions of the basis sets in the order of ``basis_sets``.
+        """
+        dofs2node = {str(dofs): node for node in self.node_list for dofs in self.tn2dofs[node]}
+        target_dofs = [str(b.dofs) for b in basis_sets]
+        path = set()
+        for dofs in target_dofs:
+            node = dofs2node[dofs]
+            while node is not None and node not in path:
+                path.add(node)
+                node = node.parent
+
+        args = []
+        for node in self.node_list:
+            if node not in path:
+                continue
+            ket_indices = self.get_node_indices(node)
+            bra_indices = self.get_node_indices(node, conj=True)
+            for ichild, child in enumerate(node.children):
+                if child not in path:
+                    bra_indices[ichild] = ket_indices[ichild]
+            nchildren = len(node.children)
+            for i, dofs in enumerate(self.tn2dofs[node]):
+                if str(dofs) not in target_dofs:
+                    bra_indices[nchildren + i] = ket_indices[nchildren + i]
+            if node.parent is None:
+                bra_indices[-1] = ket_indices[-1]
+            args.extend([node.tensor, ket_indices, node.tensor.conj(), bra_indices])
+        output_indices = [("down", dofs) for dofs in target_dofs] + [("up", dofs) for dofs in target_dofs]
+        args.append(output_indices)
+        rdm = asnumpy(oe.contract(*asxp_oe_args(args)))
+        dim = int(np.prod(rdm.shape[: len(basis_sets)]))
+        rdm = rdm.reshape(dim, dim)
+        return rdm / np.trace(rdm)
+
+    def calc_2site_mutual_entropy(self) -> np.ndarray:
+        r"""
+        Calculate mutual entropy between two basis sets
+        :math:`m_{ij} = (s_i + s_j - s_{ij})/2`, as :meth:`renormalizer.mps.Mps.calc_2site_mutual_entropy`.
+
+        Returns
+        -------
+        mutual_entropy : 2d np.ndarry
+            mutual entropy with shape (nbasis, nbasis). The basis sets are
+            the basis sets of the TTNS other than :class:`~renormalizer.model.basis.BasisDummy`
+            in the order of ``self.basis.basis_list``.
+        """
+        ttns = self if self.is_canonical() else self.copy().canonicalise()
+        basis_list = [b for b in ttns.basis.basis_list if not isinstance(b, BasisDummy)]
+        nbasis = len(basis_list)
+        rdm_1site = {i: ttns.calc_rdm([b]) for i, b in enumerate(basis_list)}
+        rdm_2site = {}
+        for i, j in itertools.combinations(range(nbasis), 2):
+            rdm_2site[(i, j)] = ttns.calc_rdm([basis_list[i], basis_list[j]])
+        entropy_1site = _rdm_entropy(rdm_1site)
+        mut_entropy = np.zeros((nbasis, nbasis))
+        for (i, j), entropy in _rdm_entropy(rdm_2site).items():
+            mut_entropy[i, j] = (entropy_1site[i] + entropy_1site[j] - entropy) / 2
+        mut_entropy += mut_entropy.T
+        return mut_entropy
+
     def add(self, other: "TTNS") -> "TTNS":
         """
         Add two TTNSs.
@@ -1080,7 +1179,23 @@ class TTNS(TTNBase):
 
 
 class TTNEnviron(Tree):
-    def __init__(self, ttns: TTNS, ttno: TTNO, build_environ=True):
+    def __init__(self, ttns: TTNS, ttno: TTNO, build_environ=True, nworkers: int = None):
+        """
+        Construct the environments of ``<ttns|ttno|ttns>``.
+
+        Parameters
+        ----------
+        ttns: TTNS
+            The state.
+        ttno: TTNO
+            The operator.
+        build_environ: bool
+            Whether to build the environments of all nodes.
+        nworkers: int
+            Number of threads to build the environments. The environments of the nodes at the same
+            level of the tree are independent and are built in parallel.
+            ``None`` for the serial construction.
+        """
         self.basis_ttns = ttns.basis
         self.basis_ttno = ttno.basis
         enodes: List[TreeNodeEnviron] = [TreeNodeEnviron() for _ in range(ttns.size)]
@@ -1088,27 +1203,32 @@ class TTNEnviron(Tree):
         super().__init__(enodes[0])
         assert self.root.parent is None
         self.root.environ_parent = np.array([1], dtype=backend.real_dtype).reshape([1, 1, 1])
+        # the slots are filled in arbitrary order if the environments are built in parallel
+        for enode in self.node_list:
+            enode.environ_children = [None] * len(enode.children)
         # tensor node to basis node. todo: remove duplication?
         self.tn2dofs_ttns = {tn: bn.dofs for tn, bn in zip(self.node_list, self.basis_ttns.node_list)}
         self.tn2dofs_ttno = {tn: bn.dofs for tn, bn in zip(self.node_list, self.basis_ttno.node_list)}
+        self.nworkers = nworkers
         if build_environ:
-            self.build_children_environ(ttns, ttno)
-            self.build_parent_environ(ttns, ttno)
+            with parallel_executor(nworkers) as executor:
+                self.build_children_environ(ttns, ttno, executor)
+                self.build_parent_environ(ttns, ttno, executor)
 
-    def build_children_environ(self, ttns, ttno):
+    def build_children_environ(self, ttns, ttno, executor: ThreadPoolExecutor = None):
         # first run, children environment to the parent.
         # set enode.environ_children
-        snodes: List[TreeNodeTensor] = ttns.postorder_list()
-        for snode in snodes:
-            self.build_children_environ_node(snode, ttns, ttno)
+        # the nodes at the same height are independent
+        for snodes in ttns.postorder_levels():
+            pmap(executor, lambda snode: self.build_children_environ_node(snode, ttns, ttno), snodes)
 
-    def build_parent_environ(self, ttns, ttno):
+    def build_parent_environ(self, ttns, ttno, executor: ThreadPoolExecutor = None):
         # second run, parent environment to children
         # set enode.environ_parent
-        snodes: List[TreeNodeTensor] = ttns.node_list
-        for snode in snodes:
-            for ichild in range(len(snode.children)):
-                self.build_parent_environ_node(snode, ichild, ttns, ttno)
+        # the bonds to the children of the nodes at the same depth are independent
+        for snodes in ttns.preorder_levels():
+            tasks = [(snode, ichild) for snode in snodes for ichild in range(len(snode.children))]
+            pmap(executor, lambda task: self.build_parent_environ_node(*task, ttns, ttno), tasks)
 
     def update_1bond(self, snode: TreeNodeTensor, ttns: TTNS, ttno: TTNO):
         # update environ for the bond between snode and snode.parent
@@ -1154,13 +1274,7 @@ class TTNEnviron(Tree):
         indices = self.get_parent_indices(enode, ttns, ttno)
         args.append(indices)
         res = oe.contract(*asxp_oe_args(args))
-        if len(enode.parent.environ_children) != len(enode.parent.children):
-            # first run
-            enode.parent.environ_children.append(asnumpy(res))
-        else:
-            # updating
-            ichild = snode.parent.children.index(snode)
-            enode.parent.environ_children[ichild] = asnumpy(res)
+        enode.parent.environ_children[snode.idx_as_child] = asnumpy(res)
 
     def build_parent_environ_node(self, snode: TreeNodeTensor, ichild: int, ttns: TTNS, ttno: TTNO):
         # build the environment from snode to the ith child of snode and store the environment in the child
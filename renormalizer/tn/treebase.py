@@ -1,5 +1,6 @@
 from itertools import chain
-from typing import List, Sequence
+from typing import List, Sequence, Dict
+import logging
 
 import numpy as np
 from print_tree import print_tree
@@ -9,6 +10,9 @@ from renormalizer.model.basis import BasisSet, BasisDummy
 from renormalizer.tn.node import NodeUnion, TreeNodeBasis, copy_connection
 
 
+logger = logging.getLogger(__name__)
+
+
 class Tree:
     def __init__(self, root: NodeUnion):
         assert root.parent is None
@@ -42,6 +46,33 @@ class Tree:
 
         return recursion(self.root)
 
+    def postorder_levels(self) -> List[List[NodeUnion]]:
+        """
+        Nodes grouped by their height, i.e., the distance to the farthest leaf.
+        The children of the nodes in a group are all in the previous groups,
+        so the nodes in a group can be processed independently in the postorder traversal.
+        """
+        height = {}
+        for node in self.postorder_list():
+            height[node] = max([height[child] + 1 for child in node.children], default=0)
+        levels = [[] for _ in range(height[self.root] + 1)]
+        for node in self.node_list:
+            levels[height[node]].append(node)
+        return levels
+
+    def preorder_levels(self) -> List[List[NodeUnion]]:
+        """
+        Nodes grouped by their depth, i.e., the distance to the root.
+        The parents of the nodes in a group are all in the previous groups,
+        so the nodes in a group can be processed independently in the preorder traversal.
+        """
+        levels = [[self.root]]
+        while True:
+            next_level = list(chain(*[node.children for node in levels[-1]]))
+            if not next_level:
+                return levels
+            levels.append(next_level)
+
     @property
     def size(self):
         return len(self.node_list)
@@ -189,6 +220,97 @@ class BasisTree(Tree):
             recursion(root, partition)
         return cls(root)
 
+    @classmethod
+    def from_mutual_info(
+        cls,
+        basis_list: List[BasisSet],
+        mutual_info: np.ndarray,
+        tree_order: int = 2,
+        contract_primitive: bool = False,
+        dummy_label="MI virtual",
+    ):
+        r"""
+        Construct an MCTDH-like tree by hierarchical clustering of the basis sets
+        based on the mutual information between them.
+
+        The mutual information between two basis sets roughly measures the entanglement
+        that a bond separating them has to carry. Starting from each basis set as a cluster,
+        the ``tree_order`` clusters with the largest average mutual information are repeatedly
+        grouped under a new virtual node, so that strongly correlated basis sets are close in the tree
+        and the mutual information across the bonds, and thus the required bond dimension, is small.
+        The mutual information could be obtained from a cheap calculation with small bond dimension
+        by :meth:`renormalizer.mps.Mps.calc_2site_mutual_entropy`
+        or :meth:`renormalizer.tn.TTNS.calc_2site_mutual_entropy`.
+
+        Parameters
+        ----------
+        basis_list: List[BasisSet]
+            The basis sets.
+        mutual_info: np.ndarray
+            The mutual information matrix with shape ``(len(basis_list), len(basis_list))``.
+        tree_order: int
+            The maximum number of children of the virtual nodes.
+        contract_primitive: bool
+            Whether to use a 2-index tensor for each basis set as :meth:`general_mctdh`.
+            If ``False``, the basis sets grouped together are put in one leaf node.
+        dummy_label:
+            The label of the virtual nodes.
+
+        Returns
+        -------
+        The new basis tree
+        """
+        nbasis = len(basis_list)
+        assert nbasis > 1 and tree_order > 1
+        mutual_info = np.asarray(mutual_info, dtype=float)
+        assert mutual_info.shape == (nbasis, nbasis)
+
+        # active clusters. Each of them is either a basis set (primitive) or a node
+        clusters: List = list(basis_list)
+        sizes = np.ones(nbasis)
+        # total mutual information between the clusters
+        link = mutual_info.copy()
+        np.fill_diagonal(link, 0)
+
+        def average_link(group, candidates):
+            return link[group].sum(axis=0)[candidates] / (sizes[group].sum() * sizes[candidates])
+
+        dummy_i = 0
+        while len(clusters) > 1:
+            average = link / np.outer(sizes, sizes)
+            np.fill_diagonal(average, -np.inf)
+            group = [int(i) for i in np.unravel_index(np.argmax(average), average.shape)]
+            while len(group) < min(tree_order, len(clusters)):
+                candidates = [i for i in range(len(clusters)) if i not in group]
+                group.append(candidates[int(np.argmax(average_link(group, candidates)))])
+            group.sort()
+
+            members = [clusters[i] for i in group]
+            if not contract_primitive and all(isinstance(m, BasisSet) for m in members):
+                node = TreeNodeBasis(members)
+            else:
+                node = TreeNodeBasis([BasisDummy((dummy_label, dummy_i))])
+                dummy_i += 1
+                for m in members:
+                    node.add_child(TreeNodeBasis([m]) if isinstance(m, BasisSet) else m)
+
+            # merge the group to the first cluster of the group
+            rest = [i for i in range(len(clusters)) if i not in group[1:]]
+            link[group[0]] = link[group].sum(axis=0)
+            link[:, group[0]] = link[group[0]]
+            link[group[0], group[0]] = 0
+            sizes[group[0]] = sizes[group].sum()
+            clusters[group[0]] = node
+            clusters = [clusters[i] for i in rest]
+            link = link[np.ix_(rest, rest)]
+            sizes = sizes[rest]
+
+        root = clusters[0]
+        if not isinstance(root.basis_sets[0], BasisDummy):
+            # all basis sets are in one leaf. Make sure the root is a virtual node as in ``general_mctdh``
+            root = TreeNodeBasis([BasisDummy((dummy_label, dummy_i))]).add_child(root)
+        return cls(root)
+
     def __init__(self, root: TreeNodeBasis):
         super().__init__(root)
         for node in self.node_list:
@@ -227,6 +349,69 @@ class BasisTree(Tree):
     def pbond_dims(self) -> List[List[int]]:
         return [b.pbond_dims for b in self.node_list]
 
+    def estimate_cost(self, basis_list: List[BasisSet], mutual_info: np.ndarray, m_max: int = None) -> List[Dict]:
+        r"""
+        Estimate the bond dimension and the computational cost of each node
+        from the mutual information between the basis sets.
+
+        The entanglement entropy across the bond between a node and its parent is estimated by
+        the total mutual information :math:`S \approx \sum_{i \in A, j \notin A} m_{ij}` between
+        the basis sets in the subtree :math:`A` of the node and the other basis sets,
+        and the bond dimension by :math:`M = \lceil e^S \rceil`, bounded by ``m_max`` and
+        the dimension of the smaller side. The cost of a node is estimated by the size of its tensor
+        times the largest bond dimension of the node, which is the scaling of the local matrix-vector product.
+
+        Parameters
+        ----------
+        basis_list: List[BasisSet]
+            The basis sets in the same order as ``mutual_info``.
+        mutual_info: np.ndarray
+            The mutual information matrix with shape ``(len(basis_list), len(basis_list))``.
+        m_max: int
+            The maximum bond dimension. Defaults to ``None``, which means no limit.
+
+        Returns
+        -------
+        A list of dictionary for each node in ``self.node_list`` with keys
+        ``"dofs"``, ``"bond_dim"`` (to the parent), ``"size"`` and ``"cost"``.
+        """
+        dofs2idx = {str(b.dofs): i for i, b in enumerate(basis_list)}
+        mutual_info = np.asarray(mutual_info, dtype=float)
+        # in logarithm to avoid overflow
+        log_dims = np.log([b.nbas for b in basis_list])
+
+        # the indices of the basis sets in the subtree
+        subtree_idx = {}
+        for node in self.postorder_list():
+            idx = [dofs2idx[str(b.dofs)] for b in node.basis_sets if str(b.dofs) in dofs2idx]
+            for child in node.children:
+                idx.extend(subtree_idx[child])
+            subtree_idx[node] = idx
+
+        bond_dims = {}
+        for node in self.node_list:
+            if node.parent is None:
+                bond_dims[node] = 1
+                continue
+            inside = subtree_idx[node]
+            outside = np.setdiff1d(np.arange(len(basis_list)), inside)
+            entropy = mutual_info[np.ix_(inside, outside)].sum()
+            max_dim = np.round(np.exp(min(log_dims[inside].sum(), log_dims[outside].sum())))
+            m = min(np.ceil(np.exp(entropy)), max_dim)
+            if m_max is not None:
+                m = min(m, m_max)
+            bond_dims[node] = int(max(m, 1))
+
+        ret = []
+        for node in self.node_list:
+            bonds = [bond_dims[child] for child in node.children] + [bond_dims[node]]
+            size = np.prod(bonds + node.pbond_dims, dtype=float)
+            cost = size * max(bonds)
+            ret.append({"dofs": node.dofs, "bond_dim": bond_dims[node], "size": size, "cost": cost})
+            logger.info(f"node {node.dofs}: bond dim {bond_dims[node]}, size {size:g}, cost {cost:g}")
+        logger.info(f"Total estimated cost: {sum(r['cost'] for r in ret):g}")
+        return ret
+
     def add_auxiliary_space(self, auxiliary_label="Q") -> "BasisTree":
         # make a new basis tree with auxiliary basis
         node2_list = []
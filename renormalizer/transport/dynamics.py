@@ -85,6 +85,11 @@ class ChargeDiffusionDynamics(TdMpsJob):
 
     """
 
+    dump_series_keys = {
+        "r square array", "electron occupations array", "phonon occupations array", "k occupations array",
+        "eph entropy", "bond entropy", "coherent length array", "reduced density matrices", "time series",
+    }
+
     def __init__(
         self,
         model: HolsteinModel,
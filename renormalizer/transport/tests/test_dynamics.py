@@ -11,6 +11,7 @@ from renormalizer.mps import Mps, Mpo, ThermalProp, MpDm
 from renormalizer.mps.gs import optimize_mps
 from renormalizer.transport import ChargeDiffusionDynamics
 from renormalizer.utils import Quantity
+from renormalizer.utils.tdmps import IncrementalDump, load_incremental_dump
 from renormalizer.utils import (
     BondDimDistri,
     CompressCriteria,
@@ -143,6 +144,70 @@ def test_evolve(
     os.remove("test.npz")
 
 
+def test_incremental_dump(tmp_path):
+    ct = ChargeDiffusionDynamics(band_limit_model, stop_at_edge=False)
+    ct.dump_dir = str(tmp_path)
+    ct.job_name = "test"
+    ct.dump_format = "incremental"
+    ct.evolve(2, 5)
+    d1 = ct.get_dump_dict()
+    d2 = load_incremental_dump(os.path.join(ct.dump_dir, "test.inc"))
+    assert set(d1.keys()) == set(d2.keys())
+    for key in ["time series", "electron occupations array", "r square array", "bond entropy"]:
+        assert np.allclose(d1[key], d2[key])
+    assert d2["total time"] == pytest.approx(d1["total time"])
+
+    # a partially written step at the end is ignored
+    with open(os.path.join(ct.dump_dir, "test.inc", "0.bin"), "ab") as f:
+        f.write(b"\x00")
+    assert len(load_incremental_dump(os.path.join(ct.dump_dir, "test.inc"))["time series"]) == 6
+
+
+def test_incremental_dump_series_to_static(tmp_path):
+    path = str(tmp_path / "test.inc")
+    dump = IncrementalDump(path)
+    # "x" has the length of the time steps by chance at the first step
+    dump.write({"time series": [0.0], "x": [1.0]}, 1)
+    assert set(dump.meta) == {"time series", "x"}
+    dump.write({"time series": [0.0, 1.0], "x": [1.0]}, 2)
+    assert set(dump.meta) == {"time series"}
+    dump.write({"time series": [0.0, 1.0, 2.0], "x": [1.0]}, 3)
+    d = load_incremental_dump(path)
+    assert np.allclose(d["time series"], [0, 1, 2])
+    assert np.allclose(d["x"], [1])
+    assert len(os.listdir(path)) == 3
+
+    # with the declared series, "x" is never a series
+    path = str(tmp_path / "test2.inc")
+    dump = IncrementalDump(path)
+    dump.write({"time series": [0.0], "x": [1.0]}, 1, series_keys={"time series"})
+    assert set(dump.meta) == {"time series"}
+
+
+def test_checkpoint(tmp_path):
+    evolve_config = EvolveConfig(EvolveMethod.tdvp_ps, adaptive=True, guess_dt=0.5)
+    ct1 = ChargeDiffusionDynamics(band_limit_model, stop_at_edge=False, evolve_config=evolve_config)
+    ct1.evolve(2, 6)
+
+    ct2 = ChargeDiffusionDynamics(band_limit_model, stop_at_edge=False, evolve_config=evolve_config)
+    ct2.dump_dir = str(tmp_path)
+    ct2.job_name = "test"
+    ct2.dump_format = "incremental"
+    ct2.checkpoint_interval = 0
+    ct2.evolve(2, 4)
+    assert os.path.exists(ct2.checkpoint_path)
+    # steps after the checkpoint are lost
+    ct2.checkpoint_interval = None
+    ct2.evolve(2, 1)
+
+    ct3 = ChargeDiffusionDynamics.resume(ct2.checkpoint_path)
+    assert len(ct3.evolve_times) == 5
+    ct3.evolve(2, 2)
+    assert ct1.is_similar(ct3, rtol=1e-5)
+    d = load_incremental_dump(os.path.join(ct3.dump_dir, "test.inc"))
+    assert np.allclose(d["r square array"], ct1.r_square_array, rtol=1e-5)
+
+
 @pytest.mark.parametrize(
     "mol_num, j_constant_value, elocalex_value, ph_info, ph_phys_dim, evolve_dt, nsteps",
     ([3, 1, 3.87e-3, [[1e-5, 1e-5]], 2, 2, 50],),
@@ -123,6 +123,14 @@ class CompressConfig:
 
     dump_matrix_dir : str, optional
         The directory to dump matrix when matrix is larger than ``dump_matrix_size``.
+        Also used as the directory for environment tensors spilled because of ``environ_memory_limit``.
+
+    environ_memory_limit : int, float or str, optional
+        The memory budget of the environment tensors (``renormalizer.mps.lib.Environ``)
+        built for the MPS, such as ``"4 GB"``. See `parse_memory_limit` for the accepted formats.
+        Once exceeded, the least recently used environment tensors are moved to memory-mapped files
+        in ``dump_matrix_dir`` and the next tensor in the sweep direction is prefetched asynchronously.
+        The default value is ``None``, which means no limit.
 
     ofs : `OFS`, optional
         Whether optimize the DOF ordering by OFS. The default value is ``None`` which means does not perform OFS.
@@ -132,6 +140,14 @@ class CompressConfig:
         for and only for ab initio Hamiltonian constructed by the experimental
         ``renormalizer.model.h_qc.qc_model``. Default is ``False``.
 
+    subspace_expansion : float, optional
+        The weight of the subspace expansion in one-site TDVP (``EvolveMethod.tdvp_ps``).
+        If set, the renormalized basis is enlarged by the Hamiltonian applied to the state
+        (projected onto the environment) during the sweep and then truncated according to this config,
+        so that the bond dimension grows where entanglement appears.
+        The weight is relative to the norm of the state and a typical value is :math:`10^{-4}`.
+        The default value is ``None``, which means the bond dimension is fixed in one-site TDVP.
+
     See Also
     --------
     CompressCriteria : Compression criteria
@@ -151,8 +167,10 @@ class CompressConfig:
         vguess_m = (5,5),
         dump_matrix_size = np.inf,
         dump_matrix_dir = "./",
+        environ_memory_limit = None,
         ofs: OFS = None,
-        ofs_swap_jw: bool = False
+        ofs_swap_jw: bool = False,
+        subspace_expansion: float = None,
     ):
         # two sets of criteria here: threshold and max_bonddimension
         # `criteria` is to determine which to use
@@ -183,10 +201,14 @@ class CompressConfig:
 
         self.dump_matrix_size = dump_matrix_size
         self.dump_matrix_dir = dump_matrix_dir
+        self.environ_memory_limit = environ_memory_limit
 
         self.ofs: OFS = ofs
         self.ofs_swap_jw: bool = ofs_swap_jw
 
+        # subspace expansion in one-site TDVP
+        self.subspace_expansion: float = subspace_expansion
+
     @property
     def threshold(self):
         return self._threshold
@@ -327,6 +349,29 @@ class OptimizeConfig:
         # inverse = 1.0 or -1.0
         # -1.0 to get the largest eigenvalue
         self.inverse = 1.0
+        # using a background thread, overlap the environment update of the optimized site
+        # with the preparation of the next local problem (quantum numbers and initial guess),
+        # and the fetch of the environment of the next site with the local solver
+        self.pipeline = False
+        # maximum number of vectors in a block to apply the local Hamiltonian at once
+        # in multi-root Davidson and block PRIMME methods. Larger block is more efficient
+        # while requires more memory for the intermediates
+        self.hop_batch_size = 16
+        # number of threads to evaluate the MPOs of a StackedMpo in parallel,
+        # including the environment updates and the matrix-vector products.
+        # ``None`` for sequential evaluation. The BLAS threads of the process are shared
+        # by the workers if `threadpoolctl` is installed
+        self.stacked_workers = None
+        # number of segments of the real-space parallel sweeps, see ``renormalizer.mps.parallel``.
+        # ``None`` for the sequential sweeps. Only for the two-site algorithm with a single root.
+        # For TTNS, the number of subtrees of the root that are optimized in parallel
+        self.parallel_segments = None
+        # number of threads to build the environments of the independent subtrees of a TTNS in parallel.
+        # ``None`` for the serial construction
+        self.environ_workers = None
+        # build and store the environments of the sequential MPS sweeps in the block-sparse format,
+        # see ``renormalizer.mps.lib.Environ``. Only for a single MPO without ``omega``
+        self.block_sparse_environ = False
 
     def copy(self):
         new = self.__class__.__new__(self.__class__)
@@ -402,6 +447,9 @@ class EvolveConfig:
 
         self.guess_dt: complex = guess_dt  # a guess of initial adaptive time step
         self.adaptive_rtol = adaptive_rtol
+        # error estimator of adaptive TDVP. "doubling": compare two half steps with one full step.
+        # "embedded": compare the step with a 1st-order single sweep step. Only for TDVP-PS and TDVP-PS2
+        self.adaptive_estimator: str = "doubling"
 
         self.tdvp_cmf_midpoint = True
         self.tdvp_cmf_c_trapz = False
@@ -411,11 +459,22 @@ class EvolveConfig:
         self.ivp_rtol: float = ivp_rtol
         self.ivp_atol: float = ivp_atol
         self.ivp_solver : str = ivp_solver
+        # tolerance of the relative error of the krylov solver.
+        # ``None``: converged when the successive results are close, see ``expm_krylov``
+        self.krylov_tol: float = None
+        # maximum dimension of the krylov subspace. If not enough, the time step is split into sub-steps
+        self.krylov_max_dim: int = None
         # the EOM has already considered the non-orthogonality of the left and right
         # renormalized basis, see arXiv:1907.12044
         self.force_ovlp: bool = force_ovlp
         # auto switch between mu_vmf and vmf for a higher efficiency
         self.vmf_auto_switch: bool = True
+        # number of segments of the real-space parallel sweeps in TDVP-PS2, see ``renormalizer.mps.parallel``.
+        # ``None`` for the sequential sweeps
+        self.parallel_segments: int = None
+        # number of threads to build the environments of the independent subtrees of a TTNS in parallel.
+        # ``None`` for the serial construction
+        self.environ_workers: int = None
 
     @property
     def is_tdvp(self):
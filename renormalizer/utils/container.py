@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+A simple versioned binary container for named arrays.
+
+Compared with ``.npz``, every array is stored uncompressed and contiguously
+at an aligned offset, so that it can be memory-mapped without copying and
+any array can be read without touching the others.
+No pickling is involved so only numerical (and boolean) arrays are supported.
+
+The layout of the file is
+
+- magic bytes ``b"RNZTC"`` and a ``uint8`` format version
+- ``uint64`` length of the header in little endian
+- JSON header: the user ``version`` string and the ``dtype``, ``shape`` and ``offset`` of each array
+- array data, each aligned to :data:`ALIGNMENT` bytes
+"""
+
+import json
+import os
+import struct
+from typing import Dict
+
+import numpy as np
+
+# this file shouldn't import anything from the `mps` module. IOW it's mps agnostic
+
+MAGIC = b"RNZTC"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREFIX = struct.Struct("<5sBQ")
+
+
+def _align(n: int) -> int:
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def dump_container(fname: str, arrays: Dict[str, np.ndarray], version: str):
+    """
+    Dump the arrays to ``fname``. The file is written to a temporary file first
+    and then moved to ``fname``, so that an existing file is never corrupted,
+    and it is safe to overwrite a file that is memory-mapped.
+
+    Parameters
+    ----------
+    fname : str
+        The file name.
+    arrays : dict
+        Name to array mapping. Scalars are saved as 0-d arrays.
+    version : str
+        The version of the protocol of the content.
+    """
+    arrays = {k: np.asarray(v) for k, v in arrays.items()}
+    header = {"version": version, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        if array.dtype == object:
+            raise TypeError(f"Object array {name} is not supported")
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_fname, fname)
+
+
+def is_container(fname: str) -> bool:
+    """
+    Whether ``fname`` is a container written by :func:`dump_container`.
+    """
+    with open(fname, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class Container:
+    """
+    Read-only view of a container written by :func:`dump_container`.
+    Arrays are loaded lazily when accessed.
+
+    Parameters
+    ----------
+    fname : str
+        The file name.
+    mmap : bool
+        If ``True``, the arrays are memory-mapped in copy-on-write mode,
+        i.e., in-place modification of the array is not written back to the file.
+        Otherwise the arrays are read into memory.
+    """
+
+    def __init__(self, fname: str, mmap: bool = True):
+        self.fname = fname
+        self.mmap = mmap
+        with open(fname, "rb") as f:
+            magic, format_version, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{fname} is not a valid container")
+            if format_version != FORMAT_VERSION:
+                raise ValueError(f"Unknown container format version: {format_version}")
+            header = json.loads(f.read(header_len).decode())
+        self.version: str = header["version"]
+        self._arrays: Dict = header["arrays"]
+        self._data_start = _align(_PREFIX.size + header_len)
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def keys(self):
+        return self._arrays.keys()
+
+    def __getitem__(self, name) -> np.ndarray:
+        info = self._arrays[name]
+        dtype = np.dtype(info["dtype"])
+        shape = tuple(info["shape"])
+        offset = self._data_start + info["offset"]
+        if self.mmap and 0 < dtype.itemsize * int(np.prod(shape)):
+            return np.asarray(np.memmap(self.fname, dtype=dtype, mode="c", offset=offset, shape=shape))
+        count = int(np.prod(shape))
+        with open(self.fname, "rb") as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=count).reshape(shape)
@@ -5,8 +5,9 @@
 
 import json
 import os
+import pickle
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import numpy as np
 
@@ -17,6 +18,10 @@ logger = logging.getLogger(__name__)
 
 
 class TdMpsJob(object):
+    # keys of ``get_dump_dict`` that are time series, i.e., have one row for each time step.
+    # Used by the incremental dump. ``None``: keys with the length of the time steps are time series.
+    dump_series_keys = None
+
     def __init__(self, evolve_config: EvolveConfig = None, dump_mps: str=None, dump_dir: str=None, job_name: str=None):
         logger.info(f"Creating TDMPS job. dump_dir: {dump_dir}. job_name: {job_name}")
         if evolve_config is None:
@@ -39,6 +44,15 @@ class TdMpsJob(object):
         self._dump_mps = None
         self.dump_dir = dump_dir
         self.job_name = job_name
+        # format of the dumped properties.
+        # "npz": rewrite ``{job_name}.npz`` from ``get_dump_dict`` at every step.
+        # "incremental": only append the rows of the new step to ``{job_name}.inc``.
+        # See :class:`IncrementalDump`
+        self.dump_format = "npz"
+        self._incremental_dump = None
+        # wall-clock interval (seconds or ``datetime.timedelta``) between two
+        # checkpoints during ``evolve``. None: no periodic checkpoint. See :meth:`checkpoint`
+        self.checkpoint_interval = None
         mps = self.init_mps()
         logger.info(f"Initial MPS: {str(mps)}")
         if mps is None:
@@ -111,6 +125,14 @@ class TdMpsJob(object):
 
         wall_times = [datetime.now()]
 
+        checkpoint_interval = self.checkpoint_interval
+        if checkpoint_interval is not None:
+            if not self._defined_output_path:
+                raise ValueError("Dump dir or job name not set for periodic checkpoint")
+            if not isinstance(checkpoint_interval, timedelta):
+                checkpoint_interval = timedelta(seconds=checkpoint_interval)
+        last_checkpoint_time = wall_times[0]
+
         for i in range(nsteps):
 
             if self.stop_evolve_criteria():
@@ -156,6 +178,14 @@ class TdMpsJob(object):
                 dump_wall_time = datetime.now()
                 logger.info(f"Dumping time cost {dump_wall_time - evolution_wall_time}")
 
+            # checkpoint
+            if checkpoint_interval is not None and checkpoint_interval <= datetime.now() - last_checkpoint_time:
+                try:
+                    self.checkpoint()
+                except IOError:  # never quit calculation because of IOError
+                    logger.exception("checkpoint failed with IOError")
+                last_checkpoint_time = datetime.now()
+
         logger.info(f"{len(wall_times)-1} steps of evolution complete!")
         logger.info(
             "Normal termination. Time cost: %s" % (wall_times[-1] - wall_times[0])
@@ -183,6 +213,26 @@ class TdMpsJob(object):
             raise ValueError("Dump dir or job name not set")
         d = self.get_dump_dict()
         os.makedirs(self.dump_dir, exist_ok=True)
+        if self.dump_format == "incremental":
+            if self._incremental_dump is None:
+                self._incremental_dump = IncrementalDump(os.path.join(self.dump_dir, self.job_name + ".inc"))
+            self._incremental_dump.write(d, len(self.evolve_times), self.dump_series_keys)
+        elif self.dump_format == "npz":
+            self._dump_npz(d)
+        else:
+            raise ValueError(f"dump_format should be 'npz' or 'incremental'. Got {self.dump_format}")
+
+        # dump_mps
+        if self._dump_mps is not None:
+            if self._dump_mps == "all":
+                mps_path = os.path.join(self.dump_dir,
+                        self.job_name+"_mps_"+str(len(self.evolve_times)-1) + ".npz")
+            else:
+                mps_path = os.path.join(self.dump_dir,
+                        self.job_name+"_mps" + ".npz")
+            self.latest_mps.dump(mps_path)
+
+    def _dump_npz(self, d):
         file_path = os.path.join(self.dump_dir, self.job_name + ".npz")
         bak_path = file_path + ".bak"
         if os.path.exists(file_path):
@@ -196,16 +246,48 @@ class TdMpsJob(object):
         if os.path.exists(bak_path):
             os.remove(bak_path)
 
-        # dump_mps
-        if self._dump_mps is not None:
-            if self._dump_mps == "all":
-                mps_path = os.path.join(self.dump_dir,
-                        self.job_name+"_mps_"+str(len(self.evolve_times)-1) + ".npz")
-            else:
-                mps_path = os.path.join(self.dump_dir,
-                        self.job_name+"_mps" + ".npz")
-            self.latest_mps.dump(mps_path)
-            
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.dump_dir, self.job_name + "_checkpoint.pkl")
+
+    def checkpoint(self, path: str=None):
+        """
+        Save the full state of the job, including ``evolve_times``, the calculated properties,
+        ``latest_mps`` and its compress/evolve configs (with the adaptive time step),
+        so that the evolution can be continued by :meth:`resume`.
+
+        Args:
+            path (str): the path of the checkpoint file. Defaults to :attr:`checkpoint_path`.
+        """
+        if path is None:
+            if not self._defined_output_path:
+                raise ValueError("Dump dir or job name not set")
+            os.makedirs(self.dump_dir, exist_ok=True)
+            path = self.checkpoint_path
+        logger.info(f"Checkpoint at step {len(self.evolve_times) - 1} to {path}")
+        # the old checkpoint is intact if shutdown while dumping
+        _atomic_write(path, lambda f: pickle.dump({"class": self.__class__, "state": self.__dict__}, f,
+                                                  protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def resume(cls, path: str):
+        """
+        Restore a job from the checkpoint file written by :meth:`checkpoint`.
+        Call :meth:`evolve` on the returned job to continue the evolution, with ``nsteps``
+        being the number of remaining steps.
+
+        Args:
+            path (str): the path of the checkpoint file.
+        """
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+        if not issubclass(checkpoint["class"], cls):
+            raise ValueError(f"The checkpoint is for {checkpoint['class'].__name__}, not {cls.__name__}")
+        job = checkpoint["class"].__new__(checkpoint["class"])
+        job.__dict__.update(checkpoint["state"])
+        logger.info(f"Resumed {job.__class__.__name__} at step {len(job.evolve_times) - 1}, "
+                    f"time {job.latest_evolve_time}")
+        return job
 
     def stop_evolve_criteria(self):
         return False
@@ -221,3 +303,145 @@ class TdMpsJob(object):
     @property
     def _defined_output_path(self):
         return self.dump_dir is not None and self.job_name is not None
+
+
+class IncrementalDump:
+    r"""
+    Append-only store of the properties of a time evolution job.
+
+    Entries of the dump dict whose first dimension equals the number of time steps
+    (the time series, occupations, autocorrelation, entropies, etc.)
+    are regarded as growing series and only the new rows are appended to
+    a raw binary file at each step. If ``series_keys`` is provided to :meth:`write`,
+    only these entries are regarded as series.
+    All other entries (temperature, model, mobility, etc.) are small and
+    are rewritten at each step. An entry that was a series and is no longer a series
+    is removed from the series.
+
+    The layout of the directory is
+
+    - ``meta.json``: the dtype and the shape of a row of each series.
+    - ``{i}.bin``: the rows of the ``i`` th series in C order.
+    - ``static.npz``: entries that are not series.
+
+    ``meta.json`` and ``static.npz`` are replaced atomically and a partially written
+    row at the end of a ``.bin`` file is ignored by :func:`load_incremental_dump`,
+    so the store is readable during the run and after a crash.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # key -> {"file": str, "dtype": str, "row_shape": list}
+        self.meta = {}
+        # key -> number of rows written
+        self.nrows = {}
+        # number of the ``.bin`` files ever created
+        self.nfiles = 0
+
+    def write(self, d, nsteps: int, series_keys=None):
+        """
+        Write the dump dict at ``nsteps`` time steps.
+
+        Parameters
+        ----------
+        d : dict
+            The dump dict.
+        nsteps : int
+            The number of time steps.
+        series_keys : collection of str, optional
+            The keys of the time series. Defaults to ``None``, which means the entries
+            with ``nsteps`` rows are time series.
+        """
+        static = {}
+        meta_changed = False
+        removed_files = []
+        for key, value in d.items():
+            try:
+                array = np.asarray(value) if not isinstance(value, dict) else None
+            except ValueError:
+                # ragged
+                array = None
+            is_series = array is not None and array.dtype != object and array.ndim != 0 and len(array) == nsteps
+            if series_keys is not None:
+                empty = array is not None and array.ndim != 0 and len(array) == 0
+                if key in series_keys and not is_series and not empty:
+                    logger.warning(f"The time series {key} does not have {nsteps} rows. Dumped as a static entry")
+                is_series = is_series and key in series_keys
+            if not is_series:
+                static[key] = value
+                if key in self.meta:
+                    # no longer a series
+                    removed_files.append(self.meta.pop(key)["file"])
+                    del self.nrows[key]
+                    meta_changed = True
+                continue
+            info = {"dtype": array.dtype.str, "row_shape": list(array.shape[1:])}
+            old_info = self.meta.get(key)
+            if old_info is None or old_info["dtype"] != info["dtype"] \
+                    or old_info["row_shape"] != info["row_shape"] or nsteps < self.nrows[key]:
+                # new series or the layout is changed. Start over
+                if old_info is not None:
+                    info["file"] = old_info["file"]
+                else:
+                    info["file"] = f"{self.nfiles}.bin"
+                    self.nfiles += 1
+                self.meta[key] = info
+                self.nrows[key] = 0
+                mode = "wb"
+                meta_changed = True
+            else:
+                mode = "r+b"
+            with open(os.path.join(self.path, self.meta[key]["file"]), mode) as f:
+                # rows beyond ``nrows`` are possible if the job is resumed from an earlier checkpoint
+                f.seek(self.nrows[key] * array[0].nbytes)
+                f.write(np.ascontiguousarray(array[self.nrows[key]:]).tobytes())
+                f.truncate()
+            self.nrows[key] = nsteps
+
+        if meta_changed:
+            _atomic_write(os.path.join(self.path, "meta.json"), lambda f: f.write(json.dumps(self.meta).encode()))
+        _atomic_write(os.path.join(self.path, "static.npz"), lambda f: np.savez(f, **static))
+        # removed after ``meta.json`` is updated so that the store is always readable
+        for fname in removed_files:
+            try:
+                os.remove(os.path.join(self.path, fname))
+            except OSError:
+                logger.exception(f"Remove {fname} failed")
+
+
+def load_incremental_dump(path: str):
+    """
+    Load the dump dict written by :class:`IncrementalDump`.
+    The series are truncated to the number of completely written steps.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    series = {}
+    for key, info in meta.items():
+        dtype = np.dtype(info["dtype"])
+        row_shape = tuple(info["row_shape"])
+        data = np.fromfile(os.path.join(path, info["file"]), dtype=np.uint8)
+        row_bytes = dtype.itemsize * int(np.prod(row_shape))
+        nrows = len(data) // row_bytes if row_bytes != 0 else 0
+        series[key] = data[:nrows * row_bytes].view(dtype).reshape((nrows,) + row_shape)
+    # steps written completely for all series
+    nsteps = min([len(v) for v in series.values()], default=0)
+    res = {}
+    with np.load(os.path.join(path, "static.npz"), allow_pickle=True) as static:
+        for key in static.files:
+            res[key] = static[key]
+    for key, value in series.items():
+        res[key] = value[:nsteps]
+    return res
+
+
+def _atomic_write(path, write_func):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write_func(f)
+    os.replace(tmp_path, path)